@@ -0,0 +1,110 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+"""
+# This script checks that a `VectorBeliefState` can replace a `BeliefState`: the informs are listed in the
+# same order and ties between equally probable values are resolved the same way (first value set wins).
+# """
+
+import argparse
+import os
+import random
+import sys
+
+
+def get_root_dir():
+    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+sys.path.append(get_root_dir())
+
+from services.bst import HandcraftedBST
+from utils import UserAct, UserActionType
+from utils.beliefstate import BeliefState
+from utils.domain.jsonlookupdomain import JSONLookupDomain
+from utils.logger import DiasysLogger, LogLevel
+from utils.vectorbeliefstate import VectorBeliefState
+
+
+def listed_informs(beliefstate: BeliefState):
+    """ Returns the informs of the current turn as (slot, [(value, probability)]) in iteration order """
+    return [(slot, list(beliefstate['informs'][slot].items())) for slot in beliefstate['informs']]
+
+
+def check_ties(domain: JSONLookupDomain):
+    """ Two values with the same probability: the one set first wins, whatever their order in the ontology """
+    results = []
+    for beliefstate_cls in [BeliefState, VectorBeliefState]:
+        beliefstate = beliefstate_cls(domain)
+        beliefstate['informs']['applied_nlp'] = {'true': 1.0}
+        beliefstate['informs']['applied_nlp']['false'] = 1.0
+        assert list(beliefstate['informs']['applied_nlp']) == ['true', 'false'], \
+            f"{beliefstate_cls.__name__} lists {list(beliefstate['informs']['applied_nlp'])}"
+        results.append((beliefstate.get_most_probable_inf_beliefs(),
+                        beliefstate.get_most_probable_inf_beliefs(max_results=2),
+                        beliefstate.get_num_dbmatches()))
+    assert results[0] == results[1], f"BeliefState: {results[0]}, VectorBeliefState: {results[1]}"
+    assert results[0][0] == {'applied_nlp': 'true'}, f"the tie went to {results[0][0]}"
+    print(f"ties: both backends choose {results[0][0]} ({results[0][2][0]} matches)")
+
+
+def random_user_acts(domain: JSONLookupDomain, rng: random.Random):
+    """ Returns the acts of one user turn, repeated informs for a slot get the same score like in the NLU """
+    user_acts = []
+    for _ in range(rng.randint(1, 4)):
+        slot = rng.choice(sorted(domain.get_informable_slots()))
+        act_type = rng.choice([UserActionType.Inform] * 4 + [UserActionType.NegativeInform, UserActionType.Request])
+        value = rng.choice(list(domain.get_possible_values(slot)) + ['dontcare'])
+        user_acts.append(UserAct(act_type=act_type, slot=slot, value=value, score=1.0))
+    return user_acts
+
+
+def check_dialogs(domain: JSONLookupDomain, num_dialogs: int, seed: int):
+    """ The BST tracks the same random dialogs with both backends """
+    logger = DiasysLogger(console_log_lvl=LogLevel.NONE, file_log_lvl=LogLevel.NONE)
+    rng = random.Random(seed)
+    trackers = [HandcraftedBST(domain=domain, logger=logger),
+                HandcraftedBST(domain=domain, logger=logger, beliefstate_cls=VectorBeliefState)]
+    for dialog in range(num_dialogs):
+        for bst in trackers:
+            bst.dialog_start()
+        for turn in range(rng.randint(1, 6)):
+            user_acts = random_user_acts(domain, rng)
+            expected, actual = [bst.update_bst(user_acts=user_acts)['beliefstate'] for bst in trackers]
+            for max_results in [1, 3]:
+                assert expected.get_most_probable_inf_beliefs(max_results=max_results) == \
+                    actual.get_most_probable_inf_beliefs(max_results=max_results), \
+                    f"dialog {dialog}, turn {turn}: most probable beliefs differ"
+            assert listed_informs(expected) == listed_informs(actual), \
+                f"dialog {dialog}, turn {turn}: {listed_informs(expected)} != {listed_informs(actual)}"
+            assert expected['num_matches'] == actual['num_matches'], \
+                f"dialog {dialog}, turn {turn}: {expected['num_matches']} != {actual['num_matches']} matches"
+    print(f"dialogs: {num_dialogs} random dialogs tracked the same way by both backends")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--dialogs", default=200, type=int,
+                        help="number of random dialogs to compare")
+    parser.add_argument("-s", "--seed", default=0, type=int,
+                        help="seed of the random dialogs")
+    args = parser.parse_args()
+    courses = JSONLookupDomain('ImsCourses')
+    check_ties(courses)
+    check_dialogs(courses, args.dialogs, args.seed)
@@ -17,9 +17,11 @@
 #
 ###############################################################################
 
+import asyncio
 from typing import List, Dict
 
 from utils.domain.lookupdomain import LookupDomain
+from services.eventloop import run_blocking
 from services.service import PublishSubscribe, Service
 from utils import SysAct, SysActionType
 from utils.logger import DiasysLogger
@@ -43,7 +45,7 @@ class QaPolicy(Service):
         Service.__init__(self, domain=domain, debug_logger=logger)
 
     @PublishSubscribe(sub_topics=["user_acts"], pub_topics=["sys_acts"])
-    def generate_sys_acts(self, user_acts: List[UserAct] = None) -> dict(sys_acts=List[SysAct]):
+    async def generate_sys_acts(self, user_acts: List[UserAct] = None) -> dict(sys_acts=List[SysAct]):
         """Generates system acts by looking up answers to the given user question.
 
         Args:
@@ -75,7 +77,7 @@ class QaPolicy(Service):
             return { 'sys_acts': [SysAct(SysActionType.Bad)] }
 
         # currently, short answers are used for world knowledge
-        answers = self._get_short_answers(relation, topics, direction)
+        answers = await self._get_short_answers(relation, topics, direction)
 
         sys_acts = [SysAct(SysActionType.InformByName, slot_values=answer) for answer in answers]
 
@@ -83,16 +85,17 @@ class QaPolicy(Service):
             [str(sys_act) for sys_act in sys_acts]))
         return {'sys_acts': sys_acts}
 
-    def _get_short_answers(self, relation: str, topics: List[str], direction: str) \
+    async def _get_short_answers(self, relation: str, topics: List[str], direction: str) \
         -> dict(answer=str):
         """Looks up answers and only returns the answer string"""
         answers = []
-        for topic in topics:
-            triples = self.domain.find_entities({
-                'relation': relation,
-                'topic': topic,
-                'direction': direction
-            })
+        # send the knowledge base queries for all topics at once
+        results = await asyncio.gather(*[run_blocking(self.domain.find_entities, {
+            'relation': relation,
+            'topic': topic,
+            'direction': direction
+        }) for topic in topics])
+        for triples in results:
             for triple in triples:
                 if direction == 'in':
                     answers.append({'answer': triple['subject']})
@@ -0,0 +1,149 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+"""
+# This script checks that one `DialogSystem` keeps the dialog state of concurrent sessions apart.
+# Two users talk to the same BST and policy at the same time, their turns are interleaved;
+# afterwards each session must only know about the constraints of its own user.
+# """
+
+import argparse
+import os
+import sys
+import threading
+from queue import Empty, Queue
+
+
+def get_root_dir():
+    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+sys.path.append(get_root_dir())
+
+from services.bst import HandcraftedBST
+from services.policy import DQNPolicy, HandcraftedPolicy
+from services.service import DialogSystem, PublishSubscribe, Service
+from services.session import current_session
+from utils import SysAct, SysActionType, UserAct, UserActionType
+from utils.domain.jsonlookupdomain import JSONLookupDomain
+from utils.logger import DiasysLogger, LogLevel
+
+TIMEOUT = 10.0  # seconds to wait for each system turn
+
+
+class TurnRecorder(Service):
+    """ Hands the system acts and belief states of each session to the script, ends a session on `Bye` """
+
+    def __init__(self, domain: JSONLookupDomain):
+        Service.__init__(self, domain=domain)
+        self._lock = threading.Lock()
+        self._turns = {}  # session -> queue of (sys_act, beliefstate)
+
+    def turns(self, session: str) -> Queue:
+        with self._lock:
+            return self._turns.setdefault(session, Queue())
+
+    @PublishSubscribe(sub_topics=["beliefstate", "sys_act"], pub_topics=["dialog_end"])
+    def record_turn(self, beliefstate=None, sys_act: SysAct = None):
+        # called once both messages of a turn arrived
+        self.turns(current_session()).put((sys_act, beliefstate))
+        if sys_act.type == SysActionType.Bye:
+            return {"dialog_end": True}
+
+
+def next_turn(recorder: TurnRecorder, session: str):
+    """ Returns the next system act of a session and the belief state it was chosen for """
+    try:
+        return recorder.turns(session).get(timeout=TIMEOUT)
+    except Empty:
+        raise AssertionError(f"no system turn within {TIMEOUT}s")
+
+
+def check(policy_name: str, transport: str, listener_mode: str):
+    logger = DiasysLogger(console_log_lvl=LogLevel.NONE, file_log_lvl=LogLevel.NONE)
+    domain = JSONLookupDomain('ImsLecturers')
+    bst = HandcraftedBST(domain=domain, logger=logger)
+    if policy_name == 'dqn':
+        policy = DQNPolicy(domain=domain, logger=logger)  # untrained: only the dialog state is checked
+    else:
+        policy = HandcraftedPolicy(domain=domain, logger=logger)
+    recorder = TurnRecorder(domain)
+    ds = DialogSystem(services=[bst, policy, recorder], transport=transport, listener_mode=listener_mode,
+                      ack_timeout=TIMEOUT)
+    try:
+        check_sessions(ds, domain, policy, recorder)
+    finally:
+        ds.shutdown()
+    print(f"{policy_name} policy, {transport} transport, {listener_mode} listeners: "
+          f"interleaved sessions were kept apart")
+
+
+def check_sessions(ds: DialogSystem, domain: JSONLookupDomain, policy: Service, recorder: TurnRecorder):
+    topic = f"user_acts/{domain.get_domain_name()}"
+
+    # every user informs about the same slots, but wants other values
+    users = {'external': 'adviser', 'theory': 'examination'}
+    sessions = {department: ds.start_session({topic: []}) for department in users}
+    for department, session in sessions.items():
+        sys_act, _ = next_turn(recorder, session)
+        assert sys_act.type == SysActionType.Welcome, f"session {department} did not start with a welcome"
+
+    # interleave the turns: each step is sent to both sessions before any answer is read
+    for slot in ['department', 'position']:
+        for department, session in sessions.items():
+            value = department if slot == 'department' else users[department]
+            ds.step(session, {topic: [UserAct(act_type=UserActionType.Inform, slot=slot, value=value)]})
+        for department, session in sessions.items():
+            _, beliefstate = next_turn(recorder, session)
+            informs = beliefstate['informs']
+            assert set(informs['department']) == {department}, \
+                f"session {department} knows departments {list(informs['department'])}"
+            if slot == 'position':
+                assert set(informs['position']) == {users[department]}, \
+                    f"session {department} knows positions {list(informs['position'])}"
+
+    for session in sessions.values():
+        ds.step(session, {topic: [UserAct(act_type=UserActionType.Bye)]})
+    for department, session in sessions.items():
+        sys_act, _ = next_turn(recorder, session)
+        assert sys_act.type == SysActionType.Bye, f"session {department} did not end"
+        assert ds.wait_for_end(session, timeout=TIMEOUT), f"session {department} did not end"
+        ds.end_session(session)
+
+    if isinstance(policy, DQNPolicy):
+        # while training, all transitions go to one replay buffer: the policy only serves the default session
+        policy.train()
+        try:
+            ds.start_session({topic: []})
+            raise AssertionError("the training policy accepted a session")
+        except ValueError:
+            pass
+        policy.eval()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--policy", choices=['handcrafted', 'dqn'], default='handcrafted',
+                        help="policy serving both sessions")
+    parser.add_argument("-t", "--transport", choices=['zmq', 'local'], default='zmq',
+                        help="transport between the services")
+    parser.add_argument("-m", "--listenermode", choices=['threads', 'poller'], default='threads',
+                        help="listener mode of the services")
+    args = parser.parse_args()
+    check(args.policy, args.transport, args.listenermode)
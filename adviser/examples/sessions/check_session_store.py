@@ -0,0 +1,129 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+"""
+# This script checks that the dialog state of sessions survives being moved to disk by a `SessionStore`,
+# first on a store alone, then in a dialog system keeping fewer sessions in memory than are running.
+# """
+
+import argparse
+import os
+import sys
+import time
+
+
+def get_root_dir():
+    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+sys.path.append(get_root_dir())
+
+from examples.sessions.check_multi_session import TurnRecorder, next_turn
+from services.bst import HandcraftedBST
+from services.policy import HandcraftedPolicy
+from services.service import DialogSystem
+from services.session import session_store
+from services.sessionstore import SessionStore
+from utils import SysActionType, UserAct, UserActionType
+from utils.beliefstate import BeliefState
+from utils.domain.jsonlookupdomain import JSONLookupDomain
+from utils.logger import DiasysLogger, LogLevel
+
+
+def check_store(domain: JSONLookupDomain):
+    """ Least recently used sessions and idle sessions are moved out and loaded again unchanged """
+    store = SessionStore(max_sessions=3, ttl=0.2)
+    departments = domain.get_possible_values('department')
+    for session, department in enumerate(departments):
+        beliefstate = BeliefState(domain)
+        beliefstate['informs']['department'] = {department: 1.0}
+        store.acquire(str(session))
+        store.get(str(session), create=True)['bs'] = beliefstate
+        store.release(str(session))
+    assert len(store) == 3, f"{len(store)} sessions in memory, expected 3"
+
+    # every access loads the session again, the domain is shared instead of copied
+    for session, department in enumerate(departments):
+        beliefstate = store.get(str(session))['bs']
+        assert beliefstate['informs']['department'] == {department: 1.0}, f"session {session} changed on disk"
+        assert beliefstate.domain is domain, f"session {session} got a copy of the domain"
+    assert len(store) == 3, f"{len(store)} sessions in memory, expected 3"
+
+    # sessions in use stay in memory, idle ones are moved out once the time to live expired
+    store.acquire('0')
+    store.get('0')
+    time.sleep(0.3)
+    store.acquire('1')
+    store.get('1')
+    store.release('1')
+    assert len(store) == 2, f"{len(store)} sessions in memory, expected the two sessions just used"
+    store.release('0')
+
+    store.drop('2')
+    assert store.get('2') is None, "dropped session was loaded again"
+    spill_file = store._temp_file
+    store.close()
+    assert not os.path.exists(spill_file), "temporary spill file was not deleted"
+    print(f"store: {len(departments)} sessions moved to disk and loaded again")
+
+
+def check_dialog_system(domain: JSONLookupDomain, transport: str, num_sessions: int):
+    """ Interleaved dialogs keep their belief states although only two sessions fit into memory """
+    logger = DiasysLogger(console_log_lvl=LogLevel.NONE, file_log_lvl=LogLevel.NONE)
+    bst = HandcraftedBST(domain=domain, logger=logger)
+    recorder = TurnRecorder(domain)
+    ds = DialogSystem(services=[bst, HandcraftedPolicy(domain=domain, logger=logger), recorder],
+                      transport=transport, max_sessions=2, ack_timeout=10.0)
+    topic = f"user_acts/{domain.get_domain_name()}"
+    positions = domain.get_possible_values('position')[:num_sessions]
+    try:
+        sessions = {position: ds.start_session({topic: []}) for position in positions}
+        for session in sessions.values():
+            next_turn(recorder, session)
+        for slot in ['position', 'department']:
+            for position, session in sessions.items():
+                value = position if slot == 'position' else 'theory'
+                ds.step(session, {topic: [UserAct(act_type=UserActionType.Inform, slot=slot, value=value)]})
+            for position, session in sessions.items():
+                _, beliefstate = next_turn(recorder, session)
+                assert set(beliefstate['informs']['position']) == {position}, \
+                    f"session {position} knows positions {list(beliefstate['informs']['position'])}"
+            assert len(session_store(bst)) <= 2, f"the BST holds {len(session_store(bst))} sessions in memory"
+        for session in sessions.values():
+            ds.step(session, {topic: [UserAct(act_type=UserActionType.Bye)]})
+        for position, session in sessions.items():
+            sys_act, _ = next_turn(recorder, session)
+            assert sys_act.type == SysActionType.Bye, f"session {position} did not end"
+            assert ds.wait_for_end(session, timeout=10.0), f"session {position} did not end"
+            ds.end_session(session)
+    finally:
+        ds.shutdown()
+    print(f"dialog system ({transport} transport): {len(positions)} interleaved sessions, 2 kept in memory")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", "--transport", choices=['zmq', 'local'], default='zmq',
+                        help="transport between the services")
+    parser.add_argument("-n", "--sessions", default=6, type=int,
+                        help="number of interleaved sessions")
+    args = parser.parse_args()
+    lecturers = JSONLookupDomain('ImsLecturers')
+    check_store(lecturers)
+    check_dialog_system(lecturers, args.transport, args.sessions)
@@ -0,0 +1,172 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+"""
+# This script checks that a `SessionRouter` spreads sessions across worker processes, keeps running sessions
+# on their worker when workers join, moves them when a worker leaves or crashes, and releases its threads and
+# sockets on shutdown.
+# """
+
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+
+
+def get_root_dir():
+    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+sys.path.append(get_root_dir())
+
+from services.service import DialogSystem, PublishSubscribe, Service
+from services.session import SessionAttribute
+from services.sharding import SessionRouter, run_worker
+from utils.topics import Topic
+
+NUM_TURNS = 5  # turns per dialog
+TIMEOUT = 10.0  # seconds to wait for workers and dialogs
+
+
+class Counter(Service):
+    """ Counts the turns of each session """
+    count = SessionAttribute()
+
+    def dialog_start(self):
+        self.count = 0
+
+    @PublishSubscribe(sub_topics=["ping"], pub_topics=["pong"])
+    def on_ping(self, ping: int = None):
+        self.count += 1
+        return {"pong": self.count}
+
+
+class Driver(Service):
+    """ Ends the dialog after `NUM_TURNS` turns """
+
+    @PublishSubscribe(sub_topics=["pong"], pub_topics=["ping", Topic.DIALOG_END])
+    def on_pong(self, pong: int = None):
+        if pong >= NUM_TURNS:
+            return {Topic.DIALOG_END: True}
+        return {"ping": pong}
+
+
+def worker(identifier: str, stop_event: threading.Event = None):
+    dialog_system = DialogSystem(services=[Counter(), Driver()], transport='local')
+    try:
+        run_worker(dialog_system, identifier, stop_event=stop_event, heartbeat_interval=0.2)
+    finally:
+        dialog_system.shutdown()
+
+
+def start_worker(identifier: str) -> multiprocessing.Process:
+    process = multiprocessing.Process(target=worker, args=(identifier,))
+    process.start()
+    return process
+
+
+def wait_until(condition, message: str):
+    deadline = time.time() + TIMEOUT
+    while not condition():
+        assert time.time() < deadline, message
+        time.sleep(0.05)
+
+
+def run_dialogs(router: SessionRouter, sessions):
+    """ Runs the given (idle) sessions to their end """
+    for session in sessions:
+        router.step(session, {"ping": 0})
+    for session in sessions:
+        assert router.wait_for_end(session, TIMEOUT), f"session {session} did not end"
+        router.end_session(session)
+
+
+def check(num_sessions: int):
+    router = SessionRouter(worker_timeout=1.0)
+    processes = {identifier: start_worker(identifier) for identifier in ['worker-1', 'worker-2']}
+    try:
+        assert router.wait_for_workers(2, TIMEOUT), "workers did not join"
+
+        # sessions are spread across all workers
+        sessions = [router.start_session() for _ in range(num_sessions)]
+        used = {router._assignments[session] for session in sessions}
+        assert used == {'worker-1', 'worker-2'}, f"sessions only went to {used}"
+
+        # running sessions stay on their worker when another worker joins
+        processes['worker-3'] = start_worker('worker-3')
+        assert router.wait_for_workers(3, TIMEOUT), "third worker did not join"
+        assert {router._assignments[session] for session in sessions} == used, "running sessions moved"
+        run_dialogs(router, sessions)
+        print(f"{num_sessions} dialogs on {sorted(used)}, running sessions stayed when a worker joined")
+
+        # the sessions of a crashed worker are restarted on the others once its heartbeats stop
+        sessions = [router.start_session() for _ in range(num_sessions)]
+        crashed = router._assignments[sessions[0]]
+        os.kill(processes[crashed].pid, signal.SIGKILL)
+        wait_until(lambda: crashed not in router.workers, f"crashed {crashed} was not removed")
+        assert all(router._assignments[session] != crashed for session in sessions), "sessions were not moved"
+        run_dialogs(router, sessions)
+        print(f"{crashed} crashed, its sessions were moved to {router.workers}")
+
+        # a worker leaving on its own returns from `run_worker` and gives its sessions to the others
+        stop_event = threading.Event()
+        leaving = threading.Thread(target=worker, args=('worker-4', stop_event))
+        leaving.start()
+        wait_until(lambda: 'worker-4' in router.workers, "worker-4 did not join")
+        sessions = [router.start_session() for _ in range(num_sessions)]
+        stop_event.set()
+        leaving.join(TIMEOUT)
+        assert not leaving.is_alive(), "worker-4 did not stop"
+        assert 'worker-4' not in router.workers, "worker-4 did not leave"
+        run_dialogs(router, sessions)
+        print(f"worker-4 left, the sessions were moved to {router.workers}")
+    finally:
+        router.shutdown()
+        for identifier, process in processes.items():
+            process.join(TIMEOUT)
+    codes = {identifier: process.exitcode for identifier, process in processes.items() if identifier != crashed}
+    assert all(code == 0 for code in codes.values()), f"workers exited with {codes}"
+    assert not router._receiver.is_alive() and not router._registrar.is_alive(), "router threads still running"
+    assert router._pub.closed and router._sub.closed, "router sockets were not closed"
+
+
+def check_restart(num_sessions: int):
+    """ A new router can be created in the same process once the previous one shut down """
+    router = SessionRouter(worker_timeout=1.0)
+    process = start_worker('worker-5')
+    try:
+        assert router.wait_for_workers(1, TIMEOUT), "worker did not join the new router"
+        run_dialogs(router, [router.start_session() for _ in range(num_sessions)])
+    finally:
+        router.shutdown()
+        process.join(TIMEOUT)
+    assert process.exitcode == 0, f"worker exited with {process.exitcode}"
+    print(f"{num_sessions} dialogs on a second router in the same process")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--sessions", default=20, type=int,
+                        help="number of sessions per step of the check")
+    args = parser.parse_args()
+    check(args.sessions)
+    check_restart(args.sessions)
@@ -17,10 +17,11 @@
 #
 ###############################################################################
 
-from typing import List, Set
+from typing import List, Set, Type
 
 from services.service import PublishSubscribe
 from services.service import Service
+from services.session import SessionAttribute
 from utils.beliefstate import BeliefState
 from utils.useract import UserActionType, UserAct
 
@@ -30,10 +31,24 @@ class HandcraftedBST(Service):
     A rule-based approach to belief state tracking.
     """
 
-    def __init__(self, domain=None, logger=None):
+    bs = SessionAttribute()
+
+    def __init__(self, domain=None, logger=None, compact_beliefstate: bool = False,
+                 beliefstate_cls: Type[BeliefState] = BeliefState):
+        """
+        Args:
+            domain (JSONLookupDomain): domain of the belief state
+            logger (DiasysLogger): logger to use
+            compact_beliefstate (bool): publish a `BeliefStateSnapshot` of the current turn instead of the whole
+                                        belief state (smaller messages, older turns only available in-process)
+            beliefstate_cls (Type[BeliefState]): belief state *class* to track the dialog with, e.g.
+                                                 `VectorBeliefState`
+        """
         Service.__init__(self, domain=domain)
         self.logger = logger
-        self.bs = BeliefState(domain)
+        self.compact_beliefstate = compact_beliefstate
+        self.beliefstate_cls = beliefstate_cls
+        self.bs = beliefstate_cls(domain)
 
     @PublishSubscribe(sub_topics=["user_acts"], pub_topics=["beliefstate"])
     def update_bst(self, user_acts: List[UserAct] = None) \
@@ -64,6 +79,8 @@ class HandcraftedBST(Service):
             self.bs["num_matches"] = num_entries
             self.bs["discriminable"] = discriminable
 
+        if self.compact_beliefstate:
+            return {'beliefstate': self.bs.snapshot()}
         return {'beliefstate': self.bs}
 
     def dialog_start(self):
@@ -75,7 +92,7 @@ class HandcraftedBST(Service):
                         the value is a new BeliefState object
         """
         # initialize belief state
-        self.bs = BeliefState(self.domain)
+        self.bs = self.beliefstate_cls(self.domain)
 
     def _reset_informs(self, acts: List[UserAct]):
         """
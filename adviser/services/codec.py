@@ -0,0 +1,187 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+""" This module provides the codecs used to (de-)serialize messages sent between services. """
+
+import copyreg
+import io
+import pickle
+import sys
+import threading
+from typing import Any, List, Tuple
+
+try:
+    # out-of-band buffers require pickle protocol 5 (python >= 3.8 or the pickle5 backport)
+    if pickle.HIGHEST_PROTOCOL < 5:
+        import pickle5 as pickle
+    OUT_OF_BAND_SUPPORTED = True
+except ImportError:
+    OUT_OF_BAND_SUPPORTED = False
+
+
+def _frame_buffer(frame):
+    """ Returns a buffer for a received frame without copying it.
+        Frames received with `copy=False` are `zmq.Frame` instances, all others are `bytes`. """
+    return getattr(frame, 'buffer', frame)
+
+
+def _rebuild_tensor(array):
+    """ Rebuilds a torch tensor from the numpy array it was sent as.
+        Arrays rebuilt from received frames are read-only views on the ZMQ message, which other receivers may
+        share. Torch has no read-only tensors, so such arrays are copied once instead of aliasing the message. """
+    import torch
+    if not array.flags.writeable:
+        array = array.copy()
+    return torch.from_numpy(array)
+
+
+class MessageCodec(object):
+    """ Interface for codecs translating message contents to ZMQ frames and back.
+
+        Every message is sent as `[topic, *frames]`, where `frames` is the output of `encode`.
+        Receivers pass all frames following the topic to `decode`.
+    """
+
+    # if False, frames are handed to ZMQ without copying them first (see `zmq.Socket.send_multipart`)
+    copy_frames = True
+
+    def encode(self, timestamp: float, content: Any) -> List[Any]:
+        """ Serializes a message.
+
+        Args:
+            timestamp (float): POSIX timestamp of the message
+            content (Any): message content
+
+        Returns:
+            List of buffers, one per ZMQ frame
+        """
+        raise NotImplementedError
+
+    def decode(self, frames: List[Any]) -> Tuple[float, Any]:
+        """ Deserializes a message.
+
+        Args:
+            frames (List[Any]): all frames of a message except the topic frame (`bytes` or `zmq.Frame`)
+
+        Returns:
+            tuple(timestamp, content)
+        """
+        raise NotImplementedError
+
+
+class PickleCodec(MessageCodec):
+    """ Pickles the complete message into a single frame.
+
+        Decoding also accepts messages encoded by the `ZeroCopyCodec`, so services using
+        either codec can talk to each other.
+    """
+
+    def encode(self, timestamp: float, content: Any) -> List[Any]:
+        return [pickle.dumps((timestamp, content))]
+
+    def decode(self, frames: List[Any]) -> Tuple[float, Any]:
+        if len(frames) == 1:
+            return pickle.loads(_frame_buffer(frames[0]))
+        # message carries out-of-band buffers
+        return pickle.loads(_frame_buffer(frames[0]), buffers=[_frame_buffer(frame) for frame in frames[1:]])
+
+
+def _reduce_tensor(tensor):
+    """ Sends cpu tensors as numpy arrays, so that their memory can be transferred out-of-band """
+    torch = sys.modules['torch']
+    if tensor.device.type == 'cpu' and tensor.layout == torch.strided and not tensor.requires_grad:
+        return _rebuild_tensor, (tensor.numpy(),)
+    return tensor.__reduce_ex__(5)
+
+
+class ZeroCopyCodec(PickleCodec):
+    """ Sends large buffers (e.g. numpy arrays, cpu tensors) as separate frames instead of
+        copying them into the pickled message (pickle protocol 5 out-of-band buffers).
+
+        On the receiving side, arrays are rebuilt as views on the received frames without copying.
+        Such arrays share memory with the ZMQ message and may be read-only, so copy them before
+        modifying them in place. Tensors are copied out of read-only frames once (into their own memory).
+
+        Falls back to the behaviour of `PickleCodec` if pickle protocol 5 is not available.
+    """
+
+    def __init__(self, min_buffer_size: int = 4096, copy_frames: bool = True):
+        """
+        Args:
+            min_buffer_size (int): buffers smaller than this (in bytes) are kept inside the pickled message
+            copy_frames (bool): if False, ZMQ sends the buffers without copying them. Only use this if
+                                published arrays are never modified after being returned from a
+                                `PublishSubscribe` function.
+        """
+        self.min_buffer_size = min_buffer_size
+        self.copy_frames = copy_frames
+        self._local = threading.local()  # pickler of each thread, reused for all its messages
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _pickler(self) -> Tuple[pickle.Pickler, io.BytesIO, list]:
+        """ Returns the pickler of the calling thread, the stream it writes to and its list of out-of-band buffers.
+            Once torch was imported, the pickler sends tensors as numpy arrays (looked up by the exact type
+            `torch.Tensor`, so other objects are pickled without calling into python).
+        """
+        local = self._local
+        try:
+            pickler = local.pickler
+        except AttributeError:
+            local.data = io.BytesIO()
+            local.buffers = []
+
+            def buffer_callback(buffer):
+                if buffer.raw().nbytes < self.min_buffer_size:
+                    return True  # serialize in-band
+                local.buffers.append(buffer)
+                return False
+
+            pickler = local.pickler = pickle.Pickler(local.data, protocol=5, buffer_callback=buffer_callback)
+            local.tensors = False
+        if not local.tensors and 'torch' in sys.modules:
+            dispatch_table = copyreg.dispatch_table.copy()
+            dispatch_table[sys.modules['torch'].Tensor] = _reduce_tensor
+            pickler.dispatch_table = dispatch_table
+            local.tensors = True
+        return pickler, local.data, local.buffers
+
+    def encode(self, timestamp: float, content: Any) -> List[Any]:
+        if not OUT_OF_BAND_SUPPORTED:
+            return PickleCodec.encode(self, timestamp, content)
+
+        pickler, data, buffers = self._pickler()
+        data.seek(0)
+        data.truncate()
+        del buffers[:]
+        pickler.clear_memo()
+        pickler.dump((timestamp, content))
+        return [data.getvalue()] + buffers
+
+
+def default_codec() -> MessageCodec:
+    """ Returns the codec used by services and dialog systems if no other codec is specified """
+    return ZeroCopyCodec()
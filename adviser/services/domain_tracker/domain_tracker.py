@@ -21,6 +21,7 @@
 
 from services.service import PublishSubscribe
 from services.service import Service
+from services.session import SessionAttribute
 from utils.domain import Domain
 from typing import List
 
@@ -31,6 +32,9 @@ class DomainTracker(Service):
         Current implmentation uses keywords to switch domains.
     """
 
+    current_domain = SessionAttribute()
+    turn = SessionAttribute()
+
     def __init__(self, domains: List[Domain], greet_on_first_turn: bool = False):
         Service.__init__(self, domain="")
         self.domains = domains
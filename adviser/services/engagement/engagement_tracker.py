@@ -45,6 +45,8 @@ class EngagementTracker(Service):
     Start feature extraction with OpenFace.
     Requires OpenFace to be installed - instructions can be found in tool/openface.txt
     """
+
+    multi_session = False  # the camera films one user
     def __init__(self, domain="", camera_id: int = 0, openface_port: int = 6004, delay: int = 2, identifier=None):
         """
         Args:
@@ -0,0 +1,61 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+""" This module provides the event loop running all `async` service functions of a process. """
+
+import asyncio
+import contextvars
+import functools
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """ Returns the event loop shared by all services of this process.
+        The loop is started in a daemon thread on first use.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_run_loop, args=(_loop,), daemon=True, name="adviser-eventloop").start()
+        return _loop
+
+
+async def run_blocking(func, *args):
+    """ Runs a blocking function (e.g. a web API request) in a worker thread, so that other
+        coroutines on the event loop can continue in the meantime.
+
+    Args:
+        func (Callable): blocking function
+        args: positional arguments for `func`
+
+    Returns:
+        return value of `func`
+    """
+    # executor threads don't inherit the caller's context (e.g. the current session)
+    context = contextvars.copy_context()
+    return await asyncio.get_event_loop().run_in_executor(None, functools.partial(context.run, func, *args))
@@ -25,6 +25,7 @@ import time
 
 from services.service import PublishSubscribe
 from services.service import Service
+from services.session import SessionAttribute
 from utils.common import Language
 from utils.domain import Domain
 from utils.topics import Topic
@@ -37,6 +38,9 @@ class ConsoleInput(Service):
     Waits for the built-in input function to return a non-empty text.
     """
 
+    multi_session = False  # there is only one console
+    interaction_count = SessionAttribute()
+
     def __init__(self, domain: Domain = None, conversation_log_dir: str = None, language: Language = None):
         Service.__init__(self, domain=domain)
         # self.language = language
@@ -110,6 +114,8 @@ class ConsoleInput(Service):
 class ConsoleOutput(Service):
     """Writes the system utterance to the console."""
 
+    multi_session = False  # there is only one console
+
     def __init__(self, domain: Domain = None):
         Service.__init__(self, domain=domain)
 
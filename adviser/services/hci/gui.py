@@ -59,6 +59,8 @@ class GUIServer(Service):
         * run the dialog system in another python instance, add a RemoteService with identifier `GUIServer`
     """
 
+    multi_session = False  # messages from the web-UI are published to the default session
+
     def __init__(self, socketio, identifier="GUIServer", logger: DiasysLogger = None):
         super().__init__(domain='', identifier=identifier)
         self.socketio = socketio
@@ -32,6 +32,8 @@ from utils.domain.domain import Domain
 
 class SpeechOutputPlayer(Service):
 
+    multi_session = False  # the speakers play to one user
+
     def __init__(self, domain: Domain = "", conversation_log_dir: str = None, identifier: str = None):
         """
         Service that plays the system utterance as sound
@@ -35,6 +35,8 @@ from utils.domain.domain import Domain
 
 class SpeechRecorder(Service):
 
+    multi_session = False  # the microphone records one user
+
     def __init__(self, domain: Union[str, Domain] = "", conversation_log_dir: str = None, enable_plotting: bool = False, threshold: int = 8000,
                  voice_privacy: bool = False, identifier: str = None) -> None:
         """
@@ -31,6 +31,8 @@ class VideoInput(Service):
     Captures frames with a specified capture interval between two consecutive dialog turns and returns a list of frames.
     """
 
+    multi_session = False  # the camera films one user
+
     def __init__(self, domain=None, camera_id: int = 0, capture_interval: int = 10e5, identifier: str = None):
         """
         Args:
@@ -20,10 +20,12 @@
 import json
 import os
 import re
-from typing import List
+from collections import defaultdict
+from typing import Dict, Hashable, Iterable, List, Set, Union
 
 from services.service import PublishSubscribe
 from services.service import Service
+from services.session import SessionAttribute
 from utils import UserAct, UserActionType
 from utils.beliefstate import BeliefState
 from utils.common import Language
@@ -31,11 +33,120 @@ from utils.domain.jsonlookupdomain import JSONLookupDomain
 from utils.logger import DiasysLogger
 from utils.sysact import SysAct, SysActionType
 
+try:
+    from re import _parser as sre_parse  # python >= 3.11
+except ImportError:
+    import sre_parse
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None))
+_ATOMIC_GROUP = getattr(sre_parse, 'ATOMIC_GROUP', None)
+
 
 def get_root_dir():
     return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
+def _required_literals(sequence) -> Union[Set[str], None]:
+    """ Returns strings (lower case ASCII) of which every match of a parsed regular expression contains at
+        least one, `None` if there are no such strings
+    """
+    best = None
+    run = []  # consecutive literal characters
+    for op, av in list(sequence) + [(None, None)]:
+        if op is sre_parse.LITERAL and av < 128:
+            run.append(chr(av))
+            continue
+        if run:
+            best = _longer_literals(best, {''.join(run).lower()})
+            run = []
+        required = None
+        if op is sre_parse.SUBPATTERN:
+            required = _required_literals(av[-1])
+        elif op in _REPEATS and av[0] >= 1:
+            required = _required_literals(av[2])
+        elif op is sre_parse.ASSERT:
+            required = _required_literals(av[1])
+        elif op is _ATOMIC_GROUP:
+            required = _required_literals(av)
+        elif op is sre_parse.BRANCH:
+            branches = [_required_literals(branch) for branch in av[1]]
+            if all(branch is not None for branch in branches):
+                required = set().union(*branches)
+        elif op is sre_parse.IN and all(item_op is sre_parse.LITERAL and item_av < 128 for item_op, item_av in av):
+            required = {chr(item_av).lower() for _, item_av in av}
+        best = _longer_literals(best, required)
+    return best
+
+
+def _longer_literals(literals: Union[Set[str], None], other: Union[Set[str], None]) -> Union[Set[str], None]:
+    """ Returns the more selective of two sets of required literals (the one with the longer shortest string) """
+    if not other or '' in other:
+        return literals
+    if literals is None or min(map(len, other)) > min(map(len, literals)):
+        return other
+    return literals
+
+
+class _RuleMatcher(object):
+    """ Finds all rules (regular expressions) of a rule set which match an utterance.
+
+        The rules are compiled once. Each rule is indexed by the literal strings one of which every match
+        of the rule contains, so an utterance is only searched with the rules whose literals it contains
+        (found through the three-letter substrings of the utterance) instead of with every rule.
+        The result is the same as searching every rule on its own.
+    """
+
+    def __init__(self, rules: Dict[Hashable, str], flags: int = re.I):
+        """
+        Args:
+            rules (Dict[Hashable, str]): name -> regular expression, in the order to report matches in
+            flags (int): flags to compile the rules with
+        """
+        self.names = list(rules)
+        self.patterns = [re.compile(rules[name], flags) for name in self.names]
+        self._unfiltered = set()  # rules without required literals, always searched
+        self._short_literals = []  # (literal, rule) for literals shorter than three characters
+        literals_by_trigram = defaultdict(list)
+        for index, name in enumerate(self.names):
+            literals = _required_literals(sre_parse.parse(rules[name], flags))
+            if literals is None:
+                self._unfiltered.add(index)
+                continue
+            for literal in literals:
+                if len(literal) < 3:
+                    self._short_literals.append((literal, index))
+                else:
+                    literals_by_trigram[literal[:3]].append((literal, index))
+        self._literals = dict(literals_by_trigram)  # first three characters -> [(literal, rule), ...]
+
+    def _candidates(self, utterance: str) -> Iterable[int]:
+        """ Returns the indices of the rules which might match the utterance """
+        if not utterance.isascii():
+            # case-insensitive matching of non-ASCII characters isn't covered by the literals
+            return range(len(self.patterns))
+        text = utterance.lower()
+        candidates = set(self._unfiltered)
+        candidates.update(index for literal, index in self._short_literals if literal in text)
+        trigrams = {text[start:start + 3] for start in range(len(text) - 2)}
+        for trigram in trigrams.intersection(self._literals):
+            candidates.update(index for literal, index in self._literals[trigram] if literal in text)
+        return sorted(candidates)
+
+    def search(self, utterance: str, check_groups: bool = False) -> List[Hashable]:
+        """ Returns the names of all rules matching the utterance, in rule order
+
+        Args:
+            utterance (str): text to search in
+            check_groups (bool): only report rules whose match captured a group (see `HandcraftedNLU._check`)
+        """
+        names = []
+        for index in self._candidates(utterance):
+            match = self.patterns[index].search(utterance)
+            if match is not None and (not check_groups or HandcraftedNLU._check(match)):
+                names.append(self.names[index])
+        return names
+
+
 class HandcraftedNLU(Service):
     """
     Class for Handcrafted Natural Language Understanding Module (HDC-NLU).
@@ -65,6 +176,8 @@ class HandcraftedNLU(Service):
 
     """
 
+    sys_act_info = SessionAttribute()
+
     def __init__(self, domain: JSONLookupDomain, logger: DiasysLogger = DiasysLogger(),
                  language: Language = None):
         """
@@ -173,9 +286,10 @@ class HandcraftedNLU(Service):
         """
 
         # Iteration over all general acts
+        matched_acts = set(self.general_rules.search(user_utterance))
         for act in self.general_regex:
             # Check if the regular expression and the user utterance match
-            if re.search(self.general_regex[act], user_utterance, re.I):
+            if act in matched_acts:
                 # Mapping the act to User Act
                 if act != 'dontcare' and act != 'req_everything':
                     user_act_type = UserActionType(act)
@@ -265,8 +379,9 @@ class HandcraftedNLU(Service):
 
         """
         # Iteration over all user requestable slots
+        matched_slots = set(self.request_rules.search(user_utterance, check_groups=True))
         for slot in self.USER_REQUESTABLE:
-            if self._check(re.search(self.request_regex[slot], user_utterance, re.I)):
+            if slot in matched_slots:
                 self._add_request(user_utterance, slot)
 
     def _add_request(self, user_utterance: str, slot: str):
@@ -297,9 +412,10 @@ class HandcraftedNLU(Service):
         """
 
         # Iteration over all user informable slots and their slots
+        matched_values = set(self.inform_rules.search(user_utterance, check_groups=True))
         for slot in self.USER_INFORMABLE:
             for value in self.inform_regex[slot]:
-                if self._check(re.search(self.inform_regex[slot][value], user_utterance, re.I)):
+                if (slot, value) in matched_values:
                     if slot == self.domain_key and self.req_everything:
                         # Adding all requestable slots because of the req_everything
                         for req_slot in self.USER_REQUESTABLE:
@@ -387,6 +503,10 @@ class HandcraftedNLU(Service):
             # Since the user acts are matched, they get 1.0 as score
             self.user_acts[i].score = 1.0
 
+    def dialog_start(self):
+        """ Resets the information about the previous system act for a new dialog """
+        self.start_dialog()
+
     def start_dialog(self) -> dict:
         """
         Sets the previous system act as None.
@@ -466,3 +586,9 @@ class HandcraftedNLU(Service):
                                                + 'GermanInformRules.json'))
         else:
             print('No language')
+            return
+        # compile all rules once: general acts, requests and informs (named by (slot, value))
+        self.general_rules = _RuleMatcher(self.general_regex)
+        self.request_rules = _RuleMatcher({slot: self.request_regex[slot] for slot in self.USER_REQUESTABLE})
+        self.inform_rules = _RuleMatcher({(slot, value): self.inform_regex[slot][value]
+                                          for slot in self.USER_INFORMABLE for value in self.inform_regex[slot]})
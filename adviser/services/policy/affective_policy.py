@@ -22,6 +22,7 @@ from typing import Dict
 from utils.domain.jsonlookupdomain import JSONLookupDomain
 from services.service import PublishSubscribe
 from services.service import Service
+from services.session import SessionAttribute
 from utils.logger import DiasysLogger
 from utils.userstate import UserState
 
@@ -31,6 +32,8 @@ class EmotionPolicy(Service):
         should give
 
     """
+    first_turn = SessionAttribute()
+
     def __init__(self, domain: JSONLookupDomain = None, logger: DiasysLogger = DiasysLogger()):
         """
         Initializes the policy
@@ -44,7 +47,7 @@ class EmotionPolicy(Service):
         self.logger = logger
 
     def dialog_start(self):
-        pass
+        self.first_turn = True
 
     @PublishSubscribe(sub_topics=["userstate"], pub_topics=["sys_emotion", "sys_engagement"])
     def choose_sys_emotion(self, userstate: UserState = None)\
@@ -20,7 +20,9 @@
 from typing import List, Dict
 
 from utils.domain.lookupdomain import LookupDomain
+from services.eventloop import run_blocking
 from services.service import PublishSubscribe, Service
+from services.session import SessionAttribute
 from utils import SysAct, SysActionType
 from utils.logger import DiasysLogger
 from utils.beliefstate import BeliefState
@@ -38,6 +40,13 @@ class HandcraftedPolicy(Service):
     The classes will probably be merged in the future.
     """
 
+    # dialog-level state
+    first_turn = SessionAttribute()
+    last_action = SessionAttribute()
+    current_suggestions = SessionAttribute()
+    s_index = SessionAttribute()
+    prev_sys_act = SessionAttribute()
+
     def __init__(self, domain: LookupDomain, logger: DiasysLogger = DiasysLogger()):
         """
         Initializes the policy
@@ -55,7 +64,7 @@ class HandcraftedPolicy(Service):
         self.logger = logger
 
     @PublishSubscribe(sub_topics=["beliefstate"], pub_topics=["sys_act", "sys_state"])
-    def choose_sys_act(self, beliefstate: BeliefState = None, sys_act: SysAct = None)\
+    async def choose_sys_act(self, beliefstate: BeliefState = None, sys_act: SysAct = None)\
             -> dict(sys_act=SysAct):
 
         """
@@ -78,28 +87,28 @@ class HandcraftedPolicy(Service):
         # variables for general (non-domain specific) actions
         # self.turn = dialog_graph.num_turns
         self.prev_sys_act = sys_act
-        self._remove_gen_actions(beliefstate)
+        user_acts = self._remove_gen_actions(beliefstate)
         sys_state = {}
 
         # do nothing on the first turn --LV
-        if self.first_turn and not beliefstate['user_acts']:
+        if self.first_turn and not user_acts:
             self.first_turn = False
             sys_act = SysAct()
             sys_act.type = SysActionType.Welcome
             return {'sys_act': sys_act}
-        elif UserActionType.Bad in beliefstate["user_acts"]:
+        elif UserActionType.Bad in user_acts:
             sys_act = SysAct()
             sys_act.type = SysActionType.Bad
         # if the action is 'bye' tell system to end dialog
-        elif UserActionType.Bye in beliefstate["user_acts"]:
+        elif UserActionType.Bye in user_acts:
             sys_act = SysAct()
             sys_act.type = SysActionType.Bye
         # if user only says thanks, ask if they want anything else
-        elif UserActionType.Thanks in beliefstate["user_acts"]:
+        elif UserActionType.Thanks in user_acts:
             sys_act = SysAct()
             sys_act.type = SysActionType.RequestMore
         # If user only says hello, request a random slot to move dialog along
-        elif UserActionType.Hello in beliefstate["user_acts"] or UserActionType.SelectDomain in beliefstate["user_acts"]:
+        elif UserActionType.Hello in user_acts or UserActionType.SelectDomain in user_acts:
             sys_act = SysAct()
             sys_act.type = SysActionType.Request
             slot = self._get_open_slot(beliefstate)
@@ -108,13 +117,14 @@ class HandcraftedPolicy(Service):
             sys_state['lastRequestSlot'] = slot
 
             # If we switch to the domain, start a new dialog
-            if UserActionType.SelectDomain in beliefstate["user_acts"]:
+            if UserActionType.SelectDomain in user_acts:
                 self.dialog_start()
             self.first_turn = False
 
         # handle domain specific actions
         else:
-            sys_act, sys_state = self._next_action(beliefstate)
+            # API calls block until the response arrives - let other services continue in the meantime
+            sys_act, sys_state = await run_blocking(self._next_action, beliefstate)
 
         self.logger.dialog_turn("System Action: " + str(sys_act))
         if 'last_act' not in sys_state:
@@ -131,14 +141,15 @@ class HandcraftedPolicy(Service):
         """
             Helper function to read through user action list and if necessary
             delete filler actions (eg. Hello, thanks) when there are other non-filler
-            (eg. Inform, Request) actions from the user. Stores list of relevant actions
-            as a class variable
+            (eg. Inform, Request) actions from the user. Returns the set of relevant action
+            types, the belief state is not modified
 
             Args:
                 user_acts (list): a list of UserAct objects
 
         """
-        act_types_lst = beliefstate["user_acts"]
+        # the belief state may be the tracker's own object, filter a copy of the action types
+        act_types_lst = set(beliefstate["user_acts"])
         # These are filler actions, so if there are other non-filler acions, remove them from
         # the list of action types
         while len(act_types_lst) > 1:
@@ -150,6 +161,7 @@ class HandcraftedPolicy(Service):
                 act_types_lst.remove(UserActionType.Hello)
             else:
                 break
+        return act_types_lst
 
     def _query_db(self, beliefstate: BeliefState):
         """Based on the constraints specified, uses self.domain to generate the appropriate type
@@ -212,6 +224,12 @@ class HandcraftedPolicy(Service):
 
         --LV
         """
+        # computed once per turn, shared by all calls of the policy
+        slots, dontcare = beliefstate.memoize("constraints", lambda: self._extract_constraints(beliefstate))
+        return dict(slots), list(dontcare)
+
+    def _extract_constraints(self, beliefstate: BeliefState):
+        """ Computes `_get_constraints` """
         slots = {}
         # parts of the belief state which don't contain constraints
         dontcare = [slot for slot in beliefstate['informs'] if "dontcare" in beliefstate["informs"][slot]]
@@ -18,10 +18,11 @@
 ###############################################################################
 
 from collections import defaultdict
-from typing import List, Dict
+from typing import List, Dict, Set
 
 from services.service import PublishSubscribe
 from services.service import Service
+from services.session import SessionAttribute
 from utils import SysAct, SysActionType
 from utils.beliefstate import BeliefState
 from utils.domain.jsonlookupdomain import JSONLookupDomain
@@ -48,6 +49,12 @@ class HandcraftedPolicy(Service):
 
     """
 
+    # dialog-level state
+    turns = SessionAttribute()
+    first_turn = SessionAttribute()
+    current_suggestions = SessionAttribute()
+    s_index = SessionAttribute()
+
     def __init__(self, domain: JSONLookupDomain, logger: DiasysLogger = DiasysLogger(),
                  max_turns: int = 25):
         """
@@ -110,33 +117,33 @@ class HandcraftedPolicy(Service):
             return {'sys_act': sys_act, "sys_state": sys_state}
 
         # removes hello and thanks if there are also domain specific actions
-        self._remove_gen_actions(beliefstate)
+        user_acts = self._remove_gen_actions(beliefstate)
 
-        if UserActionType.Bad in beliefstate["user_acts"]:
+        if UserActionType.Bad in user_acts:
             sys_act = SysAct()
             sys_act.type = SysActionType.Bad
         # if the action is 'bye' tell system to end dialog
-        elif UserActionType.Bye in beliefstate["user_acts"]:
+        elif UserActionType.Bye in user_acts:
             sys_act = SysAct()
             sys_act.type = SysActionType.Bye
         # if user only says thanks, ask if they want anything else
-        elif UserActionType.Thanks in beliefstate["user_acts"]:
+        elif UserActionType.Thanks in user_acts:
             sys_act = SysAct()
             sys_act.type = SysActionType.RequestMore
         # If user only says hello, request a random slot to move dialog along
-        elif UserActionType.Hello in beliefstate["user_acts"] or UserActionType.SelectDomain in beliefstate["user_acts"]:
+        elif UserActionType.Hello in user_acts or UserActionType.SelectDomain in user_acts:
             sys_act = SysAct()
             sys_act.type = SysActionType.Request
             slot = self._get_open_slot(beliefstate)
             sys_act.add_value(slot)
 
             # If we switch to the domain, start a new dialog
-            if UserActionType.SelectDomain in beliefstate["user_acts"]:
+            if UserActionType.SelectDomain in user_acts:
                 self.dialog_start()
             self.first_turn = False
         # handle domain specific actions
         else:
-            sys_act, sys_state = self._next_action(beliefstate)
+            sys_act, sys_state = self._next_action(beliefstate, user_acts)
         if self.logger:
             self.logger.dialog_turn("System Action: " + str(sys_act))
         if "last_act" not in sys_state:
@@ -147,15 +154,16 @@ class HandcraftedPolicy(Service):
         """
             Helper function to read through user action list and if necessary
             delete filler actions (eg. Hello, thanks) when there are other non-filler
-            (eg. Inform, Request) actions from the user. Stores list of relevant actions
-            as a class variable
+            (eg. Inform, Request) actions from the user. Returns the set of relevant action
+            types, the belief state is not modified
 
             Args:
                 beliefstate (BeliefState): BeliefState object - includes list of all
                                            current UserActionTypes
 
         """
-        act_types_lst = beliefstate["user_acts"]
+        # the belief state may be the tracker's own object, filter a copy of the action types
+        act_types_lst = set(beliefstate["user_acts"])
         # These are filler actions, so if there are other non-filler acions, remove them from
         # the list of action types
         while len(act_types_lst) > 1:
@@ -167,6 +175,7 @@ class HandcraftedPolicy(Service):
                 act_types_lst.remove(UserActionType.Hello)
             else:
                 break
+        return act_types_lst
 
     def _query_db(self, beliefstate: BeliefState):
         """Based on the constraints specified, uses the domain to generate the appropriate type
@@ -232,6 +241,12 @@ class HandcraftedPolicy(Service):
 
         --LV
         """
+        # computed once per turn, shared by all calls of the policy
+        slots, dontcare = beliefstate.memoize("constraints", lambda: self._extract_constraints(beliefstate))
+        return dict(slots), list(dontcare)
+
+    def _extract_constraints(self, beliefstate: BeliefState):
+        """ Computes `_get_constraints` """
         slots = {}
         # parts of the belief state which don't contain constraints
         dontcare = [slot for slot in beliefstate['informs'] if "dontcare" in beliefstate["informs"][slot]]
@@ -263,7 +278,7 @@ class HandcraftedPolicy(Service):
                 return slot
         return None
 
-    def _next_action(self, beliefstate: BeliefState):
+    def _next_action(self, beliefstate: BeliefState, user_acts: Set[UserActionType]):
         """Determines the next system action based on the current belief state and
            previous action.
 
@@ -272,6 +287,8 @@ class HandcraftedPolicy(Service):
         Args:
             beliefstate (BeliefState): BeliefState object; contains all user constraints to date
             of each possible state
+            user_acts (Set[UserActionType]): the user action types without filler actions
+                                             (see `_remove_gen_actions`)
 
         Return:
             (SysAct): the next system action
@@ -280,7 +297,7 @@ class HandcraftedPolicy(Service):
         """
         sys_state = {}
         # Assuming this happens only because domain is not actually active --LV
-        if UserActionType.Bad in beliefstate['user_acts'] or beliefstate['requests'] \
+        if UserActionType.Bad in user_acts or beliefstate['requests'] \
                 and not self._get_name(beliefstate):
             sys_act = SysAct()
             sys_act.type = SysActionType.Bad
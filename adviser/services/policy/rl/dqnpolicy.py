@@ -30,6 +30,7 @@ from services.policy.rl.policy_rl import RLPolicy
 from services.policy.rl.dqn import DQN, DuelingDQN, NetArchitecture
 from services.policy.rl.experience_buffer import Buffer, NaivePrioritizedBuffer
 from services.service import Service, PublishSubscribe
+from services.session import SessionAttribute
 from services.simulator.goal import Goal
 from utils import common
 from utils.beliefstate import BeliefState
@@ -41,6 +42,12 @@ from utils.useract import UserActionType
 
 class DQNPolicy(RLPolicy, Service):
 
+    # dialog state (per session)
+    turns = SessionAttribute()
+    last_sys_act = SessionAttribute()
+    sys_state = SessionAttribute()
+    sim_goal = SessionAttribute()
+
     def __init__(self, domain: JSONLookupDomain,
                  architecture: NetArchitecture = NetArchitecture.DUELING,
                  hidden_layer_sizes: List[int] = [256, 700, 700],  # vanilla architecture
@@ -118,9 +125,16 @@ class DQNPolicy(RLPolicy, Service):
         self.turns = 0
         self.cumulative_train_dialogs = -1
 
+    @property
+    def multi_session(self) -> bool:
+        """ While training, the transitions of all turns go to one replay buffer in dialog order,
+            so only the default session is served """
+        return not self.is_training
+
     def dialog_start(self, dialog_start=False):
         self.turns = 0
         self.last_sys_act = None
+        self.sim_goal = None
         if self.is_training:
             self.cumulative_train_dialogs += 1
         self.sys_state = {
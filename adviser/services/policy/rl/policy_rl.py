@@ -19,6 +19,7 @@
 
 import random
 
+import numpy as np
 import torch
 
 from services.policy.rl.experience_buffer import UniformBuffer
@@ -30,6 +31,7 @@ from utils.domain.jsonlookupdomain import JSONLookupDomain
 from utils.logger import DiasysLogger
 from utils.sysact import SysAct, SysActionType
 from utils.useract import UserActionType
+from utils.vectorbeliefstate import BeliefLayout, InformBeliefs
 
 
 class RLPolicy(object):
@@ -88,6 +90,7 @@ class RLPolicy(object):
         self.max_turns = max_turns
         self.logger = logger
         self.domain = domain
+        self.belief_layout = BeliefLayout.for_domain(domain)
         # setup evaluator for training
         self.evaluator = ObjectiveReachedEvaluator(domain, logger=logger)
 
@@ -159,18 +162,13 @@ class RLPolicy(object):
         belief_vec.append(1 if sum(belief_vec) == 0 else 1)
 
         # add informs (including special flag if slot not mentioned)
-        for slot in sorted(self.domain.get_informable_slots()):
-            values = self.domain.get_possible_values(slot) + ["dontcare"]
-            if slot not in beliefstate['informs']:
-                # add **NONE** value first, then 0.0 for all others
-                belief_vec.append(1.0)
-                # also add value for don't care
-                belief_vec += [0 for i in range(len(values))]
-            else:
-                # add **NONE** value first
-                belief_vec.append(0.0)
-                bs_slot = beliefstate['informs'][slot]
-                belief_vec += [bs_slot[value] if value in bs_slot else 0.0 for value in values]
+        informs = beliefstate['informs']
+        if isinstance(informs, InformBeliefs) and informs.layout == self.belief_layout:
+            # beliefs of a VectorBeliefState are already laid out like the features
+            inform_vec = informs.features()
+        else:
+            inform_vec = self._inform_features(informs)
+        user_vec, belief_vec = belief_vec, []
 
         # add requests
         for slot in sorted(self.domain.get_requestable_slots()):
@@ -191,7 +189,25 @@ class RLPolicy(object):
         belief_vec.append(float(beliefstate["discriminable"]))
 
         # convert to torch tensor
-        return torch.tensor([belief_vec], dtype=torch.float, device=self.device)
+        belief_vec = np.concatenate((user_vec, inform_vec, belief_vec))
+        return torch.from_numpy(belief_vec).float().unsqueeze(0).to(self.device)
+
+    def _inform_features(self, informs: dict):
+        """ Returns the inform features of `beliefstate_dict_to_vector` for the informs of a belief state """
+        features = []
+        for slot in sorted(self.domain.get_informable_slots()):
+            values = self.domain.get_possible_values(slot) + ["dontcare"]
+            if slot not in informs:
+                # add **NONE** value first, then 0.0 for all others
+                features.append(1.0)
+                # also add value for don't care
+                features += [0 for i in range(len(values))]
+            else:
+                # add **NONE** value first
+                features.append(0.0)
+                bs_slot = informs[slot]
+                features += [bs_slot[value] if value in bs_slot else 0.0 for value in values]
+        return features
 
     def _remove_dontcare_slots(self, slot_value_dict: dict):
         """ Returns a new dictionary without the slots set to dontcare """
@@ -41,6 +41,7 @@ from services.simulator import HandcraftedUserSimulator
 from services.policy import DQNPolicy
 from services.stats.evaluation import PolicyEvaluator
 from utils.domain.jsonlookupdomain import JSONLookupDomain
+from utils.vectorbeliefstate import VectorBeliefState
 from utils import DiasysLogger, LogLevel
 from services.service import DialogSystem
 from tensorboardX import SummaryWriter
@@ -67,9 +68,9 @@ def train(domain_name: str, log_to_file: bool, seed: int, train_epochs: int, tra
     elif buffer_classname == "uniform":
         buffer_cls = UniformBuffer
 
-    domain = JSONLookupDomain(name=domain_name)
+    domain = JSONLookupDomain(name=domain_name, entity_index=True)
     
-    bst = HandcraftedBST(domain=domain, logger=logger)
+    bst = HandcraftedBST(domain=domain, logger=logger, beliefstate_cls=VectorBeliefState)
     user = HandcraftedUserSimulator(domain, logger=logger)
     # noise = SimpleNoise(domain=domain, train_error_rate=train_error_rate,
     #                     test_error_rate=test_error_rate, logger=logger)
@@ -0,0 +1,90 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+""" This module provides the mapping from received topics to the arguments of subscriber functions. """
+
+from functools import lru_cache
+from typing import Dict, Iterable, Tuple, Union
+
+# marks trie nodes at which a subscribed topic ends
+_END = None
+
+
+@lru_cache(maxsize=None)
+def split_topic(topic: str) -> Tuple[str, str]:
+    """ Splits a topic into its name and domain suffix, e.g. 'sys_act/superhero' -> ('sys_act', 'superhero').
+
+    Args:
+        topic (str): topic, optionally followed by '/<domain>'
+
+    Returns:
+        tuple(name, domain), domain is an empty string if the topic has no suffix
+    """
+    parts = topic.split("/")
+    return parts[0], parts[1] if len(parts) > 1 else ""
+
+
+class TopicRouter(object):
+    """ Maps received topics to the subscribed topic (function argument) they were delivered for.
+
+        Subscriptions are prefix-matched, so a message for 'topic/domain' is delivered to a function
+        subscribing to 'topic'. If multiple subscribed topics match, the longest one is chosen.
+        The subscriptions are compiled into a prefix trie once, the result of each lookup is memoized.
+    """
+
+    def __init__(self, topics: Iterable[str], queued_topics: Iterable[str] = ()):
+        """
+        Args:
+            topics (Iterable[str]): last-message-only topics
+            queued_topics (Iterable[str]): collect-all-messages-since-last-call topics
+        """
+        self.topics = list(topics)
+        self.queued_topics = list(queued_topics)
+        self.num_topics = len(self.topics) + len(self.queued_topics)
+        self._trie = {}
+        for queued, subscriptions in ((False, self.topics), (True, self.queued_topics)):
+            for topic in subscriptions:
+                node = self._trie
+                for char in topic:
+                    node = node.setdefault(char, {})
+                node[_END] = (topic, queued)
+        self._routes = {}
+
+    def route(self, topic: str) -> Union[Tuple[str, bool], None]:
+        """ Finds the longest subscribed topic which is a prefix of `topic`.
+
+        Args:
+            topic (str): topic of a received message
+
+        Returns:
+            tuple(subscribed topic, is queued topic) or `None` if no subscribed topic matches
+        """
+        try:
+            return self._routes[topic]
+        except KeyError:
+            pass
+        node = self._trie
+        match = node.get(_END)
+        for char in topic:
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(_END, match)
+        self._routes[topic] = match
+        return match
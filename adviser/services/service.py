@@ -17,12 +17,16 @@
 #
 ############################################################################################
 
+import asyncio
+import concurrent.futures
 import copy
 import datetime
 import inspect
+import os
 import pickle
 import threading
 import time
+import uuid
 from threading import Thread
 from typing import List, Dict, Union, Iterable, Any
 
@@ -30,12 +34,27 @@ import zmq
 from zmq import Context, Socket
 from zmq.devices import ThreadProxy, ProcessProxy
 
+from services.codec import MessageCodec, PickleCodec, default_codec
+from services.eventloop import get_event_loop
+from services.router import TopicRouter, split_topic
+from services.session import current_session, drop_session, reset_current_session, run_in_session, \
+    session_store, set_current_session, set_session_store
+from services.sessionstore import SessionStore
+from services.transport import LocalBus, LocalSocket
 from utils.domain.domain import Domain
 from utils.logger import DiasysLogger
 from utils.topics import Topic
 
 
-def _send_msg(pub_channel: Socket, topic: str, content: Any):
+_CONTROL_CODEC = PickleCodec()  # codec for control messages and ACK's (tiny payloads, never carry arrays)
+
+
+# interval between probe messages of the readiness handshake (seconds), see `DialogSystem._wait_until_ready`
+_PROBE_INTERVAL = 0.01
+
+
+def _send_msg(pub_channel: Socket, topic: str, content: Any, codec: MessageCodec = _CONTROL_CODEC,
+              session: Union[str, None] = None):
     """ Serializes message, appends current timespamp and sends it over the specified channel to the specified topic.
         Use this function for all internal message passing.
 
@@ -43,13 +62,40 @@ def _send_msg(pub_channel: Socket, topic: str, content: Any):
         pub_channel (Socket): publisher socket
         topic (str): topic to publish to
         content (Any): message content
+        codec (MessageCodec): codec used to serialize the message
+        session (Union[str, None]): id of the session the message belongs to (see `DialogSystem.start_session`)
      """
     timestamp = datetime.datetime.now().timestamp()  # current timestamp as POSIX float
-    data = pickle.dumps((timestamp, content))
-    pub_channel.send_multipart((bytes(topic, encoding="ascii"), data))
+    if isinstance(pub_channel, LocalSocket):
+        # in-process transport: no serialization required
+        pub_channel.send_msg(topic, timestamp, content, session)
+        return
+    frames = codec.encode(timestamp, content)
+    session_frame = b"" if session is None else bytes(session, encoding="ascii")
+    pub_channel.send_multipart([bytes(topic, encoding="ascii"), session_frame] + frames, copy=codec.copy_frames)
+
 
+def _recv_msg(sub_channel: Socket, codec: MessageCodec = _CONTROL_CODEC, copy: bool = True):
+    """ Blocks until a message is received via the specified subscriber channel, then deserializes it.
+
+    Args:
+        sub_channel (Socket): subscriber socket
+        codec (MessageCodec): codec used to deserialize the message
+        copy (bool): if False, buffers sent out-of-band are not copied when received
+
+    Returns:
+        tuple(topic, timestamp, content, session)
+    """
+    if isinstance(sub_channel, LocalSocket):
+        return sub_channel.recv_msg()
+    msg = sub_channel.recv_multipart(copy=copy)
+    topic = (msg[0] if copy else msg[0].bytes).decode("ascii")
+    session = (msg[1] if copy else msg[1].bytes).decode("ascii") or None
+    timestamp, content = codec.decode(msg[2:])
+    return topic, timestamp, content, session
 
-def _send_ack(pub_channel: Socket, topic: str, content: bool = True):
+
+def _send_ack(pub_channel: Socket, topic: str, content: bool = True, session: Union[str, None] = None):
     """ Sends an acknowledge-message to the specified channel (ACK).
         Is used together with `_recv_ack` to synchronize services (waiting for ACK messages).
     
@@ -57,11 +103,12 @@ def _send_ack(pub_channel: Socket, topic: str, content: bool = True):
         pub_channel (Socket): publisher socket
         topic (str): topic to send ACK to
         content (bool): for ACK's, content is either `True` (ACK) or `False` (NACK)
+        session (Union[str, None]): session the acknowledged message belonged to
     """
-    _send_msg(pub_channel, f"ACK/{topic}", content)
+    _send_msg(pub_channel, f"ACK/{topic}", content, session=session)
 
 
-def _recv_ack(sub_channel: Socket, topic: str, expected_content: bool = True):
+def _recv_ack(sub_channel: Socket, topic: str, expected_content: bool = True, session: Union[str, None] = None):
     """ Blocks until an acknowledge-message for the specified topic with the expected content is received via the
         specified subscriber channel. 
     
@@ -69,17 +116,172 @@ def _recv_ack(sub_channel: Socket, topic: str, expected_content: bool = True):
         sub_channel (Socket): subscriber socket
         topic (str): topic to listen for ACK's
         expected_content (bool): are we expecting `True` (ACK) or `False` (NACK)
+        session (Union[str, None]): session the acknowledged message belonged to
     """
     ack_topic = topic if topic.startswith("ACK/") else f"ACK/{topic}"
     while True:
-        msg = sub_channel.recv_multipart(copy=True)
-        recv_topic = msg[0].decode("ascii")
-        content = pickle.loads(msg[1])[1]  # pickle.loads(msg) -> tuple(timestamp, content) -> return content
-        if recv_topic == ack_topic:
+        recv_topic, _, content, recv_session = _recv_msg(sub_channel)
+        if recv_topic == ack_topic and recv_session == session:
             if content == expected_content:
                 return
 
 
+def _recv_acks(sub_channel: Socket, topics: Iterable[str], timeout: float = None,
+               expected_content: bool = True, session: Union[str, None] = None,
+               rejected: List[str] = None) -> List[str]:
+    """ Blocks until acknowledge-messages for all specified topics with the expected content are received via the
+        specified subscriber channel, in any order. Send the messages to be acknowledged to all topics first, so that
+        the receivers can process them concurrently.
+
+    Args:
+        sub_channel (Socket): subscriber socket
+        topics (Iterable[str]): topics to listen for ACK's
+        timeout (float): maximum time to wait for all ACK's in seconds (`None` waits forever)
+        expected_content (bool): are we expecting `True` (ACK) or `False` (NACK)
+        session (Union[str, None]): session the acknowledged messages belonged to
+        rejected (List[str]): if given, topics answered with the opposite content are appended to this list
+                              instead of waiting for their ACK's
+
+    Returns:
+        List of topics not acknowledged before the timeout (empty if all topics were acknowledged)
+    """
+    pending = {topic if topic.startswith("ACK/") else f"ACK/{topic}": topic for topic in topics}
+    deadline = None if timeout is None else time.time() + timeout
+    while pending:
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not sub_channel.poll(remaining * 1000, zmq.POLLIN):
+                break
+        recv_topic, _, content, recv_session = _recv_msg(sub_channel)
+        if recv_topic in pending and recv_session == session:
+            if content == expected_content:
+                del pending[recv_topic]
+            elif rejected is not None:
+                rejected.append(pending.pop(recv_topic))
+    return list(pending.values())
+
+
+class _Listener:
+    """ Collects the messages received for a function decorated with `PublishSubscribe`.
+        Calls the function as soon as at least one value was received for each subscribed topic.
+        Messages of different sessions are collected separately.
+    """
+
+    def __init__(self, service: 'Service', func_instance, topics: Iterable[str], queued_topics: Iterable[str],
+                 start_topic: str, end_topic: str, terminate_topic: str, probe_topic: str):
+        """
+        Args:
+            service (Service): service owning `func_instance`
+            func_instance (function instance): the decorated subscriber function instance to be called with the received messages
+            topics (Iterable[str]): all last-message-only topics the decorated `func_instance` subscribes to
+            queued_topics (Iterable[str]): all collect-all-messages-since-last-call topics the decorated `func_instance` subscribes to
+            start_topic (str): Control message topic to set this listener into listening mode for a session
+                               (receive all non-control messages of this session)
+            end_topic (str): Control message topic to set this listener into non-listening mode for a session
+                             (ignore all non-control messages of this session)
+            terminate_topic (str): Control message topic to stop this listener
+            probe_topic (str): Control message topic confirming that the subscriptions of this listener are live
+        """
+        self.service = service
+        self.func_instance = func_instance
+        self.start_topic = start_topic
+        self.end_topic = end_topic
+        self.terminate_topic = terminate_topic
+        self.probe_topic = probe_topic
+        self.router = TopicRouter(topics, queued_topics)
+        self.sessions = {}  # active session -> (values, timestamps)
+        self.terminated = False
+        self.ready = False  # received a probe message
+
+    def control(self, topic: str, session: Union[str, None] = None) -> bool:
+        """ Handles control messages for this listener.
+
+        Args:
+            topic (str): topic of a received message
+            session (Union[str, None]): session of the received message
+
+        Returns:
+            True if `topic` is one of the control topics of this listener, else False
+        """
+        if topic == self.start_topic:
+            # reset values and start listening to non-control messages
+            self.sessions[session] = ({}, {})
+        elif topic == self.end_topic:
+            # ignore all non-control messages
+            self.sessions.pop(session, None)
+        elif topic == self.terminate_topic:
+            # shutdown listener
+            self.sessions.clear()
+            self.terminated = True
+        elif topic == self.probe_topic:
+            self.ready = True
+        else:
+            return False
+        return True
+
+    def receive(self, topic: str, timestamp: float, content: Any, session: Union[str, None] = None):
+        """ Handles a non-control message, calls the decorated function once all arguments are available """
+        if session not in self.sessions:
+            return  # not listening
+        values, timestamps = self.sessions[session]
+        service = self.service
+        func_instance = self.func_instance
+        if service.debug_logger:
+            service.debug_logger.info(
+                f"- (DS): listener thread for function {func_instance}:\n   received for topic {topic}:\n   {content}")
+
+        # simple synchronization mechanism: remember only newest values,
+        # store them until there was at least 1 new value received per topic.
+        # Then call callback function with complete set of values.
+        # Reset values afterwards and start collecting again.
+
+        # problem: routing based on prefixes -> function argument names may differ
+        # solution: find longest subscribed topic which is a prefix of the received topic
+        route = self.router.route(topic)
+        if route is None:
+            return
+        arg_name, queued = route
+        if not queued:
+            # store only latest value
+            values[arg_name] = content  # set value for received topic
+            timestamps[arg_name] = timestamp  # set timestamp for received value
+        else:
+            # topic is a queued_topic - queue all values and their timestamps
+            if not arg_name in values:
+                values[arg_name] = []
+                timestamps[arg_name] = []
+            values[arg_name].append(content)
+            timestamps[arg_name].append(timestamp)
+
+        if len(values) == self.router.num_topics:
+            # received a new value for each topic -> call callback function
+            if func_instance.timestamp_enabled:
+                # append timestamps, if required
+                values['timestamps'] = timestamps
+            if service.debug_logger:
+                service.debug_logger.info(
+                    f"- (DS): received all messages for function {func_instance}\n   -> CALLING function")
+            # reset values (the dict itself is unpacked into keyword arguments and can be reused,
+            # but timestamps may be handed to the function)
+            self.sessions[session] = (values, {})
+            store = session_store(service)
+            store.acquire(session)  # keep the dialog state of this session in memory during the call
+            token = set_current_session(session)
+            try:
+                if service.__class__ == Service:
+                    # NOTE workaround for publisher / subscriber without being an instance method
+                    result = func_instance(**values)
+                else:
+                    result = func_instance(service, **values)
+                if func_instance.is_async:
+                    # don't wait for the coroutine, keep receiving messages while it runs on the event loop
+                    service._schedule(result, session)
+            finally:
+                reset_current_session(token)
+                store.release(session)
+                values.clear()
+
+
 class RemoteService:
     """
     This is a placeholder` to be used in the service list argument when constructing a `DialogSystem`:
@@ -110,6 +312,10 @@ class Service:
           (or calling `run_standalone()` in the remote case and adding a corresponding `RemoteService` to the `DialogSystem`).
     """
 
+    # set to False in services which can only serve one user at a time (e.g. reading from the console or a camera),
+    # they reject all sessions except the default one (see `DialogSystem.start_session`)
+    multi_session = True
+
     def __init__(self, domain: Union[str, Domain] = "", sub_topic_domains: Dict[str, str] = {}, pub_topic_domains: Dict[str, str] = {},
                  ds_host_addr: str = "127.0.0.1", sub_port: int = 65533, pub_port: int = 65534, protocol: str = "tcp",
                  debug_logger: DiasysLogger = None, identifier: str = None):
@@ -155,6 +361,19 @@ class Service:
 
         self.debug_logger = debug_logger
 
+        # serializes published messages, see services.codec (can be overwritten by the `DialogSystem`)
+        self._codec = default_codec()
+        # in-process message bus, set by a `DialogSystem` using the `local` transport (else: zmq)
+        self._local_bus = None
+        # 'threads': one listener thread per decorated function, 'poller': one loop multiplexing all sockets
+        # (can be overwritten by the `DialogSystem`)
+        self._listener_mode = 'threads'
+        self._poller_listeners = dict()  # poller mode: subscriber socket -> listener
+        # calls of `async` functions still running on the event loop
+        self._pending_calls = {}  # future -> session
+        self._pending_calls_lock = threading.Lock()
+        self._rejected_sessions = set()  # sessions refused by a single-user service (see `multi_session`)
+
         self._sub_topics = set()
         self._pub_topics = set()
         self._publish_sockets = dict()
@@ -162,18 +381,25 @@ class Service:
         self._internal_start_topics = dict()
         self._internal_end_topics = dict()
         self._internal_terminate_topics = dict()
+        self._internal_probe_topics = dict()
+        self._unready_probe_topics = set()  # threads mode: probe topics of listeners which did not respond yet
 
         # NOTE: class name + memory pointer make topic unique (required, e.g. for running mutliple instances of same module!)
         self._start_topic = f"{type(self).__name__}/{id(self)}/START"
         self._end_topic = f"{type(self).__name__}/{id(self)}/END"
         self._terminate_topic = f"{type(self).__name__}/{id(self)}/TERMINATE"
+        self._probe_topic = f"{type(self).__name__}/{id(self)}/PROBE"
         self._train_topic = f"{type(self).__name__}/{id(self)}/TRAIN"
         self._eval_topic = f"{type(self).__name__}/{id(self)}/EVAL"
 
+    def _socket_context(self):
+        """ Returns the factory for all sockets of this service: the local bus if set, else the zmq context """
+        return self._local_bus if self._local_bus is not None else Context.instance()
+
     def _init_pubsub(self): 
         """ Search for all functions decorated with the `PublishSubscribe` decorator and call the setup methods for them """
         for func_name in dir(self):
-            func_inst = getattr(self, func_name)
+            func_inst = getattr(self, func_name, None)  # `SessionAttribute`s may not be set outside of dialogs
             if hasattr(func_inst, "pubsub"):
                 # found decorated publisher / subscriber function -> setup sockets and listeners
                 self._setup_listener(func_inst, getattr(func_inst, "sub_topics"),
@@ -183,11 +409,15 @@ class Service:
     def _register_with_dialogsystem(self):
         """ Start listening to dialog system control channel messages """
         self._setup_dialog_ctrl_msg_listener()
-        Thread(target=self._control_channel_listener).start()
+        if self._listener_mode == 'poller':
+            Thread(target=self._poller_loop).start()
+        else:
+            Thread(target=self._control_channel_listener).start()
 
     def _setup_listener(self, func_instance, topics: List[str], queued_topics: List[str]):
         """
         Starts a new subscription thread for a function decorated with `services.service.PublishSubscribe`.
+        In poller mode, the subscription is handed to the poller loop instead.
         
         Args:
             func_instance (function): instance of the function that was decorated with `services.service.PublishSubscribe`.
@@ -201,7 +431,7 @@ class Service:
         assert set(topics).isdisjoint(queued_topics), "sub_topics and queued_sub_topics have to be disjoint!"
 
         # setup socket
-        ctx = Context.instance()
+        ctx = self._socket_context()
         subscriber = ctx.socket(zmq.SUB)
         # subscribe to all listed topics
         for topic in topics + queued_topics:
@@ -214,17 +444,29 @@ class Service:
         subscriber.setsockopt(zmq.SUBSCRIBE, bytes(f"{func_instance}/START", encoding="ascii"))
         subscriber.setsockopt(zmq.SUBSCRIBE, bytes(f"{func_instance}/END", encoding="ascii"))
         subscriber.setsockopt(zmq.SUBSCRIBE, bytes(f"{func_instance}/TERMINATE", encoding="ascii"))
+        subscriber.setsockopt(zmq.SUBSCRIBE, bytes(f"{func_instance}/PROBE", encoding="ascii"))
         subscriber.connect(f"{self._protocol}://{self._host_addr}:{self._sub_port}")
         self._internal_start_topics[f"{str(func_instance)}/START"] = str(func_instance)
         self._internal_end_topics[f"{str(func_instance)}/END"] = str(func_instance)
         self._internal_terminate_topics[f"{str(func_instance)}/TERMINATE"] = str(func_instance)
+        self._internal_probe_topics[f"{str(func_instance)}/PROBE"] = str(func_instance)
+
+        if self._listener_mode == 'poller':
+            # register listener with poller loop (started in `_register_with_dialogsystem`)
+            listener = _Listener(self, func_instance, topics, queued_topics, f"{str(func_instance)}/START",
+                                 f"{str(func_instance)}/END", f"{str(func_instance)}/TERMINATE",
+                                 f"{str(func_instance)}/PROBE")
+            self._poller_listeners[subscriber] = listener
+            self._sub_topics.update(topics + queued_topics)
+            return
 
         # register and run listener thread
         listener_thread = Thread(target=self._receiver_thread, args=(subscriber, func_instance,
                                                                      topics, queued_topics,
                                                                      f"{str(func_instance)}/START",
                                                                      f"{str(func_instance)}/END",
-                                                                     f"{str(func_instance)}/TERMINATE"))
+                                                                     f"{str(func_instance)}/TERMINATE",
+                                                                     f"{str(func_instance)}/PROBE"))
         listener_thread.start()
 
         # add to list of local topics
@@ -237,7 +479,7 @@ class Service:
             return # no topics - no need for a socket
 
         # setup publish socket
-        ctx = Context.instance()
+        ctx = self._socket_context()
         publisher = ctx.socket(zmq.PUB)
         publisher.sndhwm = 1100000
         publisher.connect(f"{self._protocol}://{self._host_addr}:{self._pub_port}")
@@ -249,13 +491,14 @@ class Service:
     def _setup_dialog_ctrl_msg_listener(self):
         """ Setup a subscriber socket to receive `DialogSystem` control message """ 
          
-        ctx = Context.instance()
+        ctx = self._socket_context()
 
         # setup receiver for dialog system control messages
         self._control_channel_sub = ctx.socket(zmq.SUB)
         self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(self._start_topic, encoding="ascii"))
         self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(self._end_topic, encoding="ascii"))
         self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(self._terminate_topic, encoding="ascii"))
+        self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(self._probe_topic, encoding="ascii"))
         self._control_channel_sub.connect(f"{self._protocol}://{self._host_addr}:{self._sub_port}")
 
         # setup sender for dialog system control message acknowledgements 
@@ -263,13 +506,18 @@ class Service:
         self._control_channel_pub.sndhwm = 1100000
         self._control_channel_pub.connect(f"{self._protocol}://{self._host_addr}:{self._pub_port}")
 
+        if self._listener_mode == 'poller':
+            return  # listeners are controlled directly, no internal ACK messages
+
         # setup receiver for internal ACK messages
         self._internal_control_channel_sub = ctx.socket(zmq.SUB)
         for internal_ctrl_topic in list(self._internal_end_topics.keys()) + list(
-                self._internal_start_topics.keys()) + list(self._internal_terminate_topics.keys()):
+                self._internal_start_topics.keys()) + list(self._internal_terminate_topics.keys()) + list(
+                self._internal_probe_topics.keys()):
             self._internal_control_channel_sub.setsockopt(zmq.SUBSCRIBE,
                                                           bytes(f"ACK/{internal_ctrl_topic}", encoding="ascii"))
         self._internal_control_channel_sub.connect(f"{self._protocol}://{self._host_addr}:{self._sub_port}")
+        self._unready_probe_topics = set(self._internal_probe_topics)
 
     def _control_channel_listener(self):
         """ Using the control message subscription socket, listen to control messages from the `DialogSystem` in a loop.
@@ -279,43 +527,8 @@ class Service:
         while listen:
             try:
                 # receive message for subscribed control topic
-                msg = self._control_channel_sub.recv_multipart(copy=True)
-                topic = msg[0].decode("ascii")
-                timestamp, content = pickle.loads(msg[1])
-
-                if topic == self._start_topic:
-                    # initialize dialog state
-                    self.dialog_start()
-                    # set all listeners of this service to listening mode (block until they are listening)
-                    for internal_start_topic in self._internal_start_topics:
-                        _send_msg(self._control_channel_pub, internal_start_topic, True)
-                        _recv_ack(self._internal_control_channel_sub, internal_start_topic)
-                    _send_ack(self._control_channel_pub, self._start_topic)
-                elif topic == self._end_topic:
-                    # stop all listeners of this service (block until they stopped)
-                    for internal_end_topic in self._internal_end_topics:
-                        _send_msg(self._control_channel_pub, internal_end_topic, True)
-                        _recv_ack(self._internal_control_channel_sub, internal_end_topic, True)
-                    self.dialog_end()
-                    _send_ack(self._control_channel_pub, self._end_topic)
-                elif topic == self._terminate_topic:
-                    # terminate all listeners of this service (block until they stopped)
-                    for internal_terminate_topic in self._internal_terminate_topics:
-                        _send_msg(self._control_channel_pub, internal_terminate_topic, True)
-                        _recv_ack(self._internal_control_channel_sub, internal_terminate_topic, True)
-                    self.dialog_exit()
-                    _send_ack(self._control_channel_pub, self._terminate_topic)
-                    listen = False
-                elif topic == self._train_topic:
-                    self.train()
-                    _send_ack(self._control_channel_pub, self._train_topic)
-                elif topic == self._eval_topic:
-                    self.eval()
-                    _send_ack(self._control_channel_pub, self._eval_topic)
-                else:
-                    if self.debug_logger:
-                        self.debug_logger.info("- (Service): received unknown control message from topic", topic,
-                                               " with content", content)
+                topic, timestamp, content, session = _recv_msg(self._control_channel_sub)
+                listen = self._handle_control_msg(topic, content, session)
             except KeyboardInterrupt:
                 break
             except:
@@ -323,6 +536,162 @@ class Service:
                 print("ERROR in Service: _control_channel_listener")
                 traceback.print_exc()
 
+    def _poller_loop(self):
+        """ Poller mode: receives the messages for all decorated functions and the `DialogSystem` control messages
+            in a single loop, until a terminate message is received.
+            Meant to be called in a thread.
+        """
+        poller = self._local_bus.poller() if self._local_bus is not None else zmq.Poller()
+        poller.register(self._control_channel_sub, zmq.POLLIN)
+        for subscriber in self._poller_listeners:
+            poller.register(subscriber, zmq.POLLIN)
+
+        listen = True
+        while listen:
+            try:
+                for socket, _ in poller.poll():
+                    if socket is self._control_channel_sub:
+                        topic, timestamp, content, session = _recv_msg(socket)
+                        listen = self._handle_control_msg(topic, content, session)
+                    else:
+                        # NOTE: don't copy received buffers, large payloads (e.g. arrays) can be rebuilt in-place
+                        topic, timestamp, content, session = _recv_msg(socket, self._codec, copy=False)
+                        listener = self._poller_listeners[socket]
+                        if not listener.control(topic, session):
+                            listener.receive(topic, timestamp, content, session)
+            except KeyboardInterrupt:
+                break
+            except:
+                import traceback
+                print("ERROR in Service: _poller_loop")
+                traceback.print_exc()
+        # shutdown
+        for subscriber in self._poller_listeners:
+            subscriber.close()
+
+    def _schedule(self, coroutine, session: Union[str, None] = None):
+        """ Runs the coroutine returned by an `async` decorated function on the event loop of this process """
+        session_store(self).acquire(session)  # released once the call finished
+        future = asyncio.run_coroutine_threadsafe(run_in_session(coroutine, session), get_event_loop())
+        with self._pending_calls_lock:
+            self._pending_calls[future] = session
+        future.add_done_callback(self._async_call_done)
+
+    def _async_call_done(self, future: concurrent.futures.Future):
+        with self._pending_calls_lock:
+            session = self._pending_calls.pop(future, None)
+        session_store(self).release(session)
+        if not future.cancelled() and future.exception() is not None:
+            import traceback
+            print("ERROR in Service: async function")
+            traceback.print_exception(type(future.exception()), future.exception(), future.exception().__traceback__)
+
+    def _wait_for_pending_calls(self, session: Union[str, None] = None, all_sessions: bool = False):
+        """ Blocks until all running `async` function calls of the given session (or of all sessions) finished """
+        with self._pending_calls_lock:
+            pending = [future for future, call_session in self._pending_calls.items()
+                       if all_sessions or call_session == session]
+        concurrent.futures.wait(pending)
+
+    def _forward_ctrl_msg(self, internal_topics: Iterable[str], session: Union[str, None] = None):
+        """ Forwards a control message to the listeners of all decorated functions (blocks until they received it) """
+        if self._listener_mode == 'poller':
+            # listeners run in the same loop as the control channel: update them directly
+            for internal_topic in internal_topics:
+                for listener in self._poller_listeners.values():
+                    listener.control(internal_topic, session)
+            return
+        # notify all listeners first, then wait for all of them
+        for internal_topic in internal_topics:
+            _send_msg(self._control_channel_pub, internal_topic, True, session=session)
+        _recv_acks(self._internal_control_channel_sub, internal_topics, session=session)
+
+    def _probe_listeners(self) -> bool:
+        """ Sends a probe message to all listeners which did not receive one yet.
+
+        Returns:
+            True if all listeners received a probe message (i.e. their subscriptions are live), else False
+        """
+        if self._listener_mode == 'poller':
+            # the poller loop marks listeners as ready once their probe message arrived
+            unready = [listener.probe_topic for listener in self._poller_listeners.values() if not listener.ready]
+            for probe_topic in unready:
+                _send_msg(self._control_channel_pub, probe_topic, True)
+            return len(unready) == 0
+        for probe_topic in self._unready_probe_topics:
+            _send_msg(self._control_channel_pub, probe_topic, True)
+        self._unready_probe_topics = set(_recv_acks(self._internal_control_channel_sub, self._unready_probe_topics,
+                                                    _PROBE_INTERVAL))
+        return len(self._unready_probe_topics) == 0
+
+    def _handle_control_msg(self, topic: str, content: Any, session: Union[str, None] = None) -> bool:
+        """ Handles a control message from the `DialogSystem`.
+
+        Args:
+            topic (str): control message topic
+            content (Any): control message content
+            session (Union[str, None]): session the control message belongs to
+
+        Returns:
+            False if the service was terminated, else True
+        """
+        store = session_store(self)
+        store.acquire(session)
+        token = set_current_session(session)
+        try:
+            return self._handle_session_control_msg(topic, content, session)
+        finally:
+            reset_current_session(token)
+            store.release(session)
+
+    def _handle_session_control_msg(self, topic: str, content: Any, session: Union[str, None]) -> bool:
+        if topic == self._start_topic:
+            if session is not None and not self.multi_session:
+                # single-user service: refuse the session (NACK), the `DialogSystem` ends it again
+                self._rejected_sessions.add(session)
+                _send_ack(self._control_channel_pub, self._start_topic, False, session=session)
+                return True
+            # initialize dialog state
+            self.dialog_start()
+            # set all listeners of this service to listening mode (block until they are listening)
+            self._forward_ctrl_msg(self._internal_start_topics, session)
+            _send_ack(self._control_channel_pub, self._start_topic, session=session)
+        elif topic == self._end_topic and session in self._rejected_sessions:
+            # session was never started
+            self._rejected_sessions.discard(session)
+            _send_ack(self._control_channel_pub, self._end_topic, session=session)
+        elif topic == self._end_topic:
+            # stop all listeners of this service (block until they stopped and all async calls finished)
+            self._forward_ctrl_msg(self._internal_end_topics, session)
+            self._wait_for_pending_calls(session)
+            self.dialog_end()
+            drop_session(self, session)
+            _send_ack(self._control_channel_pub, self._end_topic, session=session)
+        elif topic == self._terminate_topic:
+            # terminate all listeners of this service (block until they stopped and all async calls finished)
+            self._forward_ctrl_msg(self._internal_terminate_topics)
+            self._wait_for_pending_calls(all_sessions=True)
+            self.dialog_exit()
+            session_store(self).close()
+            _send_ack(self._control_channel_pub, self._terminate_topic)
+            return False
+        elif topic == self._probe_topic:
+            # readiness handshake: only confirm once the subscriptions of all listeners are live,
+            # the `DialogSystem` keeps probing until then
+            if self._probe_listeners():
+                _send_ack(self._control_channel_pub, self._probe_topic)
+        elif topic == self._train_topic:
+            self.train()
+            _send_ack(self._control_channel_pub, self._train_topic)
+        elif topic == self._eval_topic:
+            self.eval()
+            _send_ack(self._control_channel_pub, self._eval_topic)
+        else:
+            if self.debug_logger:
+                self.debug_logger.info("- (Service): received unknown control message from topic", topic,
+                                       " with content", content)
+        return True
+
     def dialog_start(self):
         """ This function is called before the first message to a new dialog is published.
             You should overwrite this function to set/reset dialog-level variables. """
@@ -346,7 +715,7 @@ class Service:
         """ Sets module to eval mode """
         self.is_training = False
 
-    def run_standalone(self, host_reg_port: int = 65535):
+    def run_standalone(self, host_reg_port: int = 65535, codec: MessageCodec = None, listener_mode: str = 'threads'):
         """
         Run this service as a standalone serivce (without a `DialogSystem`) on a remote node.
         Use a `RemoteService` with *corresponding identifier* on the `DialogSystem` node to connect both.
@@ -354,9 +723,15 @@ class Service:
 
         Args:
             host_reg_port (int): The port on the `DialogSystem` node listening for `Service` register requests
+            codec (MessageCodec): codec for serializing published messages (default: `services.codec.default_codec()`)
+            listener_mode (str): `threads` or `poller`, see `DialogSystem`
         """
         assert self._identifier is not None, "running a service on a remote node requires a unique identifier"
+        assert listener_mode in ('threads', 'poller'), "listener_mode has to be either 'threads' or 'poller'"
         print("Waiting for dialog system host...")
+        if codec is not None:
+            self._codec = codec
+        self._listener_mode = listener_mode
 
         # send service info to dialog system node
         self._init_pubsub()
@@ -364,7 +739,7 @@ class Service:
         sync_endpoint = ctx.socket(zmq.REQ)
         sync_endpoint.connect(f"tcp://{self._host_addr}:{host_reg_port}")
         data = pickle.dumps((self._domain_name, self._sub_topics, self._pub_topics, self._start_topic, self._end_topic,
-                             self._terminate_topic))
+                             self._terminate_topic, self._probe_topic))
         sync_endpoint.send_multipart((bytes(f"REGISTER_{self._identifier}", encoding="ascii"), data))
 
         # wait for registration confirmation
@@ -397,7 +772,7 @@ class Service:
 
     def _receiver_thread(self, subscriber: Socket, func_instance,
                          topics: Iterable[str], queued_topics: Iterable[str],
-                         start_topic: str, end_topic: str, terminate_topic: str):
+                         start_topic: str, end_topic: str, terminate_topic: str, probe_topic: str):
         """
         Loop for receiving messages.
         Will continue until a message for `terminate_topic` is received.
@@ -416,88 +791,26 @@ class Service:
             end_topic (str): Control message topic to set this specific `function_instance` into non-listening mode (ignore all non-control messages)
             terminate_topic (str): Control message topic to end the listener loop for this specific `function_instance`. 
                                    Also closes the socket before returning.
+            probe_topic (str): Control message topic confirming that the subscriptions of this `function_instance` are live
         """
 
-        ctx = Context.instance()
+        ctx = self._socket_context()
         control_channel_pub = ctx.socket(zmq.PUB)
         control_channel_pub.sndhwm = 1100000
         control_channel_pub.connect(f"{self._protocol}://{self._host_addr}:{self._pub_port}")
 
-        values = {}
-        timestamps = {}
-        all_sub_topics = topics + queued_topics
-        num_topics = len(all_sub_topics)
-        active = False
-        terminating = False
-
-        while not terminating:
+        listener = _Listener(self, func_instance, topics, queued_topics, start_topic, end_topic, terminate_topic,
+                             probe_topic)
+        while not listener.terminated:
             try:
-                msg = subscriber.recv_multipart(copy=True)
-                topic = msg[0].decode("ascii")
+                # NOTE: don't copy received buffers, large payloads (e.g. arrays) can be rebuilt in-place
+                topic, timestamp, content, session = _recv_msg(subscriber, self._codec, copy=False)
                 # based on topic, decide what to do
-                if topic == start_topic:
-                    # reset values and start listening to non-control messages
-                    values = {}
-                    timestamps = {}
-                    active = True
-                    _send_ack(control_channel_pub, start_topic)
-                elif topic == end_topic:
-                    # ignore all non-control messages
-                    active = False
-                    _send_ack(control_channel_pub, end_topic)
-                elif topic == terminate_topic:
-                    # shutdown listener thread by exiting loop
-                    active = False
-                    _send_ack(control_channel_pub, terminate_topic)
-                    terminating = True
+                if listener.control(topic, session):
+                    _send_ack(control_channel_pub, topic, session=session)
                 else:
                     # non-control message
-                    if active:
-                        # process message
-                        timestamp, content = pickle.loads(msg[1])
-                        if self.debug_logger:
-                            self.debug_logger.info(
-                                f"- (DS): listener thread for function {func_instance}:\n   received for topic {topic}:\n   {content}")
-
-                        # simple synchronization mechanism: remember only newest values,
-                        # store them until there was at least 1 new value received per topic.
-                        # Then call callback function with complete set of values.
-                        # Reset values afterwards and start collecting again.
-
-                        # problem: routing based on prefixes -> function argument names may differ
-                        # solution: find longest common prefix of argument name and received topic
-                        common_prefix = ""
-                        for key in all_sub_topics:
-                            if topic.startswith(key) and len(topic) > len(common_prefix):
-                                common_prefix = key
-                        if common_prefix in topics:
-                            # store only latest value
-                            values[common_prefix] = content  # set value for received topic
-                            timestamps[common_prefix] = timestamp  # set timestamp for received value
-                        else:
-                            # topic is a queued_topic - queue all values and their timestamps
-                            if not common_prefix in values:
-                                values[common_prefix] = []
-                                timestamps[common_prefix] = []
-                            values[common_prefix].append(content)
-                            timestamps[common_prefix].append(timestamp)
-
-                        if len(values) == num_topics:
-                            # received a new value for each topic -> call callback function
-                            if func_instance.timestamp_enabled:
-                                # append timestamps, if required
-                                values['timestamps'] = timestamps
-                            if self.debug_logger:
-                                self.debug_logger.info(
-                                    f"- (DS): received all messages for function {func_instance}\n   -> CALLING function")
-                            if self.__class__ == Service:
-                                # NOTE workaround for publisher / subscriber without being an instance method
-                                func_instance(**values)
-                            else:
-                                func_instance(self, **values)
-                            # reset values
-                            values = {}
-                            timestamps = {}
+                    listener.receive(topic, timestamp, content, session)
             except KeyboardInterrupt:
                 break
             except:
@@ -537,28 +850,33 @@ def PublishSubscribe(sub_topics: List[str] = [], pub_topics: List[str] = [], que
         * sub_topics and queued_sub_topics have to be disjoint!
         * If you need timestamps for your messages, specify a 'timestamps' argument in your subscribing function.
           It will be filled by a dictionary providing timestamps for each received value, indexed by name.
+        * Decorated functions may be coroutines (`async def`). They are run on an event loop shared by all services
+          of the process (see services.eventloop), so the service keeps receiving messages while they wait,
+          e.g. for web requests (use `services.eventloop.run_blocking` to wrap blocking calls).
+          A dialog only ends after all running calls finished.
+        * Messages are delivered per session (see `DialogSystem.start_session`): your function is only called with
+          values from the same session and its results are published to that session.
+          Keep dialog-level state of your service in `services.session.SessionAttribute`s.
     
     Technical notes:
         * Data will be automatically pickled / unpickled during send / receive to reduce meassage size.
           However, some python objects are not serializable (e.g. database connections) for good reasons
           and will throw an error if you try to publish them.
+        * Large buffers (e.g. numpy arrays) are sent as separate frames and not copied on receive
+          (see services.codec.ZeroCopyCodec). Received arrays may therefore be read-only.
         * The domain name of your service class will be appended to your publish topics.
           Subscription topics are prefix-matched, so you will receive all messages from 'topic/suffix'
           if you subscibe to 'topic'.
     """
 
     def wrapper(func):
-        def delegate(self, *args, **kwargs):
-            func_inst = getattr(self, func.__name__)
-
-            callargs = list(args)
-            if self in callargs:    # remove self when in *args, because already known to function
-                callargs.remove(self)
-            result = func(self, *callargs, **kwargs)
+        def publish(self, func_inst, result):
+            """ Publishes the values returned by the decorated function """
             if result:
                 # fix! (user could have multiple "/" characters in topic - only use last one )
-                domains = {res.split("/")[0]: res.split("/")[1] if "/" in res else "" for res in result}
-                result = {key.split("/")[0]: result[key] for key in result}
+                split_keys = [(split_topic(key), key) for key in result]
+                domains = {name: domain for (name, domain), _ in split_keys}
+                result = {name: result[key] for (name, _), key in split_keys}
 
             if func_inst not in self._publish_sockets:
                 # not a publisher, just normal function
@@ -575,17 +893,41 @@ def PublishSubscribe(sub_topics: List[str] = [], pub_topics: List[str] = [], que
                         topic_domain_str = f"{topic}/{domain}" if domain else topic
                         if topic in self._pub_topic_domains:
                             topic_domain_str = f"{topic}/{self._pub_topic_domains[topic]}" if self._pub_topic_domains[topic] else topic
-                        _send_msg(socket, topic_domain_str, result[topic])
+                        _send_msg(socket, topic_domain_str, result[topic], self._codec, current_session())
                         if self.debug_logger:
                             self.debug_logger.info(
                                 f"- (DS): sent message from {func} to topic {topic_domain_str}:\n   {result[topic]}")
             return result
 
+        if inspect.iscoroutinefunction(func):
+            async def delegate(self, *args, **kwargs):
+                func_inst = getattr(self, func.__name__)
+
+                callargs = list(args)
+                if self in callargs:    # remove self when in *args, because already known to function
+                    callargs.remove(self)
+                result = await func(self, *callargs, **kwargs)
+                return publish(self, func_inst, result)
+        else:
+            def delegate(self, *args, **kwargs):
+                func_inst = getattr(self, func.__name__)
+
+                callargs = list(args)
+                if self in callargs:    # remove self when in *args, because already known to function
+                    callargs.remove(self)
+                result = func(self, *callargs, **kwargs)
+                return publish(self, func_inst, result)
+
+        # name the delegate after the decorated function: its string representation identifies the listener
+        # of this function in internal control topics
+        delegate.__name__ = func.__name__
+        delegate.__qualname__ = func.__qualname__
         # declare function as publish / subscribe functions and attach the respective topics
         delegate.pubsub = True
         delegate.sub_topics = sub_topics
         delegate.queued_sub_topics = queued_sub_topics
         delegate.pub_topics = pub_topics
+        delegate.is_async = inspect.iscoroutinefunction(func)
         # check arguments: is subsriber interested in timestamps?
         delegate.timestamp_enabled = 'timestamps' in inspect.getfullargspec(func)[0]
 
@@ -603,7 +945,10 @@ class DialogSystem:
     """
 
     def __init__(self, services: List[Union[Service, RemoteService]], sub_port: int = 65533, pub_port: int = 65534,
-                 reg_port: int = 65535, protocol: str = 'tcp', debug_logger: DiasysLogger = None):
+                 reg_port: int = 65535, protocol: str = 'tcp', debug_logger: DiasysLogger = None,
+                 codec: MessageCodec = None, transport: str = 'zmq', listener_mode: str = 'threads',
+                 ack_timeout: float = None, max_sessions: int = None, session_ttl: float = None,
+                 spill_dir: str = None):
         """
         Args:
             services (List[Union[Service, RemoteService]]): List of all (remote) services to connect to.
@@ -618,10 +963,33 @@ class DialogSystem:
             debug_logger (DiasysLogger): If not `None`, all messags are printed to the logger, including send/receive events.
                                 Can be useful for debugging because you can still see messages received by the `DialogSystem`
                                 even if they are never forwarded (as expected) to your `Service`
+            codec (MessageCodec): codec for serializing messages published by all local services
+                                  (default: `services.codec.default_codec()`, sending large arrays as separate frames)
+            transport (str): `zmq` routes all messages through a zmq proxy (required for remote services).
+                             `local` passes messages directly to the subscribers' queues within this process,
+                             without serialization. Subscribers then receive the published object itself, so they
+                             should not modify received messages.
+            listener_mode (str): `threads` runs one listener thread per decorated function of each local service.
+                                 `poller` runs a single loop per local service, polling the sockets of all its
+                                 decorated functions and control channels. Reduces the number of threads, but a
+                                 blocking function delays all other functions of the same service.
+            ack_timeout (float): maximum time in seconds to wait for all services to acknowledge starting, ending
+                                 or shutting down a dialog. Raises a `TimeoutError` naming the services which did
+                                 not respond in time. `None` waits forever.
+            max_sessions (int): maximum number of sessions whose dialog state each local service keeps in memory,
+                                the state of the least recently used sessions is moved to disk
+                                (see `services.sessionstore.SessionStore`). `None` keeps all sessions in memory.
+            session_ttl (float): seconds after which the dialog state of idle sessions is moved to disk
+            spill_dir (str): directory for the dialog state moved to disk, one file per service
+                             (default: temporary files)
         """
+        assert transport in ('zmq', 'local'), "transport has to be either 'zmq' or 'local'"
+        assert listener_mode in ('threads', 'poller'), "listener_mode has to be either 'threads' or 'poller'"
         # node-local topics
         self.debug_logger = debug_logger
         self.protocol = protocol
+        self._codec = codec if codec is not None else default_codec()
+        self._ack_timeout = ack_timeout
         self._sub_topics = {}
         self._pub_topics = {}
         self._remote_identifiers = set()
@@ -631,11 +999,16 @@ class DialogSystem:
         # node-local sockets
         self._domains = set()
 
-        # start proxy thread
-        self._proxy_dev = ProcessProxy(in_type=zmq.XSUB, out_type=zmq.XPUB)  # , mon_type=zmq.XSUB)
-        self._proxy_dev.bind_in(f"{protocol}://127.0.0.1:{pub_port}")
-        self._proxy_dev.bind_out(f"{protocol}://127.0.0.1:{sub_port}")
-        self._proxy_dev.start()
+        if transport == 'local':
+            # all services live in this process: route messages directly, no proxy required
+            self._local_bus = LocalBus()
+        else:
+            self._local_bus = None
+            # start proxy thread
+            self._proxy_dev = ProcessProxy(in_type=zmq.XSUB, out_type=zmq.XPUB)  # , mon_type=zmq.XSUB)
+            self._proxy_dev.bind_in(f"{protocol}://127.0.0.1:{pub_port}")
+            self._proxy_dev.bind_out(f"{protocol}://127.0.0.1:{sub_port}")
+            self._proxy_dev.start()
         self._sub_port = sub_port
         self._pub_port = pub_port
 
@@ -643,10 +1016,20 @@ class DialogSystem:
         self._start_topics = set()
         self._end_topics = set()
         self._terminate_topics = set()
+        self._probe_topics = set()
+        self._probe_topic = f"{type(self).__name__}/{id(self)}/PROBE"
+        self._control_topic_services = {}  # control topic -> service name (for error messages)
         self._stopEvent = threading.Event()
 
+        # sessions
+        self._control_lock = threading.RLock()  # control channels are shared by all sessions
+        self._end_condition = threading.Condition()  # guards the session sets below
+        self._end_reader = False  # a thread is currently reading the end socket for all sessions
+        self._active_sessions = {None}
+        self._ended_sessions = set()
+
         # control channels
-        ctx = Context.instance()
+        ctx = self._socket_context()
         self._control_channel_pub = ctx.socket(zmq.PUB)
         self._control_channel_pub.sndhwm = 1100000
         self._control_channel_pub.connect(f"{protocol}://127.0.0.1:{pub_port}")
@@ -658,18 +1041,33 @@ class DialogSystem:
             if isinstance(service, Service):
                 # register local service
                 service_name = type(service).__name__ if service._identifier is None else service._identifier
+                if codec is not None:
+                    service._codec = codec
+                service._local_bus = self._local_bus
+                service._listener_mode = listener_mode
+                if max_sessions is not None or session_ttl is not None:
+                    spill_file = None if spill_dir is None else os.path.join(spill_dir, f"{service_name}.db")
+                    set_session_store(service, SessionStore(max_sessions, session_ttl, spill_file))
                 service._init_pubsub()
                 self._add_service_info(service_name, service._domain_name, service._sub_topics, service._pub_topics,
-                                       service._start_topic, service._end_topic, service._terminate_topic)
+                                       service._start_topic, service._end_topic, service._terminate_topic,
+                                       service._probe_topic)
                 service._register_with_dialogsystem()
             elif isinstance(service, RemoteService):
+                assert transport == 'zmq', "remote services require the 'zmq' transport"
                 remote_services[getattr(service, 'identifier')] = service
         self._register_remote_services(remote_services, reg_port)
 
         self._control_channel_sub.connect(f"{protocol}://127.0.0.1:{sub_port}")
         self._setup_dialog_end_listener()
 
-        time.sleep(0.25)
+        if self._local_bus is None:
+            # local sockets are connected immediately, zmq subscriptions take a while to propagate
+            self._wait_until_ready()
+
+    def _socket_context(self):
+        """ Returns the factory for all sockets of the dialog system: the local bus if set, else the zmq context """
+        return self._local_bus if self._local_bus is not None else Context.instance()
 
     def _register_pub_topic(self, publisher, topic: str):
         """ Map a publisher instance to a topic """
@@ -710,9 +1108,10 @@ class DialogSystem:
                 if remote_service_identifier in remote_services:
                     print(f"registering service {remote_service_identifier}...")
                     # add remote service interface info
-                    domain_name, sub_topics, pub_topics, start_topic, end_topic, terminate_topic = pickle.loads(data)
+                    domain_name, sub_topics, pub_topics, start_topic, end_topic, terminate_topic, probe_topic = \
+                        pickle.loads(data)
                     self._add_service_info(remote_service_identifier, domain_name, sub_topics, pub_topics, start_topic,
-                                           end_topic, terminate_topic)
+                                           end_topic, terminate_topic, probe_topic)
                     self._remote_identifiers.add(remote_service_identifier)
                     # acknowledge service registration
                     reg_service.send(bytes(f'ACK_REGISTER_{remote_service_identifier}', encoding="ascii"))
@@ -726,7 +1125,7 @@ class DialogSystem:
         print("########## Finished registering all remote services ##########")
 
     def _add_service_info(self, service_name: str, domain_name: str, sub_topics: List[str], pub_topics: List[str], 
-                            start_topic: str, end_topic:str, terminate_topic: str):
+                            start_topic: str, end_topic:str, terminate_topic: str, probe_topic: str):
         """ Add all relevant info from a service (needed to construct dialog graph for debugging).
             Also, sets up all required control channels for this service based on the service's info.
             
@@ -739,6 +1138,7 @@ class DialogSystem:
             end_topic (str): control channel topic for setting given service into `non-listening` mode
             terminate_topic (str): control channel topic for stopping given service's listener loops and
                                    closing the listener sockets
+            probe_topic (str): control channel topic for checking that all sockets of the given service are connected
         """
         self._domains.add(domain_name)
         for topic in sub_topics:
@@ -750,17 +1150,22 @@ class DialogSystem:
         self._start_topics.add(start_topic)
         self._end_topics.add(end_topic)
         self._terminate_topics.add(terminate_topic)
+        self._probe_topics.add(probe_topic)
+        for topic in (start_topic, end_topic, terminate_topic, probe_topic):
+            self._control_topic_services[topic] = service_name
 
         self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(f"ACK/{start_topic}", encoding="ascii"))
         self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(f"ACK/{end_topic}", encoding="ascii"))
         self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(f"ACK/{terminate_topic}", encoding="ascii"))
+        self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(f"ACK/{probe_topic}", encoding="ascii"))
 
     def _setup_dialog_end_listener(self):
         """ Creates socket for listening to Topic.DIALOG_END messages """
-        ctx = Context.instance()
+        ctx = self._socket_context()
         self._end_socket = ctx.socket(zmq.SUB)
         # subscribe to dialog end from all domains
         self._end_socket.setsockopt(zmq.SUBSCRIBE, bytes(Topic.DIALOG_END, encoding="ascii"))
+        self._end_socket.setsockopt(zmq.SUBSCRIBE, bytes(self._probe_topic, encoding="ascii"))
         self._end_socket.connect(f"{self.protocol}://127.0.0.1:{self._sub_port}")
 
         # # add to list of local topics
@@ -777,6 +1182,60 @@ class DialogSystem:
         """ Returns True if the system is stopping, else False """
         return self._stopEvent.is_set()
 
+    def _wait_until_ready(self):
+        """ Readiness handshake: blocks until all sockets of all services (and of the dialog system) are connected.
+
+            ZMQ drops messages published before a subscription reached the publisher. Therefore, probe messages are
+            sent to every service until it acknowledges that all of its sockets received one.
+
+        Raises:
+            TimeoutError: if not all services are ready within `ack_timeout` seconds
+        """
+        deadline = None if self._ack_timeout is None else time.time() + self._ack_timeout
+        unready = set(self._probe_topics)
+        end_socket_ready = False
+        while unready or not end_socket_ready:
+            if deadline is not None and time.time() > deadline:
+                services = sorted(self._control_topic_services[topic] for topic in unready)
+                if not end_socket_ready:
+                    services.append(type(self).__name__)
+                raise TimeoutError(f"not ready within {self._ack_timeout}s: {', '.join(services)}")
+            for probe_topic in unready:
+                _send_msg(self._control_channel_pub, probe_topic, True)
+            if not end_socket_ready:
+                _send_msg(self._control_channel_pub, self._probe_topic, True)
+            unready = set(_recv_acks(self._control_channel_sub, unready, _PROBE_INTERVAL))
+            poll_timeout = 0 if unready else _PROBE_INTERVAL * 1000  # wait here if all services are ready already
+            while not end_socket_ready and self._end_socket.poll(poll_timeout, zmq.POLLIN):
+                end_socket_ready = _recv_msg(self._end_socket, self._codec)[0] == self._probe_topic
+        if self.debug_logger:
+            self.debug_logger.info(f"- (DS): all services READY")
+
+    def _broadcast_ctrl_msg(self, topics: Iterable[str], name: str, session: Union[str, None] = None):
+        """ Sends a control message to all given topics at once, then blocks until all services acknowledged it.
+
+        Args:
+            topics (Iterable[str]): control topics of the services
+            name (str): name of the control message (for error messages)
+            session (Union[str, None]): session the control message belongs to
+
+        Returns:
+            names of the services which refused the message (see `Service.multi_session`)
+
+        Raises:
+            TimeoutError: if not all services acknowledged the message within `ack_timeout` seconds
+        """
+        rejected = []
+        with self._control_lock:
+            for topic in topics:
+                _send_msg(self._control_channel_pub, topic, True, session=session)
+            missing = _recv_acks(self._control_channel_sub, topics, self._ack_timeout, session=session,
+                                 rejected=rejected)
+        if missing:
+            services = sorted(self._control_topic_services.get(topic, topic) for topic in missing)
+            raise TimeoutError(f"{name} was not acknowledged within {self._ack_timeout}s by: {', '.join(services)}")
+        return sorted(self._control_topic_services.get(topic, topic) for topic in rejected)
+
     def shutdown(self):
         """ Shutdown dialog system.
             This will trigger `terminate` messages to be sent to all registered services to stop their listener loops.
@@ -784,56 +1243,164 @@ class DialogSystem:
             Blocks until all services sent ACK's confirming they're stopped.
         """
         self._stopEvent.set()
-        for terminate_topic in self._terminate_topics:
-            _send_msg(self._control_channel_pub, terminate_topic, True)
-            _recv_ack(self._control_channel_sub, terminate_topic)
+        self._broadcast_ctrl_msg(self._terminate_topics, "TERMINATE")
 
-    def _end_dialog(self):
+    def _end_dialog(self, session: Union[str, None] = None):
         """ Block until all receivers stopped listening.
             Then, calls `dialog_end` on all registered services. """
-
-        # listen for Topic.DIALOG_END messages
-        while True:
-            try:
-                msg = self._end_socket.recv_multipart(copy=True)
-                # receive message for subscribed topic
-                topic = msg[0].decode("ascii")
-                timestamp, content = pickle.loads(msg[1])
-                if content:
-                    if self.debug_logger:
-                        self.debug_logger.info(f"- (DS): received DIALOG_END message in _end_dialog from topic {topic}")
-                    self.stop()
-                    break
-            except KeyboardInterrupt:
-                break
-            except:
-                import traceback
-                traceback.print_exc()
-                print("ERROR in _end_dialog ")
-
         # stop receivers (blocking)
-        for end_topic in self._end_topics:
-            _send_msg(self._control_channel_pub, end_topic, True)
-            _recv_ack(self._control_channel_sub, end_topic)
+        self._broadcast_ctrl_msg(self._end_topics, "END", session)
         if self.debug_logger:
             self.debug_logger.info(f"- (DS): all services STOPPED listening")
 
-    def _start_dialog(self, start_signals: dict):
+    def _start_dialog(self, start_signals: dict, session: Union[str, None] = None):
         """ Block until all receivers started listening.
             Then, call `dialog_start`on all registered services.
-            Finally, publish all start signals given. """
-        self._stopEvent.clear()
+            Finally, publish all start signals given.
+
+        Raises:
+            ValueError: if a single-user service refused the session (the session is ended again)
+        """
         # start receivers (blocking)
-        for start_topic in self._start_topics:
-            _send_msg(self._control_channel_pub, start_topic, True)
-            _recv_ack(self._control_channel_sub, start_topic)
+        rejected = self._broadcast_ctrl_msg(self._start_topics, "START", session)
+        if rejected:
+            self._end_dialog(session)
+            raise ValueError(f"session {session} was refused by single-user services: {', '.join(rejected)}")
         if self.debug_logger:
             self.debug_logger.info(f"- (DS): all services STARTED listening")
         # publish first turn trigger
         # for domain in self._domains:
         # "wildcard" mechanism: publish start messages to all known domains
-        for topic in start_signals:
-            _send_msg(self._control_channel_pub, f"{topic}", start_signals[topic])
+        self.step(session, start_signals)
+
+    def start_session(self, start_signals: dict = {}, session: str = None) -> str:
+        """ Starts a new dialog without waiting for it to end.
+            Any number of sessions can run at the same time, each service keeps separate dialog state per session
+            (see `services.session.SessionAttribute`).
+
+        Args:
+            start_signals (Dict[str, Any]): mapping from topic -> value, published to the new session once
+                                            all services started listening
+            session (str): id for the new session (ascii), e.g. assigned by a `services.sharding.SessionRouter`.
+                           Default: a new random id
+
+        Returns:
+            id of the new session
+
+        Raises:
+            ValueError: if the dialog graph contains a service which only serves a single user
+                        (see `Service.multi_session`), use `run_dialog` instead
+        """
+        session = session if session is not None else uuid.uuid4().hex
+        with self._end_condition:
+            self._active_sessions.add(session)
+        try:
+            self._start_dialog(start_signals, session)
+        except ValueError:
+            with self._end_condition:
+                self._active_sessions.discard(session)
+            raise
+        return session
+
+    def step(self, session: Union[str, None], signals: dict):
+        """ Publishes messages to a running session (non-blocking), e.g. the next user utterance.
+
+        Args:
+            session (Union[str, None]): id returned by `start_session`
+            signals (Dict[str, Any]): mapping from topic -> value
+        """
+        with self._control_lock:
+            for topic in signals:
+                _send_msg(self._control_channel_pub, f"{topic}", signals[topic], self._codec, session)
+
+    def wait_for_end(self, session: Union[str, None], timeout: float = None) -> bool:
+        """ Blocks until a `Topic.DIALOG_END` message with value `True` was published in the given session.
+            Can be called from multiple threads at the same time (one per session).
+
+        Args:
+            session (Union[str, None]): id returned by `start_session`
+            timeout (float): maximum time to wait in seconds, `None` waits forever
+
+        Returns:
+            True if the dialog ended, False if the timeout expired first
+        """
+        with self._end_condition:
+            if not self._wait_for_dialog_ends(lambda: session in self._ended_sessions, timeout):
+                return False
+            self._ended_sessions.discard(session)
+            return True
+
+    def wait_for_any_end(self, timeout: float = None) -> List[Union[str, None]]:
+        """ Blocks until a `Topic.DIALOG_END` message with value `True` was published in any session.
+            Use either this function or `wait_for_end`, not both.
+
+        Args:
+            timeout (float): maximum time to wait in seconds, `None` waits forever
+
+        Returns:
+            ids of all sessions which ended since the previous call (empty if the timeout expired first)
+        """
+        with self._end_condition:
+            self._wait_for_dialog_ends(lambda: len(self._ended_sessions) > 0, timeout)
+            ended = list(self._ended_sessions)
+            self._ended_sessions.clear()
+            return ended
+
+    def _wait_for_dialog_ends(self, condition, timeout: Union[float, None]) -> bool:
+        """ Blocks until `condition` (checked while holding `_end_condition`) holds or the timeout expired.
+            Only one waiting thread reads the end socket at a time, notifying the others about each ended session.
+
+        Returns:
+            True if `condition` holds, False if the timeout expired first
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while not condition():
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return False
+            if self._end_reader:
+                # another thread reads the end socket and notifies us
+                self._end_condition.wait(remaining)
+                continue
+            self._end_reader = True
+            self._end_condition.release()
+            try:
+                self._receive_dialog_ends(condition, deadline)
+            finally:
+                self._end_condition.acquire()
+                self._end_reader = False
+                self._end_condition.notify_all()
+        return True
+
+    def _receive_dialog_ends(self, condition, deadline: Union[float, None]):
+        """ Reads `Topic.DIALOG_END` messages of all sessions until `condition` holds or the deadline passed """
+        while True:
+            poll_timeout = None if deadline is None else max(0, deadline - time.time()) * 1000
+            if not self._end_socket.poll(poll_timeout, zmq.POLLIN):
+                return
+            topic, timestamp, content, end_session = _recv_msg(self._end_socket, self._codec)
+            if topic == self._probe_topic or not content:
+                continue  # left over from the readiness handshake
+            with self._end_condition:
+                if end_session not in self._active_sessions:
+                    continue  # left over from an ended session
+                if self.debug_logger:
+                    self.debug_logger.info(f"- (DS): received DIALOG_END message from topic {topic}")
+                self._ended_sessions.add(end_session)
+                self._end_condition.notify_all()
+                if condition():
+                    return
+
+    def end_session(self, session: str):
+        """ Ends a session: blocks until all services stopped listening to it and deleted its dialog state.
+
+        Args:
+            session (str): id returned by `start_session`
+        """
+        self._end_dialog(session)
+        with self._end_condition:
+            self._active_sessions.discard(session)
+            self._ended_sessions.discard(session)
 
     def run_dialog(self, start_signals: dict = {Topic.DIALOG_END: False}):
         """ Run a complete dialog (blocking).
@@ -846,7 +1413,10 @@ class DialogSystem:
                                             Publishes the value given for each topic to the respective topic.
                                             Use this to trigger the start of your dialog system.
         """
+        self._stopEvent.clear()
         self._start_dialog(start_signals)
+        self.wait_for_end(None)
+        self.stop()
         self._end_dialog()
 
     def list_published_topics(self):
@@ -0,0 +1,115 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+""" This module provides dialog sessions: multiple dialogs handled by the same services at the same time. """
+
+import contextvars
+from typing import Any, Union
+
+from services.sessionstore import SessionStore
+
+# session of the message currently handled (`None`: dialogs started with `DialogSystem.run_dialog`)
+_current_session = contextvars.ContextVar('adviser_session', default=None)
+
+
+def current_session() -> Union[str, None]:
+    """ Returns the id of the session the currently handled message belongs to """
+    return _current_session.get()
+
+
+def set_current_session(session: Union[str, None]) -> contextvars.Token:
+    """ Sets the current session, pass the returned token to `reset_current_session` to restore the previous one """
+    return _current_session.set(session)
+
+
+def reset_current_session(token: contextvars.Token):
+    """ Restores the session which was current before the call to `set_current_session` returning `token` """
+    _current_session.reset(token)
+
+
+async def run_in_session(coroutine, session: Union[str, None]) -> Any:
+    """ Awaits a coroutine with `session` as current session (tasks have their own context) """
+    _current_session.set(session)
+    return await coroutine
+
+
+class SessionAttribute(object):
+    """ Service attribute holding one value per session, use it for all dialog-level state of a service.
+
+        Declare it on the service class, then use the attribute as usual:
+
+            class MyBST(Service):
+                bs = SessionAttribute()
+
+                def dialog_start(self):
+                    self.bs = BeliefState(self.domain)
+
+        Reading or writing the attribute accesses the value of the current session.
+        Values set outside of any session (e.g. in `__init__`) are the defaults: a session reads them until it
+        sets its own value. Initialize mutable state in `dialog_start`, otherwise all sessions share the default object.
+        The values of a session are deleted when the session ends.
+        All values are held in the `SessionStore` of the service (see `set_session_store`).
+    """
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        store = session_store(instance)
+        values = store.get(_current_session.get())
+        if values is not None and self.name in values:
+            return values[self.name]
+        values = store.get(None)
+        if self.name in values:
+            return values[self.name]
+        raise AttributeError(f"'{type(instance).__name__}' object has no attribute '{self.name}'")
+
+    def __set__(self, instance, value: Any):
+        session_store(instance).get(_current_session.get(), create=True)[self.name] = value
+
+    def __delete__(self, instance):
+        values = session_store(instance).get(_current_session.get())
+        try:
+            del values[self.name]
+        except (KeyError, TypeError):
+            raise AttributeError(self.name)
+
+
+def session_store(instance) -> SessionStore:
+    """ Returns the store holding the `SessionAttribute` values of `instance` (an unbounded in-memory store,
+        unless `set_session_store` was called) """
+    try:
+        return instance.__dict__['_session_store']
+    except KeyError:
+        return instance.__dict__.setdefault('_session_store', SessionStore())
+
+
+def set_session_store(instance, store: SessionStore):
+    """ Replaces the store holding the `SessionAttribute` values of `instance`, e.g. to limit the number of
+        sessions kept in memory. Call before starting any session, the default values are taken over.
+    """
+    store.get(None).update(session_store(instance).get(None))
+    instance.__dict__['_session_store'] = store
+
+
+def drop_session(instance, session: Union[str, None]):
+    """ Deletes all `SessionAttribute` values of `instance` for the given session (not for the default session) """
+    session_store(instance).drop(session)
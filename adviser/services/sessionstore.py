@@ -0,0 +1,205 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+""" This module provides the bounded store for the dialog state of all sessions of a service. """
+
+import io
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Union
+
+from utils.domain.domain import Domain
+
+
+class _SpillPickler(pickle.Pickler):
+    """ Pickles domains by reference: they are shared by all sessions and stay in memory """
+
+    def __init__(self, file, shared: Dict[int, object]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.shared = shared
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Domain):
+            self.shared[id(obj)] = obj
+            return id(obj)
+        return None
+
+
+class _SpillUnpickler(pickle.Unpickler):
+    def __init__(self, file, shared: Dict[int, object]):
+        super().__init__(file)
+        self.shared = shared
+
+    def persistent_load(self, pid):
+        return self.shared[pid]
+
+
+class SessionStore(object):
+    """ Holds the `services.session.SessionAttribute` values of one service for all sessions.
+
+        At most `max_sessions` sessions are kept in memory, sessions not accessed for `ttl` seconds are moved out
+        as well (checked whenever a session is accessed or released). Moved out sessions are pickled into a sqlite file and loaded again on their next access
+        (e.g. the next turn of the dialog). Sessions are never moved out while one of their messages is handled.
+        The default values (set outside of any session) always stay in memory.
+    """
+
+    def __init__(self, max_sessions: int = None, ttl: float = None, spill_file: str = None):
+        """
+        Args:
+            max_sessions (int): maximum number of sessions kept in memory, `None` for no limit
+            ttl (float): seconds after which idle sessions are moved out of memory, `None` for no limit
+            spill_file (str): sqlite file for sessions moved out of memory
+                              (default: a temporary file, deleted on `close`)
+        """
+        assert max_sessions is None or max_sessions > 0, "max_sessions has to be positive"
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.spill_file = spill_file
+        self._lock = threading.RLock()
+        self._default = {}
+        self._sessions = OrderedDict()  # session -> values, least recently used first
+        self._last_access = {}
+        self._pinned = {}  # session -> number of running calls
+        self._spilled = set()
+        self._shared = {}  # objects pickled by reference
+        self._db = None
+        self._temp_file = None
+
+    def __len__(self):
+        """ Number of sessions currently held in memory """
+        return len(self._sessions)
+
+    def get(self, session: Union[str, None], create: bool = False) -> Union[dict, None]:
+        """ Returns the attribute values of a session, loading them from disk if required.
+
+        Args:
+            session (Union[str, None]): session id, `None` for the default values
+            create (bool): create an empty set of values if the session has none yet
+
+        Returns:
+            dict attribute name -> value, or `None` if the session has no values and `create` is False
+        """
+        if session is None:
+            return self._default
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.move_to_end(session)
+                values = self._sessions[session]
+            elif session in self._spilled:
+                values = self._load(session)
+                self._sessions[session] = values
+            elif create:
+                values = self._sessions[session] = {}
+            else:
+                return None
+            self._last_access[session] = time.time()
+            self._evict(keep=session)
+            return values
+
+    def drop(self, session: Union[str, None]):
+        """ Deletes all values of a session (the default values are kept) """
+        if session is None:
+            return
+        with self._lock:
+            self._sessions.pop(session, None)
+            self._last_access.pop(session, None)
+            if session in self._spilled:
+                self._spilled.discard(session)
+                self._db.execute("DELETE FROM sessions WHERE session = ?", (session,))
+
+    def acquire(self, session: Union[str, None]):
+        """ Keeps the session in memory until `release` is called, e.g. while one of its messages is handled """
+        if session is None:
+            return
+        with self._lock:
+            self._pinned[session] = self._pinned.get(session, 0) + 1
+
+    def release(self, session: Union[str, None]):
+        """ Counterpart of `acquire`, also moves sessions which expired in the meantime out of memory """
+        if session is None:
+            return
+        with self._lock:
+            if self._pinned.get(session, 0) <= 1:
+                self._pinned.pop(session, None)
+                if session in self._last_access:
+                    self._last_access[session] = time.time()  # idle from now on
+            else:
+                self._pinned[session] -= 1
+            self._evict(keep=None)
+
+    def close(self):
+        """ Closes the spill file, deleting it if it is a temporary file """
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            if self._temp_file is not None:
+                os.remove(self._temp_file)
+                self._temp_file = None
+            self._spilled.clear()
+
+    def _evict(self, keep: Union[str, None]):
+        """ Moves the least recently used sessions (except for `keep`) out of memory until the limits are met """
+        if self.max_sessions is None and self.ttl is None:
+            return
+        now = time.time()
+        expired = None if self.ttl is None else now - self.ttl
+        # each session is looked at once at most, usually only the head is checked
+        for _ in range(len(self._sessions)):
+            session = next(iter(self._sessions))
+            over_limit = self.max_sessions is not None and len(self._sessions) > self.max_sessions
+            if not over_limit and (expired is None or self._last_access[session] >= expired):
+                break  # all remaining sessions were used more recently
+            if session == keep or session in self._pinned:
+                # in use right now: counts as most recently used
+                self._sessions.move_to_end(session)
+                self._last_access[session] = now
+            else:
+                self._spill(session)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            if self.spill_file is None:
+                fd, self._temp_file = tempfile.mkstemp(prefix="adviser_sessions_", suffix=".db")
+                os.close(fd)
+            self._db = sqlite3.connect(self.spill_file or self._temp_file, check_same_thread=False,
+                                       isolation_level=None)
+            # spilled sessions don't have to survive a crash
+            self._db.execute("PRAGMA journal_mode = MEMORY")
+            self._db.execute("PRAGMA synchronous = OFF")
+            self._db.execute("CREATE TABLE IF NOT EXISTS sessions (session TEXT PRIMARY KEY, data BLOB)")
+        return self._db
+
+    def _spill(self, session: str):
+        buffer = io.BytesIO()
+        _SpillPickler(buffer, self._shared).dump(self._sessions.pop(session))
+        del self._last_access[session]
+        self._connect().execute("INSERT OR REPLACE INTO sessions VALUES (?, ?)", (session, buffer.getvalue()))
+        self._spilled.add(session)
+
+    def _load(self, session: str) -> dict:
+        row = self._db.execute("SELECT data FROM sessions WHERE session = ?", (session,)).fetchone()
+        self._db.execute("DELETE FROM sessions WHERE session = ?", (session,))
+        self._spilled.discard(session)
+        return _SpillUnpickler(io.BytesIO(row[0]), self._shared).load()
@@ -0,0 +1,462 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+""" This module spreads dialog sessions across a pool of identical `DialogSystem` worker processes.
+
+    The `SessionRouter` runs in the front process, each worker process builds its own `DialogSystem` with all
+    services and calls `run_worker`:
+
+        # front process
+        router = SessionRouter()
+        session = router.start_session(start_signals={'gen_user_utterance': ''})
+        router.step(session, {'gen_user_utterance': 'hello'})
+
+        # worker processes (on this or on other nodes)
+        ds = DialogSystem(services=[...], transport='local')
+        run_worker(ds, identifier=f"worker-{os.getpid()}", router_addr=...)
+"""
+
+import bisect
+import hashlib
+import pickle
+import threading
+import time
+import uuid
+from typing import List, Union
+
+import zmq
+from zmq import Context
+from zmq.devices import ProcessProxy
+
+from services.service import DialogSystem, _PROBE_INTERVAL, _recv_msg, _send_msg
+
+
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """ Consistent hashing: maps keys to nodes such that adding or removing a node only moves the keys of
+        that node (about 1/N of all keys).
+        Each node is placed on the ring `replicas` times to spread the keys evenly.
+    """
+
+    def __init__(self, replicas: int = 100):
+        self.replicas = replicas
+        self._hashes = []  # sorted
+        self._nodes = {}  # hash -> node
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node: str):
+        return self._nodes.get(_hash(f"{node}#0")) == node
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self._nodes.values()))
+
+    def add(self, node: str):
+        for replica in range(self.replicas):
+            node_hash = _hash(f"{node}#{replica}")
+            if node_hash not in self._nodes:
+                bisect.insort(self._hashes, node_hash)
+            self._nodes[node_hash] = node
+
+    def remove(self, node: str):
+        for replica in range(self.replicas):
+            node_hash = _hash(f"{node}#{replica}")
+            if self._nodes.pop(node_hash, None) is not None:
+                del self._hashes[bisect.bisect_left(self._hashes, node_hash)]
+
+    def get(self, key: str) -> Union[str, None]:
+        """ Returns the node responsible for `key` (the first node clockwise on the ring), `None` if empty """
+        if not self._hashes:
+            return None
+        idx = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[self._hashes[idx]]
+
+
+class SessionRouter(object):
+    """ Front process spreading dialog sessions across `DialogSystem` workers (see `run_worker`).
+
+        New sessions are assigned to a worker by consistent hashing of the session id. A session sticks to its
+        worker until it ends, also when workers join. Workers can join and leave at any time:
+        joining workers take over a share of the new sessions, the sessions of a leaving worker are restarted
+        on the remaining workers (with empty start signals, their dialog state is lost).
+        Workers send heartbeats, a worker which was not heard of for `worker_timeout` seconds (e.g. because it
+        crashed) is treated like a leaving worker. If its heartbeats come back, the router ends the moved sessions
+        on it and adds it to the pool again.
+
+        Messages are routed through a ZMQ XSUB/XPUB proxy, workers register via the same handshake as remote
+        services (see `DialogSystem`).
+        Offers the same session interface as `DialogSystem`.
+    """
+
+    def __init__(self, sub_port: int = 65530, pub_port: int = 65531, reg_port: int = 65532,
+                 bind_addr: str = "127.0.0.1", replicas: int = 100, ready_timeout: float = 10.0,
+                 worker_timeout: float = 5.0):
+        """
+        Args:
+            sub_port (int): subscriber port of the proxy
+            pub_port (int): publisher port of the proxy
+            reg_port (int): port for worker registration requests
+            bind_addr (str): address to bind the ports to, use "0.0.0.0" for workers on other nodes
+            replicas (int): number of positions of each worker on the hash ring
+            ready_timeout (float): maximum time in seconds to wait for a registering worker to become reachable
+            worker_timeout (float): seconds without a heartbeat after which a worker is removed from the pool,
+                                    should be several heartbeat intervals (see `run_worker`)
+        """
+        self._ready_timeout = ready_timeout
+        self._worker_timeout = worker_timeout
+        self._proxy_dev = ProcessProxy(in_type=zmq.XSUB, out_type=zmq.XPUB)
+        self._proxy_dev.bind_in(f"tcp://{bind_addr}:{pub_port}")
+        self._proxy_dev.bind_out(f"tcp://{bind_addr}:{sub_port}")
+        self._proxy_dev.start()
+
+        ctx = Context.instance()
+        self._pub = ctx.socket(zmq.PUB)
+        self._pub.sndhwm = 1100000
+        self._pub.connect(f"tcp://127.0.0.1:{pub_port}")
+        self._pub_lock = threading.Lock()
+        self._sub = ctx.socket(zmq.SUB)
+        self._sub.setsockopt(zmq.SUBSCRIBE, b"ROUTER/")
+        self._sub.connect(f"tcp://127.0.0.1:{sub_port}")
+
+        self._ring = HashRing(replicas)
+        self._condition = threading.Condition()  # guards the state below
+        self._assignments = {}  # session -> worker
+        self._ended_sessions = set()
+        self._ready_workers = set()  # workers which answered a probe
+        self._last_seen = {}  # worker in the pool -> time of its last message
+        self._expired = {}  # expired worker -> sessions moved away from it
+        self._stopping = set()  # workers which did not confirm a shutdown yet
+        self._stopped = threading.Event()
+
+        self._receiver = threading.Thread(target=self._receive_loop, daemon=True)
+        self._receiver.start()
+        self._registrar = threading.Thread(target=self._registration_loop, args=(bind_addr, reg_port), daemon=True)
+        self._registrar.start()
+
+    @property
+    def workers(self) -> List[str]:
+        """ Identifiers of all workers currently receiving new sessions """
+        with self._condition:
+            return self._ring.nodes
+
+    def wait_for_workers(self, num_workers: int, timeout: float = None) -> bool:
+        """ Blocks until at least `num_workers` workers joined.
+
+        Returns:
+            True if enough workers joined, False if the timeout expired first
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self._ring) >= num_workers, timeout)
+
+    def _send(self, worker: str, command: str, session: Union[str, None] = None, payload=None):
+        with self._pub_lock:
+            _send_msg(self._pub, f"WORKER/{worker}/", (command, session, payload))
+
+    def _worker_for(self, session: str) -> str:
+        """ Returns the worker of a running session, restarting it on another worker if its worker left """
+        with self._condition:
+            worker = self._assignments.get(session)
+            if worker is not None and worker in self._ring:
+                return worker
+            worker = self._ring.get(session)
+            assert worker is not None, "no dialog system worker available"
+            self._assignments[session] = worker
+        self._send(worker, "START", session, {})
+        return worker
+
+    def start_session(self, start_signals: dict = {}) -> str:
+        """ Starts a new dialog on one of the workers without waiting for it to end.
+
+        Args:
+            start_signals (Dict[str, Any]): mapping from topic -> value, published to the new session
+
+        Returns:
+            id of the new session
+        """
+        session = uuid.uuid4().hex
+        with self._condition:
+            worker = self._ring.get(session)
+            assert worker is not None, "no dialog system worker available"
+            self._assignments[session] = worker
+        self._send(worker, "START", session, start_signals)
+        return session
+
+    def step(self, session: str, signals: dict):
+        """ Publishes messages to a running session (non-blocking), see `DialogSystem.step` """
+        self._send(self._worker_for(session), "STEP", session, signals)
+
+    def wait_for_end(self, session: str, timeout: float = None) -> bool:
+        """ Blocks until the dialog of the given session ended, see `DialogSystem.wait_for_end`
+
+        Returns:
+            True if the dialog ended, False if the timeout expired first
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: session in self._ended_sessions, timeout):
+                return False
+            self._ended_sessions.discard(session)
+            return True
+
+    def end_session(self, session: str):
+        """ Ends a session on its worker and deletes its dialog state (non-blocking) """
+        with self._condition:
+            worker = self._assignments.pop(session, None)
+            self._ended_sessions.discard(session)
+        if worker is not None and worker in self._ring:
+            self._send(worker, "END", session)
+
+    def shutdown(self):
+        """ Stops all workers and the router.
+            Blocks until the workers confirmed (at most `ready_timeout` seconds) and the threads of the router
+            stopped, then closes its sockets and the proxy, so that a new router can be created in the same process.
+        """
+        with self._condition:
+            self._stopping = set(self._ring.nodes)
+        for worker in self.workers:
+            self._send(worker, "SHUTDOWN")
+        with self._condition:
+            if not self._condition.wait_for(lambda: not self._stopping, self._ready_timeout):
+                print(f"workers {', '.join(sorted(self._stopping))} did not confirm the shutdown")
+        self._stopped.set()
+        self._receiver.join()
+        self._registrar.join()
+        self._sub.close()
+        self._pub.close()
+        self._proxy_dev.launcher.terminate()
+        self._proxy_dev.launcher.join()
+
+    def _receive_loop(self):
+        """ Receives events from all workers and removes workers which stopped sending heartbeats.
+            Meant to be called in a thread. """
+        while not self._stopped.is_set():
+            try:
+                self._expire_workers()
+                if not self._sub.poll(100, zmq.POLLIN):
+                    continue
+                topic, _, (event, worker, session), _ = _recv_msg(self._sub)
+                with self._condition:
+                    if worker in self._last_seen:
+                        self._last_seen[worker] = time.time()
+                    if event == "READY":
+                        self._ready_workers.add(worker)
+                    elif event == "ENDED" and self._assignments.get(session) == worker:
+                        self._ended_sessions.add(session)
+                    elif event == "HEARTBEAT" and worker in self._expired:
+                        self._rejoin(worker)
+                    elif event == "STOPPED":
+                        self._stopping.discard(worker)
+                    self._condition.notify_all()
+            except:
+                import traceback
+                print("ERROR in SessionRouter: _receive_loop")
+                traceback.print_exc()
+
+    def _add_worker(self, worker: str):
+        with self._condition:
+            self._ring.add(worker)
+            self._last_seen[worker] = time.time()
+            self._expired.pop(worker, None)
+            self._condition.notify_all()
+
+    def _remove_worker(self, worker: str) -> List[str]:
+        """ Takes a worker out of the pool and restarts its running sessions on the remaining workers
+            (needs `_condition`)
+
+        Returns:
+            the moved sessions
+        """
+        self._ring.remove(worker)
+        self._ready_workers.discard(worker)
+        self._last_seen.pop(worker, None)
+        moved = [session for session, assigned in self._assignments.items()
+                 if assigned == worker and session not in self._ended_sessions]
+        for session in moved:
+            new_worker = self._ring.get(session)
+            if new_worker is None:
+                break  # no worker left: `step` fails for these sessions
+            self._assignments[session] = new_worker
+            self._send(new_worker, "START", session, {})
+        return moved
+
+    def _expire_workers(self):
+        """ Removes all workers which sent no heartbeat within `worker_timeout` seconds """
+        deadline = time.time() - self._worker_timeout
+        with self._condition:
+            for worker in [worker for worker, seen in self._last_seen.items() if seen < deadline]:
+                self._expired[worker] = self._remove_worker(worker)
+                print(f"worker {worker} expired")
+
+    def _rejoin(self, worker: str):
+        """ An expired worker is alive again: end the sessions moved away from it, then add it to the pool
+            (needs `_condition`) """
+        for session in self._expired[worker]:
+            self._send(worker, "END", session)
+        self._ring.add(worker)
+        self._last_seen[worker] = time.time()
+        del self._expired[worker]
+        print(f"worker {worker} rejoined")
+
+    def _registration_loop(self, bind_addr: str, reg_port: int):
+        """ Handles registration requests of joining and leaving workers. Meant to be called in a thread. """
+        reg_service = Context.instance().socket(zmq.REP)
+        reg_service.bind(f"tcp://{bind_addr}:{reg_port}")
+        while not self._stopped.is_set():
+            if not reg_service.poll(100, zmq.POLLIN):
+                continue
+            msg, data = reg_service.recv_multipart()
+            msg = msg.decode("utf-8")
+            if msg.startswith("REGISTER_"):
+                worker = msg[len("REGISTER_"):]
+                reg_service.send(bytes(f"ACK_REGISTER_{worker}", encoding="ascii"))
+            elif msg.startswith("CONF_REGISTER_"):
+                # worker is subscribed: make sure its subscription is live before routing sessions to it
+                worker = msg[len("CONF_REGISTER_"):]
+                reg_service.send(b"")
+                if self._wait_until_ready(worker):
+                    self._add_worker(worker)
+                    print(f"worker {worker} joined")
+                else:
+                    print(f"worker {worker} did not become ready within {self._ready_timeout}s")
+            elif msg.startswith("UNREGISTER_"):
+                worker = msg[len("UNREGISTER_"):]
+                with self._condition:
+                    self._remove_worker(worker)
+                    self._expired.pop(worker, None)
+                reg_service.send(bytes(f"ACK_UNREGISTER_{worker}", encoding="ascii"))
+                print(f"worker {worker} left")
+            else:
+                reg_service.send(b"")
+        reg_service.close()
+
+    def _wait_until_ready(self, worker: str) -> bool:
+        """ Probes the worker until it answers (ZMQ drops messages sent before a subscription is live) """
+        deadline = time.time() + self._ready_timeout
+        with self._condition:
+            while worker not in self._ready_workers:
+                if time.time() > deadline:
+                    return False
+                self._send(worker, "PROBE")
+                self._condition.wait(_PROBE_INTERVAL)
+        return True
+
+
+def run_worker(dialog_system: DialogSystem, identifier: str, router_addr: str = "127.0.0.1",
+               sub_port: int = 65530, pub_port: int = 65531, reg_port: int = 65532,
+               stop_event: threading.Event = None, heartbeat_interval: float = 1.0):
+    """ Serves the sessions a `SessionRouter` assigns to this worker with the given dialog system.
+        Note: this call is blocking until the router shuts down or the worker leaves the pool!
+
+    Args:
+        dialog_system (DialogSystem): dialog system of this worker (use `transport='local'` for local services,
+                                      so that the workers of a node don't compete for the proxy ports)
+        identifier (str): unique (ascii) name of this worker
+        router_addr (str): IP-address or domain name of the router node
+        sub_port (int): subscriber port of the router's proxy
+        pub_port (int): publisher port of the router's proxy
+        reg_port (int): registration port of the router
+        stop_event (threading.Event): once set, the worker leaves the pool and returns
+                                      (the router restarts its sessions on the other workers)
+        heartbeat_interval (float): seconds between two heartbeats telling the router this worker is alive
+    """
+    ctx = Context.instance()
+    pub = ctx.socket(zmq.PUB)
+    pub.sndhwm = 1100000
+    pub.connect(f"tcp://{router_addr}:{pub_port}")
+    pub_lock = threading.Lock()
+    sub = ctx.socket(zmq.SUB)
+    sub.setsockopt(zmq.SUBSCRIBE, bytes(f"WORKER/{identifier}/", encoding="ascii"))
+    sub.connect(f"tcp://{router_addr}:{sub_port}")
+
+    def notify(event: str, session: Union[str, None] = None):
+        with pub_lock:
+            _send_msg(pub, f"ROUTER/{identifier}", (event, identifier, session))
+
+    # register with the router
+    sync_endpoint = ctx.socket(zmq.REQ)
+    sync_endpoint.connect(f"tcp://{router_addr}:{reg_port}")
+    sync_endpoint.send_multipart((bytes(f"REGISTER_{identifier}", encoding="ascii"), pickle.dumps(None)))
+    assert sync_endpoint.recv().decode("utf-8") == f"ACK_REGISTER_{identifier}"
+    sync_endpoint.send_multipart((bytes(f"CONF_REGISTER_{identifier}", encoding="ascii"), pickle.dumps(True)))
+    sync_endpoint.recv()
+
+    # report ended dialogs and send heartbeats to the router
+    stopped = threading.Event()
+
+    def end_listener():
+        while not stopped.is_set():
+            for session in dialog_system.wait_for_any_end(timeout=0.1):
+                notify("ENDED", session)
+
+    def heartbeat():
+        while not stopped.wait(heartbeat_interval):
+            notify("HEARTBEAT")
+
+    threads = [threading.Thread(target=end_listener, daemon=True), threading.Thread(target=heartbeat, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    # handle commands of the router (in order)
+    leave = False
+    try:
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                leave = True
+                break
+            if not sub.poll(100, zmq.POLLIN):
+                continue
+            _, _, (command, session, payload), _ = _recv_msg(sub)
+            if command == "SHUTDOWN":
+                notify("STOPPED")
+                break
+            try:
+                if command == "PROBE":
+                    notify("READY")
+                elif command == "START":
+                    dialog_system.start_session(payload, session)
+                elif command == "STEP":
+                    dialog_system.step(session, payload)
+                elif command == "END":
+                    dialog_system.end_session(session)
+            except KeyboardInterrupt:
+                raise
+            except:
+                import traceback
+                print(f"ERROR in worker {identifier}: {command}")
+                traceback.print_exc()
+    except KeyboardInterrupt:
+        leave = True
+    finally:
+        try:
+            if leave:
+                # leave the pool, the router restarts our sessions on other workers
+                sync_endpoint.send_multipart((bytes(f"UNREGISTER_{identifier}", encoding="ascii"),
+                                              pickle.dumps(None)))
+                sync_endpoint.recv()
+        finally:
+            stopped.set()
+            for thread in threads:
+                thread.join()
+            sub.close()
+            pub.close()
+            sync_endpoint.close()
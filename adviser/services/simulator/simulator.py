@@ -26,6 +26,7 @@ from typing import List
 
 from services.service import PublishSubscribe
 from services.service import Service
+from services.session import SessionAttribute
 from services.simulator.goal import Constraint, Goal
 from utils import UserAct, UserActionType, SysAct, SysActionType, common
 from utils.domain.domain import Domain
@@ -40,6 +41,17 @@ class HandcraftedUserSimulator(Service):
         this domain to generate the goals.
     """
 
+    # dialog state (per session)
+    turn = SessionAttribute()
+    dialog_patience = SessionAttribute()
+    patience = SessionAttribute()
+    last_user_actions = SessionAttribute()
+    last_system_action = SessionAttribute()
+    excluded_venues = SessionAttribute()
+    goal = SessionAttribute()
+    agenda = SessionAttribute()
+    num_actions_next_turn = SessionAttribute()
+
     def __init__(self, domain: Domain, logger: DiasysLogger = DiasysLogger()):
         super(HandcraftedUserSimulator, self).__init__(domain)
 
@@ -105,7 +117,9 @@ class HandcraftedUserSimulator(Service):
     def dialog_start(self):
         """Resets the user model at the beginning of a dialog, e.g. draws a new goal and populates
         the agenda according to the goal."""
-        # self.goal = Goal(self.domain, self.parameters['goal'])
+        # new objects per dialog: the goal is published and each session needs its own agenda
+        self.goal = Goal(self.domain, self.parameters['goal'])
+        self.agenda = Agenda()
 
         self.goal.init()
         self.agenda.init(self.goal)
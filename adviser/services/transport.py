@@ -0,0 +1,166 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+""" This module provides an in-process message bus for dialog systems running all services in one process. """
+
+import threading
+from collections import deque
+from typing import Any, List, Tuple, Union
+
+import zmq
+
+
+class LocalSocket(object):
+    """ In-process replacement for a ZMQ PUB or SUB socket connected to a `LocalBus`.
+
+        Messages are handed over as python objects - they are neither serialized nor copied,
+        so subscribers receive the very same object the publisher returned.
+    """
+
+    def __init__(self, bus: 'LocalBus', socket_type: int):
+        self._bus = bus
+        self.socket_type = socket_type
+        self.sndhwm = 0  # unused, exists for compatibility with zmq sockets
+        self.prefixes = []
+        self._queue = deque()
+        self._ready = threading.Condition()
+        self._pollers = []
+
+    def setsockopt(self, option: int, value: bytes):
+        """ Supports `zmq.SUBSCRIBE` (prefix-matched topic subscriptions), all other options are ignored """
+        if option == zmq.SUBSCRIBE:
+            self._bus.subscribe(self, value.decode("ascii"))
+
+    def connect(self, addr: str):
+        """ Local sockets are connected to their bus from the start """
+        pass
+
+    def send_msg(self, topic: str, timestamp: float, content: Any, session: Union[str, None] = None):
+        """ Publishes a message to all sockets subscribed to a prefix of `topic` """
+        self._bus.publish(topic, timestamp, content, session)
+
+    def deliver(self, topic: str, timestamp: float, content: Any, session: Union[str, None] = None):
+        """ Called by the bus: appends a message to the receive queue of this socket """
+        with self._ready:
+            self._queue.append((topic, timestamp, content, session))
+            self._ready.notify()
+        for poller in self._pollers:
+            poller.notify()
+
+    def recv_msg(self) -> Tuple[str, float, Any, Union[str, None]]:
+        """ Blocks until a message is available.
+
+        Returns:
+            tuple(topic, timestamp, content, session)
+        """
+        with self._ready:
+            while not self._queue:
+                self._ready.wait()
+            return self._queue.popleft()
+
+    def poll(self, timeout: float = None, flags: int = zmq.POLLIN) -> int:
+        """ Waits until a message is available or `timeout` milliseconds passed, mirrors `zmq.Socket.poll`
+
+        Returns:
+            `zmq.POLLIN` if a message is available, else 0
+        """
+        with self._ready:
+            self._ready.wait_for(self.poll_ready, None if timeout is None else timeout / 1000.0)
+        return zmq.POLLIN if self.poll_ready() else 0
+
+    def poll_ready(self) -> bool:
+        """ Returns True if `recv_msg` will not block """
+        return len(self._queue) > 0
+
+    def close(self):
+        self._bus.unsubscribe(self)
+
+
+class LocalPoller(object):
+    """ Waits for messages on multiple local sockets, mirrors `zmq.Poller` (only supports `zmq.POLLIN`) """
+
+    def __init__(self):
+        self._sockets = []
+        self._ready = threading.Condition()
+
+    def register(self, socket: LocalSocket, flags: int = zmq.POLLIN):
+        assert flags == zmq.POLLIN, "local sockets can only be polled for incoming messages"
+        self._sockets.append(socket)
+        socket._pollers.append(self)
+
+    def unregister(self, socket: LocalSocket):
+        self._sockets.remove(socket)
+        socket._pollers.remove(self)
+
+    def notify(self):
+        """ Called by registered sockets when a message was delivered to them """
+        with self._ready:
+            self._ready.notify()
+
+    def poll(self, timeout: float = None) -> List[Tuple[LocalSocket, int]]:
+        """ Blocks until at least one registered socket received a message (or `timeout` milliseconds passed).
+
+        Returns:
+            list of (socket, zmq.POLLIN) tuples for all sockets with pending messages
+        """
+        with self._ready:
+            self._ready.wait_for(lambda: any(socket.poll_ready() for socket in self._sockets),
+                                 None if timeout is None else timeout / 1000.0)
+        return [(socket, zmq.POLLIN) for socket in self._sockets if socket.poll_ready()]
+
+
+class LocalBus(object):
+    """ Routes messages between services of the same process by calling into the subscribers' queues directly.
+
+        Replaces the ZMQ proxy of a `DialogSystem` created with `transport="local"`.
+        Uses the same prefix matching as ZMQ: a socket subscribed to 'topic' receives messages
+        for 'topic' and e.g. 'topic/domain', but each message at most once.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def socket(self, socket_type: int) -> LocalSocket:
+        """ Creates a new socket, mirrors `zmq.Context.socket` """
+        return LocalSocket(self, socket_type)
+
+    def poller(self) -> LocalPoller:
+        """ Creates a new poller for sockets of this bus, mirrors `zmq.Poller` """
+        return LocalPoller()
+
+    def subscribe(self, socket: LocalSocket, prefix: str):
+        with self._lock:
+            socket.prefixes.append(prefix)
+            if socket not in self._subscribers:
+                self._subscribers.append(socket)
+
+    def unsubscribe(self, socket: LocalSocket):
+        with self._lock:
+            if socket in self._subscribers:
+                self._subscribers.remove(socket)
+
+    def publish(self, topic: str, timestamp: float, content: Any, session: Union[str, None] = None):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            for prefix in subscriber.prefixes:
+                if topic.startswith(prefix):
+                    subscriber.deliver(topic, timestamp, content, session)
+                    break
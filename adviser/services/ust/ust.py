@@ -19,6 +19,7 @@
 
 from services.service import Service
 from services.service import PublishSubscribe
+from services.session import SessionAttribute
 from utils.userstate import EmotionType, EngagementType, UserState
 
 
@@ -27,6 +28,8 @@ class HandcraftedUST(Service):
     A rule-based approach on user state tracking. Currently very minimalist
     """
 
+    us = SessionAttribute()
+
     def __init__(self, domain=None, logger=None):
         Service.__init__(self, domain=domain)
         self.logger = logger
@@ -81,7 +81,7 @@ class GlobalMemory(Memory):
         table_name = self.domain.get_domain_name()
         query_result = self.domain.query_db(
             f'SELECT {attribute_name} FROM {table_name} '
-            f'WHERE {primary_key_name} = \'{primary_key_value}\'')
+            f'WHERE {primary_key_name} = ?', (primary_key_value,))
         if not query_result:
             raise ValueError(f"Couldn't find an entry for primary key {primary_key_value}.")
         return query_result[0][attribute_name]
@@ -19,14 +19,16 @@
 
 """ This module provides the BeliefState class. """
 
-import copy
+from typing import Any, Callable, Hashable, Union
 
+from utils.cowdict import CowDict, peek, plain_copy
 from utils.domain.jsonlookupdomain import JSONLookupDomain
 
 
 class BeliefState:
     """
     A representation of the belief state, can be accessed like a dictionary.
+    Each turn shares the unchanged parts of the previous turn (copy on write), turns in the history are read-only.
 
     Includes information on:
         * current set of UserActTypes
@@ -35,10 +37,13 @@ class BeliefState:
         * number of db matches for given constraints
         * if the db matches can further be split
 
+    Results derived from the informs of a turn (e.g. `get_most_probable_inf_beliefs`) are memoized until the
+    informs are replaced or a new turn starts, see `memoize`.
     """
     def __init__(self, domain: JSONLookupDomain):
         self.domain = domain
         self._history = [self._init_beliefstate()]
+        self._memo = {}  # (turn, key) -> result derived from the informs of the turn
 
     def __getitem__(self, val):  # for indexing
         # if used with numbers: int (e.g. state[-2]) or slice (e.g. state[3:6])
@@ -55,6 +60,8 @@ class BeliefState:
     def __setitem__(self, key, val):
         # e.g. state['beliefs']['area']['west'] = 1.0
         self._history[-1][key] = val
+        if key == "informs":
+            self._memo.clear()
 
     def __len__(self):
         return len(self._history)
@@ -82,14 +89,43 @@ class BeliefState:
     def __str__(self):
         return self._recursive_repr(self._history[-1])
 
+    def snapshot(self, with_previous: bool = True) -> 'BeliefStateSnapshot':
+        """ Returns a compact copy of the current turn for publishing, see `BeliefStateSnapshot`
+
+        Args:
+            with_previous (bool): include the changes against the previous turn
+        """
+        return BeliefStateSnapshot(self, with_previous)
+
     def start_new_turn(self):
         """
         ONLY to be called by the belief state tracker at the begin of each turn,
         to ensure the correct history can be accessed correctly by other modules
         """
 
-        # copy last turn's dict
-        self._history.append(copy.deepcopy(self._history[-1]))
+        # the last turn becomes history, the new turn copies its values when they are accessed
+        self._history[-1].freeze()
+        self._history.append(CowDict.share(self._history[-1]))
+        self._memo.clear()
+
+    def memoize(self, key: Hashable, compute: Callable[[], Any], turn_idx: int = -1) -> Any:
+        """ Returns the result of `compute()` for a turn, computing it only once per turn and key
+
+        The result may only depend on the informs of the turn. It is kept until the informs are replaced
+        (`state['informs'] = ...`) or a new turn starts; changes inside the informs after the first call in a
+        turn are not noticed, so the belief state tracker has to finish updating the informs first.
+
+        Args:
+            key (Hashable): identifies the computation and its arguments
+            compute (Callable[[], Any]): computes the result, don't modify the result afterwards
+            turn_idx: index for accessing the belief state history (default = -1: use last turn)
+        """
+        turn = turn_idx + len(self._history) if turn_idx < 0 else turn_idx
+        try:
+            return self._memo[(turn, key)]
+        except KeyError:
+            result = self._memo[(turn, key)] = compute()
+            return result
 
     def _init_beliefstate(self):
         """Initializes the belief state based on the currently active domain
@@ -101,11 +137,11 @@ class BeliefState:
         """
 
         # TODO: revist when we include probabilites, sets should become dictionaries
-        belief_state = {"user_acts": set(),
-                        "informs": {},
-                        "requests": {},
-                        "num_matches": 0,
-                        "discriminable": True}
+        belief_state = CowDict({"user_acts": set(),
+                                "informs": {},
+                                "requests": {},
+                                "num_matches": 0,
+                                "discriminable": True})
 
         return belief_state
 
@@ -134,10 +170,10 @@ class BeliefState:
             threshold.
         """
 
-        informs = self._history[turn_idx]["informs"]
+        informs = peek(self._history[turn_idx], "informs")
         candidates = []
         if slot in informs:
-            sorted_slot_cands = sorted(informs[slot].items(), key=lambda kv: kv[1], reverse=True)
+            sorted_slot_cands = sorted(peek(informs, slot).items(), key=lambda kv: kv[1], reverse=True)
             # restrict result count to specified maximum
             filtered_slot_cands = sorted_slot_cands[:max_results]
             # threshold by probabilities
@@ -169,11 +205,21 @@ class BeliefState:
             threshold.
         """
 
+        candidates = self.memoize(("inf_beliefs", consider_NONE, threshold, max_results),
+                                  lambda: self._most_probable_inf_beliefs(threshold, max_results, turn_idx), turn_idx)
+        # callers may modify the result
+        if max_results == 1:
+            return dict(candidates)
+        return {slot: list(values) for slot, values in candidates.items()}
+
+    def _most_probable_inf_beliefs(self, threshold: float, max_results: int, turn_idx: int):
+        """ Computes `get_most_probable_inf_beliefs` """
         candidates = {}
-        informs = self._history[turn_idx]["informs"]
+        # read without copying the current turn's values
+        informs = peek(self._history[turn_idx], "informs")
         for slot in informs:
             # sort by belief
-            sorted_slot_cands = sorted(informs[slot].items(), key=lambda kv: kv[1], reverse=True)
+            sorted_slot_cands = sorted(peek(informs, slot).items(), key=lambda kv: kv[1], reverse=True)
             # restrict result count to specified maximum
             filtered_slot_cands = sorted_slot_cands[:max_results]
             # threshold by probabilities
@@ -197,7 +243,7 @@ class BeliefState:
         """
 
         candidates = []
-        for req_slot in self._history[turn_idx]['requests']:
+        for req_slot in peek(self._history[turn_idx], "requests"):
             candidates.append(req_slot)
         return candidates
 
@@ -216,24 +262,97 @@ class BeliefState:
         candidates = self.get_most_probable_inf_beliefs(consider_NONE=True, threshold=0.7,
                                                         max_results=1)
         constraints = self._remove_dontcare_slots(candidates)
-        db_matches = self.domain.find_entities(constraints, self.domain.get_informable_slots())
-        num_matches = len(db_matches)
+        dontcare_slots = set(candidates.keys()) - set(constraints.keys())
+        informable_slots = set(self.domain.get_informable_slots()) - set(self.domain.get_primary_key())
+        # slots which could be used to gather more information
+        open_slots = [slot for slot in informable_slots if slot not in dontcare_slots]
+        # count matches and distinct values in the database instead of fetching all matching entities
+        num_matches, num_values = self.domain.count_distinct_values(constraints, open_slots)
 
         # check if matching db entities could be discriminated by more
-        # information from user
-        discriminable = False
-        if len(db_matches) > 1:
-            dontcare_slots = set(candidates.keys()) - set(constraints.keys())
-            informable_slots = set(self.domain.get_informable_slots()) - set(self.domain.get_primary_key())
-            for informable_slot in informable_slots:
-                if informable_slot not in dontcare_slots:
-                    # this slot could be used to gather more information
-                    db_values_for_slot = set()
-                    for db_match in db_matches:
-                        db_values_for_slot.add(db_match[informable_slot])
-                    if len(db_values_for_slot) > 1:
-                        # at least 2 different values for slot
-                        # ->can use this slot to differentiate between entities
-                        discriminable = True
-                        break
+        # information from user: at least 2 different values for a slot
+        discriminable = num_matches > 1 and any(num > 1 for num in num_values.values())
         return num_matches, discriminable
+
+
+class _SnapshotHistory(object):
+    """ Turn history of a `BeliefStateSnapshot`: the current turn, the previous turn (rebuilt from the changes)
+        and, if the snapshot was not sent to another process, the older turns of the original belief state
+    """
+
+    def __init__(self, num_turns: int, current: dict, changes: Union[dict, None], removed: set,
+                 source: Union[BeliefState, None]):
+        self.num_turns = num_turns
+        self.current = current
+        self.changes = changes
+        self.removed = removed
+        self.source = source
+        self._previous = None
+
+    def __len__(self):
+        return self.num_turns
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[turn] for turn in range(*index.indices(self.num_turns))]
+        if index < 0:
+            index += self.num_turns
+        if index == self.num_turns - 1:
+            return self.current
+        if index == self.num_turns - 2 and self.changes is not None:
+            if self._previous is None:
+                previous = {key: value for key, value in self.current.items() if key not in self.removed}
+                previous.update(self.changes)
+                self._previous = previous
+            return self._previous
+        if self.source is not None and 0 <= index < self.num_turns:
+            return self.source._history[index]
+        raise IndexError(f"turn {index} is not part of the belief state snapshot, publish the full belief state "
+                         f"to access older turns")
+
+
+class BeliefStateSnapshot(BeliefState):
+    """
+    Compact copy of a `BeliefState` for publishing: holds the current turn (informs, requests, user act types,
+    number of db matches and discriminability) and optionally the changes against the previous turn, but
+    neither the older turns nor the domain. Its size doesn't grow with the length of the dialog.
+
+    Can be used like the belief state it was taken from (read-only). Older turns and the domain are only
+    available as long as the snapshot stays in the process of the belief state tracker: in other processes
+    the methods which need the domain (e.g. `get_num_dbmatches`) raise a `RuntimeError`.
+    """
+    def __init__(self, beliefstate: BeliefState, with_previous: bool = True):
+        """
+        Args:
+            beliefstate (BeliefState): belief state to take the snapshot of
+            with_previous (bool): include the changes against the previous turn, so that `snapshot[-2]` works
+        """
+        self._domain = beliefstate.domain
+        self._memo = dict(beliefstate._memo)
+        current = plain_copy(beliefstate[-1])
+        changes, removed = None, set()
+        if with_previous and len(beliefstate) > 1:
+            previous = beliefstate[-2]
+            changes = {key: plain_copy(peek(previous, key)) for key in previous
+                       if key not in current or current[key] != peek(previous, key)}
+            removed = {key for key in current if key not in previous}
+        self._history = _SnapshotHistory(len(beliefstate), current, changes, removed, beliefstate)
+
+    @property
+    def domain(self) -> JSONLookupDomain:
+        if self._domain is None:
+            raise RuntimeError("the domain of a belief state snapshot is not sent to other processes, "
+                               "read the number of database matches from snapshot['num_matches'] instead")
+        return self._domain
+
+    def __getstate__(self):
+        # only the snapshot itself is sent to other processes
+        state = self.__dict__.copy()
+        state['_domain'] = None
+        history = state['_history']
+        state['_history'] = _SnapshotHistory(history.num_turns, history.current, history.changes, history.removed,
+                                             None)
+        return state
+
+    def snapshot(self, with_previous: bool = True) -> 'BeliefStateSnapshot':
+        return self
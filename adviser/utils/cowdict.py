@@ -0,0 +1,173 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+""" This module provides a copy-on-write dictionary for the turn history of dialog states. """
+
+import copy
+from collections.abc import Mapping
+from enum import Enum
+from typing import Any, Hashable
+
+# values which can be shared between dictionaries without copying them
+_IMMUTABLE = (str, int, float, complex, bool, bytes, type(None), frozenset, Enum)
+
+
+def _is_immutable(value: Any) -> bool:
+    if isinstance(value, tuple):
+        return all(_is_immutable(item) for item in value)
+    return isinstance(value, _IMMUTABLE)
+
+
+def _private_copy(value: Any) -> Any:
+    """ Returns a copy of `value` which can be modified without changing `value` """
+    if isinstance(value, dict):
+        return CowDict.share(value)
+    if isinstance(value, set):
+        return set(value)
+    return copy.deepcopy(value)
+
+
+def peek(mapping: dict, key: Hashable) -> Any:
+    """ Reads a value of a (copy-on-write) dictionary without taking a private copy, don't modify the result """
+    if isinstance(mapping, dict):
+        return dict.__getitem__(mapping, key)
+    return mapping[key]
+
+
+def plain_copy(value: Any) -> Any:
+    """ Returns a deep copy of `value` with all (copy-on-write) dictionaries turned into plain dictionaries """
+    if isinstance(value, dict):
+        return {key: plain_copy(item) for key, item in dict.items(value)}
+    if isinstance(value, Mapping):
+        # dictionary views, e.g. on the array of a `VectorBeliefState`
+        return {key: plain_copy(item) for key, item in value.items()}
+    if isinstance(value, set):
+        return set(value)
+    if isinstance(value, list):
+        return [plain_copy(item) for item in value]
+    return value if _is_immutable(value) else copy.deepcopy(value)
+
+
+def _restore(items: dict, shared: set, frozen: bool) -> 'CowDict':
+    cow_dict = CowDict(items)
+    cow_dict._shared = shared
+    cow_dict._frozen = frozen
+    return cow_dict
+
+
+class CowDict(dict):
+    """ Dictionary which shares its mutable values with another dictionary until they are accessed.
+
+        `CowDict.share(other)` only copies the top level of `other`. A nested dictionary, set or other mutable value
+        is copied when it is first read from the new dictionary (`[]`, `get`, `items`, ...), so it can be modified
+        without changing `other`. Nested dictionaries become `CowDict`s themselves: only the accessed path is
+        copied, everything else stays shared. Changes to `other` after sharing are not isolated, so share
+        from dictionaries which are not modified any more (see `freeze`).
+    """
+
+    __slots__ = ('_shared', '_frozen')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shared = set()  # keys whose values are shared with another dictionary
+        self._frozen = False
+
+    @classmethod
+    def share(cls, other: dict) -> 'CowDict':
+        """ Returns a copy of `other` sharing its values until they are accessed """
+        cow_dict = cls(other)
+        cow_dict._shared = {key for key, value in dict.items(other) if not _is_immutable(value)}
+        return cow_dict
+
+    def freeze(self):
+        """ Marks this dictionary (and the nested dictionaries copied into it) as read-only history:
+            reading no longer copies shared values. Frozen dictionaries must not be modified.
+        """
+        if self._frozen:
+            return
+        self._frozen = True
+        for key, value in dict.items(self):
+            if key not in self._shared and isinstance(value, CowDict):
+                value.freeze()
+
+    def _own(self, key: Hashable) -> Any:
+        """ Returns the value of `key`, replacing it by a private copy first if it is shared """
+        value = dict.__getitem__(self, key)
+        if key in self._shared and not self._frozen:
+            value = _private_copy(value)
+            dict.__setitem__(self, key, value)
+            self._shared.discard(key)
+        return value
+
+    def _own_all(self):
+        for key in list(self._shared):
+            self._own(key)
+
+    def __getitem__(self, key):
+        return self._own(key)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._shared.discard(key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._shared.discard(key)
+
+    def get(self, key, default=None):
+        return self._own(key) if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self._own(key)
+        self[key] = default
+        return default
+
+    def pop(self, key, *default):
+        self._shared.discard(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._shared.discard(key)
+        return key, value
+
+    def clear(self):
+        dict.clear(self)
+        self._shared.clear()
+
+    def update(self, *args, **kwargs):
+        updates = dict(*args, **kwargs)
+        dict.update(self, updates)
+        self._shared.difference_update(updates)
+
+    def values(self):
+        self._own_all()
+        return dict.values(self)
+
+    def items(self):
+        self._own_all()
+        return dict.items(self)
+
+    def copy(self) -> 'CowDict':
+        return CowDict.share(self)
+
+    def __reduce__(self):
+        # values shared between dictionaries are pickled once
+        return _restore, (dict(dict.items(self)), set(self._shared), self._frozen)
@@ -0,0 +1,128 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+""" This module provides an in-memory bitset index over the entities of a closed-ontology domain. """
+
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Union
+
+# case folding of sqlite's `COLLATE NOCASE` (ASCII only)
+NOCASE = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def fold(value) -> str:
+    """ Normalizes a slot value the way sqlite compares it with `COLLATE NOCASE` """
+    return str(value).translate(NOCASE)
+
+
+def popcount(bits: int) -> int:
+    """ Number of entities in a bitset """
+    return bin(bits).count("1")
+
+
+class EntityIndex(object):
+    """ Keeps one bitset over all entities per (slot, value): bit i is set if entity i has the value.
+
+        Matching a set of constraints is a bitwise AND of one bitset per constrained slot, counting the
+        matches is a popcount. Bitsets are python integers, so they are packed and have no size limit.
+        Values are compared case-insensitively, like `JSONLookupDomain.find_entities`.
+    """
+
+    def __init__(self, rows: List[dict], slots: Iterable[str]):
+        """
+        Args:
+            rows (List[dict]): all entities of the domain (all columns), in database order
+            slots (Iterable[str]): slots to index, e.g. the informable slots and the primary key
+        """
+        self.rows = rows
+        self.slots = frozenset(slots)
+        self.all = (1 << len(rows)) - 1
+        self._bits = {slot: defaultdict(int) for slot in self.slots}
+        self._exact_bits = {slot: defaultdict(int) for slot in self.slots}  # not case-folded, including NULL
+        for position, row in enumerate(rows):
+            bit = 1 << position
+            for slot in self.slots:
+                value = row.get(slot)
+                self._exact_bits[slot][value] |= bit
+                if value is not None:  # NULL never matches in sqlite
+                    self._bits[slot][fold(value)] |= bit
+        self._bits = {slot: dict(values) for slot, values in self._bits.items()}
+        self._exact_bits = {slot: dict(values) for slot, values in self._exact_bits.items()}
+
+    def __len__(self):
+        """ Number of entities """
+        return len(self.rows)
+
+    def covers(self, slots: Iterable[str]) -> bool:
+        """ Returns whether all given slots (e.g. the constrained ones) are indexed """
+        return all(slot in self.slots for slot in slots)
+
+    def match(self, constraints: Dict[str, str]) -> int:
+        """ Returns the bitset of all entities which have the given value for every constrained slot
+
+        Args:
+            constraints (Dict[str, str]): slot -> value, all slots have to be indexed (see `covers`)
+        """
+        bits = self.all
+        for slot, value in constraints.items():
+            bits &= self._bits[slot].get(fold(value), 0)
+            if not bits:
+                break
+        return bits
+
+    def count(self, constraints: Dict[str, str]) -> int:
+        """ Returns the number of entities matching the constraints (see `match`) """
+        return popcount(self.match(constraints))
+
+    def positions(self, bits: int) -> Iterator[int]:
+        """ Yields the positions of all entities in a bitset, in database order """
+        while bits:
+            lowest = bits & -bits
+            yield lowest.bit_length() - 1
+            bits ^= lowest
+
+    def entities(self, bits: int, columns: Union[Iterable[str], None] = None) -> List[dict]:
+        """ Returns the entities of a bitset
+
+        Args:
+            bits (int): bitset, e.g. returned by `match`
+            columns (Iterable[str]): columns to return, `None` for all
+
+        Returns:
+            a new dict per entity
+        """
+        if columns is None:
+            return [dict(self.rows[position]) for position in self.positions(bits)]
+        columns = sorted(columns)
+        return [{column: self.rows[position][column] for column in columns} for position in self.positions(bits)]
+
+    def value_counts(self, bits: int, slot: str) -> Dict[str, int]:
+        """ Returns how many entities of a bitset have each (case-folded) value of an indexed slot """
+        counts = {}
+        for value, value_bits in self._bits[slot].items():
+            count = popcount(bits & value_bits)
+            if count:
+                counts[value] = count
+        return counts
+
+    def distinct_count(self, bits: int, slot: str) -> int:
+        """ Returns the number of distinct values (compared exactly, NULL counts as a value) of an indexed slot
+            among the entities of a bitset
+        """
+        return sum(1 for value_bits in self._exact_bits[slot].values() if bits & value_bits)
@@ -20,11 +20,73 @@
 
 import json
 import os
+import re
 import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
 from io import StringIO
-from typing import List, Iterable
+from typing import Dict, List, Iterable, Tuple, Union
+from urllib.request import pathname2url
 
 from utils.domain import Domain
+from utils.domain.entityindex import EntityIndex, NOCASE, popcount
+
+
+# ways of loading the database, see `JSONLookupDomain`
+DB_MODES = ('memory', 'mmap', 'disk', 'dump')
+
+# page cache per connection in `disk` mode (KiB)
+_DISK_CACHE_SIZE = 65536
+
+# prepared statements kept per connection (sqlite3 default: 128)
+_CACHED_STATEMENTS = 512
+
+_IDENTIFIER = re.compile(r"\w+")
+
+# bound values per query of `find_entities_batch` (SQLITE_MAX_VARIABLE_NUMBER of older sqlite versions)
+_MAX_BATCH_PARAMS = 999
+
+# sqlite has the JSON functions built in: lists of rowids are bound as one JSON array, otherwise written into the query
+_JSON_ARRAYS = sqlite3.sqlite_version_info >= (3, 38, 0)
+
+# matching entities kept per session by incremental queries, larger result sets are searched via the indexes again
+# (without JSON arrays, this bounds the length of the rowid lists written into queries)
+_MAX_CANDIDATES = 5000 if _JSON_ARRAYS else _MAX_BATCH_PARAMS
+
+
+class ResultCache(object):
+    """ Thread-safe LRU cache for query results, see `JSONLookupDomain` """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Union[List[dict], None]:
+        with self._lock:
+            try:
+                self._results.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._results[key]
+
+    def put(self, key, rows: List[dict]):
+        with self._lock:
+            self._results[key] = rows
+            if len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def info(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._results), 'maxsize': self.maxsize}
 
 
 class JSONLookupDomain(Domain):
@@ -33,7 +95,9 @@ class JSONLookupDomain(Domain):
     """
 
     def __init__(self, name: str, json_ontology_file: str = None, sqllite_db_file: str = None, \
-                 display_name: str = None):
+                 display_name: str = None, db_mode: str = 'memory', auto_index: bool = True,
+                 composite_indexes: List[Tuple[str, ...]] = None, result_cache_size: int = 1024,
+                 entity_index: bool = False, connection_pool: bool = True, incremental_sessions: int = 0):
         """ Loads the ontology from a json file and the data from a sqllite
             database.
 
@@ -49,8 +113,55 @@ class JSONLookupDomain(Domain):
                                 (from the top-level adviser directory, e.g. resources/databases)
             display_name (str): the domain's name as it appears on the screen
                                 (e.g. containing whitespaces)
+            db_mode (str): how to load the database:
+                           `memory` copies it into memory page by page (sqlite backup API),
+                           `mmap` opens the file read-only and memory-maps it, so all processes share the
+                           pages of the OS file cache (the file must not change while it is open),
+                           `disk` queries the file in place (read-only, memory-mapped, larger page cache), for
+                           catalogs too large to copy into every process. The file may be updated while it is
+                           read (e.g. by a catalog import), switch it to WAL mode first (see `enable_wal`).
+                           Changes are picked up by the next query,
+                           `dump` replays an SQL dump of the file into memory (slowest)
+            auto_index (bool): index the informable slots and the primary key after loading the database.
+                               In `mmap` and `disk` mode the database is read-only, only the indexes stored in
+                               the file are used (see `create_indexes`)
+            composite_indexes (List[Tuple[str, ...]]): additional indexes over slots which are often
+                                                       constrained together, e.g. [('area', 'food')]
+            result_cache_size (int): number of `find_entities` / `find_info_about_entity` results to keep
+                                     (least recently used are dropped first), 0 disables the cache.
+                                     The cache is cleared whenever the database is changed via this domain.
+            entity_index (bool): keep a bitset per value of every informable slot and the primary key in memory
+                                 (see `utils.domain.entityindex.EntityIndex`), built on first use.
+                                 Constraints on these slots are then matched without sqlite.
+                                 Meant for closed-ontology domains, the index holds a copy of all entities.
+            connection_pool (bool): give every thread its own read connection to the database, so that lookups of
+                                    different threads (e.g. services or sessions) don't share one connection.
+                                    In `memory` and `dump` mode all connections use the same in-memory database
+                                    (sqlite shared cache), in `mmap` mode they map the same file.
+                                    If False, all threads use one connection.
+            incremental_sessions (int): for how many dialog sessions (least recently used are dropped first) to keep
+                                        the entities matched by the last `find_entities` / `count_distinct_values`
+                                        call. If a session only adds constraints, only these candidates are
+                                        filtered instead of searching the whole table. Pays off for large tables,
+                                        0 disables it. Not used for constraints covered by the entity index.
         """
+        assert db_mode in DB_MODES, f"db_mode has to be one of {DB_MODES}"
         super(JSONLookupDomain, self).__init__(name)
+        self.db_mode = db_mode
+        self.auto_index = auto_index
+        self.composite_indexes = [tuple(slots) for slots in composite_indexes or []]
+        self._query_shapes = {}  # (selected columns, constrained slots[, 'COUNT']) -> SQL
+        self.result_cache_size = result_cache_size
+        self._result_cache = ResultCache(result_cache_size)
+        self._db_changes = 0  # total changes of the database when the cache was last validated
+        self.use_entity_index = entity_index
+        self._entity_index = None
+        self.connection_pool = connection_pool
+        self._thread_connections = threading.local()
+        self._pool_changes = 0  # changes made via the connections of the pool
+        self._version_lock = threading.Lock()
+        self.incremental_sessions = incremental_sessions
+        self._candidates = ResultCache(incremental_sessions)  # session -> (folded constraints, rowids)
 
         root_dir = self._get_root_dir()
         self.sqllite_db_file = sqllite_db_file
@@ -71,8 +182,24 @@ class JSONLookupDomain(Domain):
         state = self.__dict__.copy()
         if 'db' in state:
             del state['db']
+        # the database of the pool only exists in this process
+        for attribute in ('_thread_connections', '_version_lock', '_db_uri', '_db_mmap_size', '_db_cache_size'):
+            state.pop(attribute, None)
+        # don't send cached results along with the domain
+        state.pop('_result_cache', None)
+        state.pop('_candidates', None)
+        state['_entity_index'] = None
         return state
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._result_cache = ResultCache(state.get('result_cache_size', 0))
+        self._candidates = ResultCache(state.get('incremental_sessions', 0))
+        self._db_changes = 0
+        self._thread_connections = threading.local()
+        self._pool_changes = 0
+        self._version_lock = threading.Lock()
+
     def _get_root_dir(self):
         """ Returns the path to the root directory """
         return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -87,7 +214,7 @@ class JSONLookupDomain(Domain):
 
     def _load_db_to_memory(self, db_file_path : str):
         """ Loads a sqllite3 database from file to memory in order to save
-            I/O operations
+            I/O operations (or memory-maps it, depending on `db_mode`)
 
         Args:
             db_file_path (str): absolute path to database file
@@ -95,22 +222,130 @@ class JSONLookupDomain(Domain):
         Returns:
             A sqllite3 connection
         """
+        db_mode = getattr(self, 'db_mode', 'memory')  # unpickled from an older version
+        # connections of the pool open the same database, see `_connection`
+        self._db_mmap_size = 0
+        self._db_cache_size = 0
+        if getattr(self, 'connection_pool', False):
+            self._db_uri = f"file:adviser_{self.name}_{uuid.uuid4().hex}?mode=memory&cache=shared"
+        else:
+            self._db_uri = ":memory:"
+        if db_mode == 'mmap':
+            # read-only and immutable: no locking, pages are shared via the OS file cache
+            self._db_uri = f"file:{pathname2url(db_file_path)}?mode=ro&immutable=1"
+            self._db_mmap_size = os.path.getsize(db_file_path)
+            db = self._connect(check_same_thread=False)
+        elif db_mode == 'disk':
+            # read-only but not immutable: sees changes committed to the file by other processes
+            self._db_uri = f"file:{pathname2url(db_file_path)}?mode=ro"
+            self._db_mmap_size = os.path.getsize(db_file_path)
+            self._db_cache_size = _DISK_CACHE_SIZE
+            db = self._connect(check_same_thread=False)
+        elif db_mode == 'memory':
+            # copy the database pages without re-parsing them
+            file_db = sqlite3.connect(f"file:{pathname2url(db_file_path)}?mode=ro", uri=True)
+            db = self._connect(check_same_thread=False)
+            file_db.backup(db)
+            file_db.close()
+        else:
+            # open and read db file to temporary file
+            file_db = sqlite3.connect(db_file_path, check_same_thread=False)
+            tempfile = StringIO()
+            for line in file_db.iterdump():
+                tempfile.write('%s\n' % line)
+            file_db.close()
+            tempfile.seek(0)
+            # Create a database in memory and import from temporary file
+            db = self._connect(check_same_thread=False)
+            db.cursor().executescript(tempfile.read())
+            db.commit()
+        if getattr(self, 'auto_index', False) and db_mode not in ('mmap', 'disk'):
+            self.create_indexes(db)
+        db.row_factory = self._sqllite_dict_factory
+        return db
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        """ Opens a new connection to the database of this domain (`_db_uri`) """
+        db = sqlite3.connect(self._db_uri, uri=True, check_same_thread=check_same_thread,
+                             cached_statements=_CACHED_STATEMENTS)
+        if self._db_mmap_size:
+            db.execute(f"PRAGMA mmap_size = {self._db_mmap_size}")
+        if self._db_cache_size:
+            db.execute(f"PRAGMA cache_size = -{self._db_cache_size}")
+        return db
 
-        # open and read db file to temporary file
-        file_db = sqlite3.connect(db_file_path, check_same_thread=False)
-        tempfile = StringIO()
-        for line in file_db.iterdump():
-            tempfile.write('%s\n' % line)
+    def _db_file_path(self) -> str:
+        """ Returns the absolute path to the database file """
+        sqllite_db_file = self.sqllite_db_file or os.path.join('resources', 'databases', self.name + '.db')
+        return self._get_root_dir() + '/' + sqllite_db_file
+
+    def enable_wal(self):
+        """ Switches the database file to write-ahead logging (a persistent setting of the file).
+            Then a writer (e.g. a catalog import) doesn't block domains reading the file in `disk` mode and
+            they keep seeing a consistent state until the writer commits.
+        """
+        file_db = sqlite3.connect(self._db_file_path())
+        file_db.execute("PRAGMA journal_mode = WAL")
         file_db.close()
-        tempfile.seek(0)
-        # Create a database in memory and import from temporary file
-        db = sqlite3.connect(':memory:', check_same_thread=False)
-        db.row_factory = self._sqllite_dict_factory
-        db.cursor().executescript(tempfile.read())
+
+    def refresh(self):
+        """ Reloads the database file without restarting the services using this domain, e.g. after the catalog
+            was updated. Drops all cached results. Not required in `disk` mode, which picks up changes itself.
+        """
+        db = self._load_db_to_memory(self._db_file_path())
+        # threads open new connections to the reloaded database
+        self._thread_connections = threading.local()
+        self.db = db
+        self._db_changes = None
+        self._check_db_changes()
+
+    def create_indexes(self, db: sqlite3.Connection):
+        """ Creates case-insensitive indexes on all informable slots, the primary key and the configured
+            composite indexes (if not existing yet), then updates the query planner statistics.
+            To index a database file used in `mmap` mode, pass a writable connection to the file.
+
+        Args:
+            db (sqlite3.Connection): connection to the domain's database
+        """
+        table = self.get_domain_name()
+        columns = {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+        # existing indexes as tuples of (column, collation)
+        existing = set()
+        for index in db.execute(f"PRAGMA index_list({table})").fetchall():
+            existing.add(tuple((row[2], row[4].upper()) for row in db.execute(f"PRAGMA index_xinfo(\"{index[1]}\")")
+                               if row[5]))  # key columns only
+        primary_key = self.get_primary_key()
+        # `find_entities` compares case-insensitively, `find_info_about_entity` compares the primary key exactly
+        indexes = [((slot, 'NOCASE'),) for slot in self.get_informable_slots()]
+        indexes.append(((primary_key, 'NOCASE'),))
+        indexes.append(((primary_key, 'BINARY'),))
+        indexes += [tuple((slot, 'NOCASE') for slot in slots) for slots in self.composite_indexes if len(slots) > 1]
+        for index in indexes:
+            if index in existing or not all(slot in columns for slot, _ in index):
+                continue
+            name = f"idx_{table}_{'_'.join(slot for slot, _ in index)}"
+            if index[0][1] == 'BINARY':
+                name += "_exact"
+            db.execute(f"CREATE INDEX IF NOT EXISTS \"{name}\" ON {table} "
+                       f"({', '.join(f'{slot} COLLATE {collation}' for slot, collation in index)})")
+            existing.add(index)
+        db.execute("ANALYZE")
         db.commit()
-        # file_db.backup(databases[domain]) # works only in python >= 3.7
 
-        return db
+    def explain_query(self, constraints: dict, requested_slots: Iterable = iter(())) -> List[str]:
+        """ Diagnostic: returns how sqlite executes the query `find_entities` runs for the given arguments,
+            e.g. ['SEARCH ImsLecturers USING INDEX idx_ImsLecturers_department (department=?)'].
+            'SCAN' means that every row of the table is read (missing index).
+
+        Args:
+            constraints (dict): Slot-value mapping of constraints
+            requested_slots (Iterable): additional slots, see `find_entities`
+
+        Returns:
+            one line per step of the query plan
+        """
+        query, params = self._find_entities_query(constraints, requested_slots)
+        return [row['detail'] for row in self.query_db("EXPLAIN QUERY PLAN " + query, params)]
 
     def find_entities(self, constraints: dict, requested_slots: Iterable = iter(())):
         """ Returns all entities from the data backend that meet the constraints, with values for
@@ -124,17 +359,296 @@ class JSONLookupDomain(Domain):
                                         system requestable slots and the primary key
 
         """
-        # values for name and all system requestable slots
-        select_clause = ", ".join(set([self.get_primary_key()]) |
-                                  set(self.get_system_requestable_slots()) |
-                                  set(requested_slots))
-        query = "SELECT {} FROM {}".format(select_clause, self.get_domain_name())
-        constraints = {slot: value.replace("'", "''") for slot, value in constraints.items()
-                       if value is not None and str(value).lower() != 'dontcare'}
-        if constraints:
-            query += ' WHERE ' + ' AND '.join("{}='{}' COLLATE NOCASE".format(key, str(val))
-                                              for key, val in constraints.items())
-        return self.query_db(query)
+        if self.use_entity_index:
+            index = self.entity_index()
+            normalized = self._normalize_constraints(constraints)
+            if index.covers(normalized):
+                return index.entities(index.match(normalized), self._result_columns(requested_slots))
+        if self._candidates.maxsize > 0:
+            rowids = self._candidate_rowids(self._normalize_constraints(constraints))
+            if rowids is not None:
+                columns = ", ".join(sorted(self._check_identifiers(self._result_columns(requested_slots))))
+                condition, params = self._rowid_condition(rowids)
+                return self.query_db("SELECT {} FROM {} WHERE {} ORDER BY rowid".format(
+                    columns, self.get_domain_name(), condition), params)
+        query, params = self._find_entities_query(constraints, requested_slots)
+        # constraints are compared case-insensitively
+        return self._cached_query((query, tuple(value.translate(NOCASE) for value in params)), query, params)
+
+    def count_entities(self, constraints: dict) -> int:
+        """ Returns the number of entities from the data backend that meet the constraints
+
+        Args:
+            constraints (dict): Slot-value mapping of constraints, see `find_entities`
+        """
+        return self.count_distinct_values(constraints, ())[0]
+
+    def count_distinct_values(self, constraints: dict, slots: Iterable[str]) -> Tuple[int, Dict[str, int]]:
+        """ Returns the number of entities that meet the constraints and, for each of the given slots, the
+            number of distinct values among these entities, without fetching the entities.
+            Values are compared exactly, a missing value (NULL) counts as one value.
+
+        Args:
+            constraints (dict): Slot-value mapping of constraints, see `find_entities`
+            slots (Iterable[str]): slots to count the distinct values of
+
+        Returns:
+            tuple(number of matching entities, dict slot -> number of distinct values)
+        """
+        constraints = self._normalize_constraints(constraints)
+        slots = tuple(sorted(set(slots)))
+        if self.use_entity_index:
+            index = self.entity_index()
+            if index.covers(constraints) and index.covers(slots):
+                bits = index.match(constraints)
+                return popcount(bits), {slot: index.distinct_count(bits, slot) for slot in slots}
+        rowids = None
+        if self._candidates.maxsize > 0:
+            rowids = self._candidate_rowids(constraints)
+        if rowids is not None:
+            condition, params = self._rowid_condition(rowids)
+            row = self.query_db("SELECT {} FROM {} WHERE {}".format(
+                self._aggregates(slots), self.get_domain_name(), condition), params)[0]
+        else:
+            query = self._count_query(constraints, slots)
+            params = tuple(constraints.values())
+            row = self._cached_query((query, tuple(value.translate(NOCASE) for value in params)), query, params)[0]
+        return row.pop('_matches'), row
+
+    def _count_query(self, constraints: Dict[str, str], slots: Tuple[str, ...]) -> str:
+        """ Builds the query for `count_distinct_values` (normalized constraints, sorted slots) """
+        shape = (slots, tuple(constraints), 'COUNT')
+        try:
+            return self._query_shapes[shape]
+        except KeyError:
+            query = "SELECT {} FROM {}".format(self._aggregates(slots), self.get_domain_name())
+            query += self._where_clause(constraints)
+            self._query_shapes[shape] = query
+            return query
+
+    def _aggregates(self, slots: Tuple[str, ...]) -> str:
+        """ Returns the select clause counting the matches and the distinct values of the given slots
+            in one aggregated pass over the matching rows
+        """
+        aggregates = ["COUNT(*) AS _matches"]
+        aggregates += ["COUNT(DISTINCT {0}) + IFNULL(MAX({0} IS NULL), 0) AS {0}".format(slot)
+                       for slot in self._check_identifiers(slots)]
+        return ", ".join(aggregates)
+
+    def _candidate_rowids(self, constraints: Dict[str, str]) -> Union[List[int], None]:
+        """ Returns the rowids of all entities matching the constraints (see `incremental_sessions`).
+
+            If the constraints of the last call in the current session are a subset of the given ones,
+            only the entities matched then are filtered, otherwise the whole table is searched.
+
+        Args:
+            constraints (Dict[str, str]): normalized constraints
+
+        Returns:
+            list of rowids, `None` if more than `_MAX_CANDIDATES` entities match
+        """
+        # imported here, the session store imports the domain classes
+        from services.session import current_session
+        self._check_db_changes()
+        session = current_session()
+        folded = {slot: value.translate(NOCASE) for slot, value in constraints.items()}
+        previous = self._candidates.get(session)
+        if previous is not None and folded == previous[0]:
+            return previous[1]
+        if previous is not None and previous[1] is not None and \
+                all(folded.get(slot) == value for slot, value in previous[0].items()):
+            # constraints were only added: filter the previous matches
+            added = {slot: value for slot, value in constraints.items() if slot not in previous[0]}
+            condition, params = self._rowid_condition(previous[1])
+            query = "SELECT rowid AS _rowid FROM {} WHERE {} AND {} ORDER BY rowid".format(
+                self.get_domain_name(), condition, self._conditions(added))
+            params += list(added.values())
+        else:
+            query = "SELECT rowid AS _rowid FROM {}".format(self.get_domain_name()) + self._where_clause(constraints)
+            query += " ORDER BY rowid LIMIT {}".format(_MAX_CANDIDATES + 1)
+            params = list(constraints.values())
+        rowids = [row['_rowid'] for row in self.query_db(query, params)]
+        if len(rowids) > _MAX_CANDIDATES:
+            # too many candidates, search the whole table again when the constraints change
+            rowids = None
+        self._candidates.put(session, (folded, rowids))
+        return rowids
+
+    def _rowid_condition(self, rowids: List[int]) -> Tuple[str, list]:
+        """ Returns the condition selecting the given rows and the values to bind """
+        if _JSON_ARRAYS:
+            return "rowid IN (SELECT value FROM json_each(?))", [json.dumps(rowids)]
+        # rowids are integers read from the database: written into the query, they don't count towards the
+        # bound values of a query (SQLITE_MAX_VARIABLE_NUMBER) next to the values of the constraints
+        return "rowid IN ({})".format(", ".join(str(int(rowid)) for rowid in rowids)), []
+
+    def find_entities_batch(self, constraints_list: List[dict],
+                            requested_slots: Iterable = iter(())) -> List[List[dict]]:
+        """ Runs `find_entities` for many sets of constraints at once.
+
+            All constraint sets constraining the same slots are answered by a single query (joining the table
+            with a list of their values), instead of one query per set.
+
+        Args:
+            constraints_list (List[dict]): Slot-value mappings of constraints, see `find_entities`
+            requested_slots (Iterable): slots returned in addition, see `find_entities`
+
+        Returns:
+            one list of entities per constraint set, in the same order as `find_entities` returns them
+        """
+        constraints_list = [self._normalize_constraints(constraints) for constraints in constraints_list]
+        columns = self._result_columns(requested_slots)
+        if self.use_entity_index:
+            index = self.entity_index()
+            if all(index.covers(constraints) for constraints in constraints_list):
+                return [index.entities(index.match(constraints), columns) for constraints in constraints_list]
+        queries = [self._find_entities_query(constraints, columns)[0] for constraints in constraints_list]
+        return self._batch_query(constraints_list, queries, columns)
+
+    def count_entities_batch(self, constraints_list: List[dict]) -> List[int]:
+        """ Runs `count_entities` for many sets of constraints at once, see `find_entities_batch`
+
+        Args:
+            constraints_list (List[dict]): Slot-value mappings of constraints, see `find_entities`
+
+        Returns:
+            the number of matching entities per constraint set
+        """
+        constraints_list = [self._normalize_constraints(constraints) for constraints in constraints_list]
+        if self.use_entity_index:
+            index = self.entity_index()
+            if all(index.covers(constraints) for constraints in constraints_list):
+                return [index.count(constraints) for constraints in constraints_list]
+        queries = [self._count_query(constraints, ()) for constraints in constraints_list]
+        return [rows[0]['_matches'] for rows in self._batch_query(constraints_list, queries, None)]
+
+    def _batch_query(self, constraints_list: List[Dict[str, str]], queries: List[str],
+                     columns: Union[frozenset, None]) -> List[List[dict]]:
+        """ Answers many single queries, taking the results from the result cache where possible and
+            running one query per shape (constrained slots) for the rest
+
+        Args:
+            constraints_list (List[Dict[str, str]]): normalized constraints
+            queries (List[str]): single query for each constraint set, used as cache key
+            columns (Union[frozenset, None]): selected columns, `None` to count the matches
+
+        Returns:
+            the rows of each single query
+        """
+        use_cache = self._result_cache.maxsize > 0
+        if use_cache:
+            self._check_db_changes()
+        keys = [(query, tuple(value.translate(NOCASE) for value in constraints.values()))
+                for constraints, query in zip(constraints_list, queries)]
+        results = {}  # cache key -> rows
+        missing = {}  # constrained slots -> cache key -> values
+        for constraints, query, key in zip(constraints_list, queries, keys):
+            params = tuple(constraints.values())
+            if key in results:
+                continue
+            rows = self._result_cache.get(key) if use_cache else None
+            if rows is not None:
+                results[key] = rows
+            elif not constraints:
+                results[key] = self.query_db(query)
+            else:
+                missing.setdefault(tuple(constraints), {})[key] = params
+        for slots, params_by_key in missing.items():
+            shape_keys = list(params_by_key)
+            chunk_size = _MAX_BATCH_PARAMS // (len(slots) + 1)
+            for start in range(0, len(shape_keys), chunk_size):
+                chunk = shape_keys[start:start + chunk_size]
+                rows_by_key = {key: [] for key in chunk}
+                values = []
+                for number, key in enumerate(chunk):
+                    values.append(number)
+                    values.extend(params_by_key[key])
+                for row in self.query_db(self._join_query(slots, columns, len(chunk)), values):
+                    rows_by_key[chunk[row.pop('_query')]].append(row)
+                results.update(rows_by_key)
+        if use_cache:
+            for key, rows in results.items():
+                self._result_cache.put(key, rows)
+        # callers may modify the returned rows
+        return [[dict(row) for row in results[key]] for key in keys]
+
+    def _join_query(self, slots: Tuple[str, ...], columns: Union[frozenset, None], num_queries: int) -> str:
+        """ Builds a query joining the table with `num_queries` rows of (query number, value per slot),
+            the result rows contain the query number as `_query`
+
+        Args:
+            slots (Tuple[str, ...]): constrained slots (sorted)
+            columns (Union[frozenset, None]): selected columns, `None` to count the matches
+            num_queries (int): number of value rows
+        """
+        value_columns = ", ".join(["_query"] + [f"_value{number}" for number in range(len(slots))])
+        value_rows = ", ".join(["(" + ", ".join("?" * (len(slots) + 1)) + ")"] * num_queries)
+        join = " AND ".join(f"entity.{slot} = _batch._value{number} COLLATE NOCASE"
+                            for number, slot in enumerate(self._check_identifiers(slots)))
+        query = f"WITH _batch({value_columns}) AS (VALUES {value_rows}) "
+        if columns is None:
+            # queries without matches still need their row
+            return query + (f"SELECT _batch._query AS _query, COUNT(entity.rowid) AS _matches FROM _batch "
+                            f"LEFT JOIN {self.get_domain_name()} AS entity ON {join} GROUP BY _batch._query")
+        selected = ", ".join(f"entity.{column} AS {column}" for column in sorted(self._check_identifiers(columns)))
+        return query + (f"SELECT _batch._query AS _query, {selected} FROM _batch "
+                        f"JOIN {self.get_domain_name()} AS entity ON {join} ORDER BY _batch._query, entity.rowid")
+
+    def _normalize_constraints(self, constraints: dict) -> Dict[str, str]:
+        """ Drops `dontcare` constraints and sorts the remaining ones by slot """
+        return {slot: str(value) for slot, value in sorted(constraints.items())
+                if value is not None and str(value).lower() != 'dontcare'}
+
+    def _result_columns(self, requested_slots: Iterable) -> frozenset:
+        """ Columns returned by `find_entities`: the requested slots, the primary key and the system requestable slots """
+        return frozenset(requested_slots) | {self.get_primary_key()} | set(self.get_system_requestable_slots())
+
+    def _where_clause(self, constraints: Dict[str, str]) -> str:
+        """ Returns the (case-insensitive) WHERE clause matching the constrained slots, values have to be bound """
+        if not constraints:
+            return ""
+        return ' WHERE ' + self._conditions(constraints)
+
+    def _conditions(self, constraints: Dict[str, str]) -> str:
+        """ Returns the case-insensitive conditions for the constrained slots, joined by AND """
+        return ' AND '.join("{}=? COLLATE NOCASE".format(slot) for slot in self._check_identifiers(constraints))
+
+    def _find_entities_query(self, constraints: dict, requested_slots: Iterable) -> Tuple[str, tuple]:
+        """ Builds the query for `find_entities`
+
+        Returns:
+            tuple(SQL with placeholders, values to bind)
+        """
+        constraints = self._normalize_constraints(constraints)
+        columns = self._result_columns(requested_slots)
+        shape = (columns, tuple(constraints))
+        try:
+            query = self._query_shapes[shape]
+        except KeyError:
+            # same SQL for the same shape: sqlite reuses the prepared statement
+            query = "SELECT {} FROM {}".format(", ".join(sorted(self._check_identifiers(columns))),
+                                               self.get_domain_name())
+            query += self._where_clause(constraints)
+            self._query_shapes[shape] = query
+        return query, tuple(constraints.values())
+
+    def entity_index(self) -> EntityIndex:
+        """ Returns the bitset index over all entities (see `entity_index` argument of the constructor),
+            (re-)building it if required, e.g. after the database was changed via this domain
+        """
+        self._check_db_changes()
+        index = self._entity_index
+        if index is None:
+            rows = self.query_db("SELECT * FROM {} ORDER BY rowid".format(self.get_domain_name()))
+            index = self._entity_index = EntityIndex(rows, set(self.get_informable_slots()) | {self.get_primary_key()})
+        return index
+
+    def _check_identifiers(self, slots: Iterable[str]) -> Iterable[str]:
+        """ Makes sure that slot names can't change the meaning of a query (values are bound instead) """
+        for slot in slots:
+            if not _IDENTIFIER.fullmatch(slot):
+                raise ValueError(f"invalid slot name: {slot!r}")
+        return slots
 
     def find_info_about_entity(self, entity_id, requested_slots: Iterable):
         """ Returns the values (stored in the data backend) of the specified slots for the
@@ -145,34 +659,102 @@ class JSONLookupDomain(Domain):
             requested_slots (dict): slot-value mapping of constraints
 
         """
-        if requested_slots:
-            select_clause = ", ".join(sorted(requested_slots))
-        # If the user hasn't specified any slots we don't know what they want so we give everything
-        else:
-            select_clause = "*"
-        query = 'SELECT {} FROM {} WHERE {}="{}";'.format(
-            select_clause, self.get_domain_name(), self.get_primary_key(), entity_id)
-        return self.query_db(query)
+        columns = frozenset(requested_slots)
+        shape = (columns, None)
+        try:
+            query = self._query_shapes[shape]
+        except KeyError:
+            if columns:
+                select_clause = ", ".join(sorted(self._check_identifiers(columns)))
+            # If the user hasn't specified any slots we don't know what they want so we give everything
+            else:
+                select_clause = "*"
+            query = 'SELECT {} FROM {} WHERE {}=?;'.format(
+                select_clause, self.get_domain_name(), self.get_primary_key())
+            self._query_shapes[shape] = query
+        return self._cached_query((query, entity_id), query, (entity_id,))
+
+    def _cached_query(self, key, query: str, params: tuple) -> List[dict]:
+        """ Looks up the result of a query in the result cache, runs the query on a cache miss
 
-    def query_db(self, query_str):
+        Args:
+            key (Hashable): normalized query, equal for all queries with the same result
+            query (str): SQL with placeholders
+            params (tuple): values bound to the placeholders
+
+        Returns:
+            a copy of the (cached) result rows
+        """
+        if self._result_cache.maxsize <= 0:
+            return self.query_db(query, params)
+        self._check_db_changes()
+        rows = self._result_cache.get(key)
+        if rows is None:
+            rows = self.query_db(query, params)
+            self._result_cache.put(key, rows)
+        # callers may modify the returned rows
+        return [dict(row) for row in rows]
+
+    def _check_db_changes(self):
+        """ Drops the cached results and the entity index if the database was changed since the last check """
+        self._connection()  # loads the database if required
+        changes = self.db.total_changes + self._pool_changes
+        if self.db_mode == 'disk':
+            # changes by other processes: the version only changes for the connection that read before
+            with self._version_lock:
+                changes = (changes, self.db.execute("PRAGMA data_version").fetchone()['data_version'])
+        if changes != self._db_changes:
+            # all cached results may be outdated
+            self._result_cache.clear()
+            self._candidates.clear()
+            self._entity_index = None
+            self._db_changes = changes
+
+    def result_cache_info(self) -> Dict[str, int]:
+        """ Returns the number of cache hits and misses and the current and maximum number of cached results """
+        return self._result_cache.info()
+
+    def clear_result_cache(self):
+        """ Drops all cached results, e.g. after the database file was changed by another process """
+        self._result_cache.clear()
+
+    def query_db(self, query_str, params: Iterable = ()):
         """ Function for querying the sqlite3 db
 
         Args:
-            query_str (string): sqlite3 query style string
+            query_str (string): sqlite3 query style string, use `?` placeholders for values
+            params (Iterable): values bound to the placeholders in `query_str`
 
         Return:
             (iterable): rows of the query response set
         """
-        if "db" not in self.__dict__:
-            root_dir = self._get_root_dir()
-            sqllite_db_file = self.sqllite_db_file or os.path.join(
-                'resources', 'databases', self.name + '.db')
-            self.db = self._load_db_to_memory(root_dir + '/' + sqllite_db_file)
-        cursor = self.db.cursor()
-        cursor.execute(query_str)
+        db = self._connection()
+        changes = db.total_changes
+        cursor = db.cursor()
+        cursor.execute(query_str, tuple(params))
         res = cursor.fetchall()
+        if db is not self.db and db.total_changes != changes:
+            self._pool_changes += db.total_changes - changes
         return res
 
+    def _connection(self) -> sqlite3.Connection:
+        """ Returns the database connection of the current thread (see `connection_pool`),
+            (re-)loads the database if required (e.g. after unpickling)
+        """
+        if "db" not in self.__dict__:
+            self.db = self._load_db_to_memory(self._db_file_path())
+        if not getattr(self, 'connection_pool', False):
+            return self.db
+        try:
+            return self._thread_connections.db
+        except AttributeError:
+            # closed when the thread ends; `self.db` keeps the in-memory database alive
+            db = self._thread_connections.db = self._connect()
+            db.row_factory = self._sqllite_dict_factory
+            # commit writes right away, open transactions would lock the tables for all other connections
+            db.isolation_level = None
+            return db
+
     def get_display_name(self):
         return self.display_name
 
@@ -17,7 +17,7 @@
 #
 ###############################################################################
 
-from typing import List, Iterable
+from typing import Dict, List, Iterable, Tuple
 from utils.domain.domain import Domain
 
 class LookupDomain(Domain):
@@ -40,6 +40,52 @@ class LookupDomain(Domain):
         """
         raise NotImplementedError
 
+    def count_entities(self, constraints : dict) -> int:
+        """ Returns the number of entities from the data backend that meet the constraints.
+
+        Args:
+            constraints (dict): slot-value mapping of constraints
+        """
+        return len(self.find_entities(constraints))
+
+    def count_distinct_values(self, constraints : dict, slots: Iterable[str]) -> Tuple[int, Dict[str, int]]:
+        """ Returns the number of entities that meet the constraints and, for each of the given slots, the
+            number of distinct values among these entities.
+
+            Override this function if the data backend can aggregate without returning all entities.
+
+        Args:
+            constraints (dict): slot-value mapping of constraints
+            slots (Iterable[str]): slots to count the distinct values of
+
+        Returns:
+            tuple(number of matching entities, dict slot -> number of distinct values)
+        """
+        slots = list(slots)
+        entities = self.find_entities(constraints, slots)
+        return len(entities), {slot: len({entity[slot] for entity in entities}) for slot in slots}
+
+    def find_entities_batch(self, constraints_list : List[dict],
+                            requested_slots: Iterable = iter(())) -> List[List[dict]]:
+        """ Runs `find_entities` for many sets of constraints.
+
+            Override this function if the data backend can answer many queries at once.
+
+        Args:
+            constraints_list (List[dict]): slot-value mappings of constraints
+            requested_slots (Iterable): slots returned in addition, see `find_entities`
+        """
+        requested_slots = list(requested_slots)
+        return [self.find_entities(constraints, requested_slots) for constraints in constraints_list]
+
+    def count_entities_batch(self, constraints_list : List[dict]) -> List[int]:
+        """ Runs `count_entities` for many sets of constraints.
+
+        Args:
+            constraints_list (List[dict]): slot-value mappings of constraints
+        """
+        return [self.count_entities(constraints) for constraints in constraints_list]
+
     def find_info_about_entity(self, entity_id, requested_slots: Iterable):
         """ Returns the values (stored in the data backend) of the specified slots for the
             specified entity.
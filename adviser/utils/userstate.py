@@ -19,9 +19,10 @@
 
 """ This module provides the UserState class. """
 
-import copy
 from enum import Enum
 
+from utils.cowdict import CowDict
+
 
 class EngagementType(Enum):
     """The type for a user engagement as used in :class:`UserState`."""
@@ -76,8 +77,9 @@ class UserState:
         to ensure the correct history can be accessed correctly by other modules
         """
 
-        # copy last turn's dict
-        self._history.append(copy.deepcopy(self._history[-1]))
+        # the last turn becomes history, the new turn copies its values when they are accessed
+        self._history[-1].freeze()
+        self._history.append(CowDict.share(self._history[-1]))
 
     def _init_userstate(self):
         """Initializes the user state based on the currently active domain
@@ -88,7 +90,7 @@ class UserState:
         """
 
         # TODO: revist when we include probabilites, sets should become dictionaries
-        user_state = {"engagement": EngagementType.Low,
-                      "emotion": EmotionType.Neutral}
+        user_state = CowDict({"engagement": EngagementType.Low,
+                              "emotion": EmotionType.Neutral})
 
         return user_state
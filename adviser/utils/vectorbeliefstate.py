@@ -0,0 +1,327 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+""" This module provides a belief state which stores the inform beliefs in a dense array laid out by the ontology. """
+
+from collections.abc import MutableMapping
+from typing import Dict, List, Union
+
+import numpy as np
+
+from utils.beliefstate import BeliefState
+from utils.cowdict import peek
+from utils.domain.jsonlookupdomain import JSONLookupDomain
+
+# probability of values which were not mentioned, below every threshold
+_UNSET = -np.inf
+
+
+class BeliefLayout(object):
+    """ Position of every (informable slot, value) pair of a domain in the belief array.
+
+        Row i of the array holds the values of the i-th informable slot (sorted by name), column j the j-th
+        possible value of the slot in ontology order followed by `dontcare`. This is the same order as the
+        inform features of `RLPolicy.beliefstate_dict_to_vector`.
+    """
+
+    _layouts = {}  # domain name -> layout
+
+    def __init__(self, domain: JSONLookupDomain):
+        self.domain_name = domain.get_domain_name()
+        self.slots = sorted(domain.get_informable_slots())
+        self.values = [list(domain.get_possible_values(slot)) + ["dontcare"] for slot in self.slots]
+        self.slot_index = {slot: row for row, slot in enumerate(self.slots)}
+        self.value_index = []
+        for values in self.values:
+            index = {}
+            for column, value in enumerate(values):
+                index.setdefault(value, column)  # the first occurence of a value counts
+            self.value_index.append(index)
+        self.width = max((len(values) for values in self.values), default=0)
+        # valid cells of the (slots x width) array, row by row
+        self.mask = np.zeros((len(self.slots), self.width), dtype=bool)
+        for row, values in enumerate(self.values):
+            self.mask[row, :len(values)] = True
+        # feature vector: a **NONE** flag followed by the values, per slot
+        sizes = np.array([len(values) + 1 for values in self.values], dtype=int)
+        self.feature_size = int(sizes.sum())
+        self.none_positions = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(int)
+        self.value_positions = np.flatnonzero(~np.isin(np.arange(self.feature_size), self.none_positions))
+
+    @classmethod
+    def for_domain(cls, domain: JSONLookupDomain) -> 'BeliefLayout':
+        """ Returns the layout of a domain (computed once per domain) """
+        layout = cls._layouts.get(domain.get_domain_name())
+        if layout is None:
+            layout = cls._layouts.setdefault(domain.get_domain_name(), cls(domain))
+        return layout
+
+    def __eq__(self, other):
+        return self is other or (isinstance(other, BeliefLayout) and self.slots == other.slots
+                                 and self.values == other.values)
+
+    def __hash__(self):
+        return hash((self.domain_name, tuple(self.slots)))
+
+    def locate(self, slot: str, value) -> Union[tuple, None]:
+        """ Returns the (row, column) of a slot value, `None` if it is not part of the ontology """
+        row = self.slot_index.get(slot)
+        if row is None:
+            return None
+        column = self.value_index[row].get(value)
+        return None if column is None else (row, column)
+
+
+class _SlotBeliefs(MutableMapping):
+    """ Dictionary view (value -> probability) on the beliefs of one slot in an `InformBeliefs` array,
+        values are listed in the order they were set (like a dictionary)
+    """
+
+    __slots__ = ('informs', 'slot')
+
+    def __init__(self, informs: 'InformBeliefs', slot: str):
+        self.informs = informs
+        self.slot = slot
+
+    def __getitem__(self, value):
+        position = self.informs.layout.locate(self.slot, value)
+        if position is None:
+            return self.informs.extra.get(self.slot, {})[value]
+        probability = self.informs.probs[position]
+        if probability == _UNSET:
+            raise KeyError(value)
+        return float(probability)
+
+    def __setitem__(self, value, probability: float):
+        informs = self.informs
+        position = informs.layout.locate(self.slot, value)
+        if position is None:
+            extra = informs.extra.setdefault(self.slot, {})
+            if value not in extra:
+                informs.extra_order.setdefault(self.slot, {})[value] = informs.next_sequence()
+            extra[value] = probability
+        else:
+            if informs.probs[position] == _UNSET:
+                informs.order[position] = informs.next_sequence()
+            informs.probs[position] = probability
+
+    def __delitem__(self, value):
+        position = self.informs.layout.locate(self.slot, value)
+        if position is None:
+            del self.informs.extra.get(self.slot, {})[value]
+            del self.informs.extra_order[self.slot][value]
+        elif self.informs.probs[position] == _UNSET:
+            raise KeyError(value)
+        else:
+            self.informs.probs[position] = _UNSET
+
+    def __iter__(self):
+        informs = self.informs
+        row = informs.layout.slot_index.get(self.slot)
+        values = []
+        if row is not None:
+            names = informs.layout.values[row]
+            columns = np.flatnonzero(informs.probs[row, :len(names)] != _UNSET)
+            if self.slot not in informs.extra:
+                columns = columns[np.argsort(informs.order[row, columns], kind='stable')]
+                return iter([names[column] for column in columns.tolist()])
+            values = [(sequence, names[column]) for column, sequence
+                      in zip(columns.tolist(), informs.order[row, columns].tolist())]
+        values += [(sequence, value) for value, sequence in informs.extra_order.get(self.slot, {}).items()]
+        return iter([value for _, value in sorted(values, key=lambda item: item[0])])
+
+    def __len__(self):
+        row = self.informs.layout.slot_index.get(self.slot)
+        count = 0 if row is None else int(np.count_nonzero(self.informs.probs[row] != _UNSET))
+        return count + len(self.informs.extra.get(self.slot, ()))
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class InformBeliefs(MutableMapping):
+    """ The inform beliefs of one turn (slot -> value -> probability) stored in a (slots x values) array.
+
+        Can be used like the nested dictionary of a `BeliefState`; `informs[slot]` returns a view on the
+        slot's row. Slots and values which are not part of the ontology are kept in a dictionary next to the
+        array. A second array records when each value was set, so that values are listed and ties between
+        equally probable values are resolved in insertion order, as with dictionaries.
+    """
+
+    def __init__(self, layout: BeliefLayout, beliefs: Dict[str, Dict[str, float]] = None):
+        """
+        Args:
+            layout (BeliefLayout): layout of the domain
+            beliefs (Dict[str, Dict[str, float]]): initial beliefs (slot -> value -> probability)
+        """
+        self.layout = layout
+        self.probs = np.full((len(layout.slots), layout.width), _UNSET)
+        self.present = np.zeros(len(layout.slots), dtype=bool)
+        self.order = np.zeros((len(layout.slots), layout.width), dtype=np.int64)  # insertion sequence of values
+        self.extra = {}  # slot -> value -> probability for slots/values outside of the ontology
+        self.extra_order = {}  # slot -> value -> insertion sequence for values outside of the ontology
+        self._slots = {}  # mentioned slots in insertion order
+        self._sequence = 0
+        for slot, values in (beliefs or {}).items():
+            self[slot] = values
+
+    def copy(self) -> 'InformBeliefs':
+        informs = InformBeliefs.__new__(InformBeliefs)
+        informs.layout = self.layout
+        informs.probs = self.probs.copy()
+        informs.present = self.present.copy()
+        informs.order = self.order.copy()
+        informs.extra = {slot: dict(values) for slot, values in self.extra.items()}
+        informs.extra_order = {slot: dict(values) for slot, values in self.extra_order.items()}
+        informs._slots = dict(self._slots)
+        informs._sequence = self._sequence
+        return informs
+
+    def next_sequence(self) -> int:
+        """ Returns the insertion sequence number for a newly set value """
+        self._sequence += 1
+        return self._sequence
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __getitem__(self, slot: str) -> _SlotBeliefs:
+        if slot not in self._slots:
+            raise KeyError(slot)
+        return _SlotBeliefs(self, slot)
+
+    def __setitem__(self, slot: str, values: Dict[str, float]):
+        values = dict(values.items())  # values may be a view on this slot
+        # a replaced slot keeps its position, like a dictionary key
+        self._clear(slot)
+        self._slots[slot] = None
+        row = self.layout.slot_index.get(slot)
+        if row is not None:
+            self.present[row] = True
+        slot_beliefs = _SlotBeliefs(self, slot)
+        for value, probability in values.items():
+            slot_beliefs[value] = probability
+
+    def __delitem__(self, slot: str):
+        del self._slots[slot]
+        self._clear(slot)
+
+    def _clear(self, slot: str):
+        """ Removes the beliefs of a slot (but not the slot) """
+        row = self.layout.slot_index.get(slot)
+        if row is not None:
+            self.present[row] = False
+            self.probs[row] = _UNSET
+        self.extra.pop(slot, None)
+        self.extra_order.pop(slot, None)
+
+    def __iter__(self):
+        return iter(list(self._slots))
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, slot):
+        return slot in self._slots
+
+    def __repr__(self):
+        return repr({slot: dict(self[slot].items()) for slot in self._slots})
+
+    def most_probable(self, threshold: float, max_results: int) -> Dict[str, Union[str, List[str]]]:
+        """ Returns the at most `max_results` most probable values per slot which reach the threshold
+            (see `BeliefState.get_most_probable_inf_beliefs`), ties go to the value which was set first
+        """
+        rows = np.flatnonzero(self.present)
+        best = {}
+        if len(rows):
+            scores = self.probs[rows]
+            order = self.order[rows]
+            slots, values = self.layout.slots, self.layout.values
+            if max_results == 1:
+                maxima = scores.max(axis=1)
+                ties = scores == maxima[:, None]
+                columns = np.where(ties, order, np.iinfo(order.dtype).max).argmin(axis=1)
+                hits = maxima >= threshold
+                for row, column, hit in zip(rows.tolist(), columns.tolist(), hits.tolist()):
+                    if hit:
+                        best[slots[row]] = values[row][column]
+            else:
+                # sorted by probability, then by insertion
+                ranking = np.lexsort((order, -scores))[:, :max_results]
+                hits = np.take_along_axis(scores, ranking, axis=1) >= threshold
+                for row, columns, row_hits in zip(rows.tolist(), ranking, hits):
+                    if row_hits.any():
+                        best[slots[row]] = [values[row][column] for column in columns[row_hits].tolist()]
+
+        candidates = {}
+        for slot in self._slots:
+            if slot in self.extra:
+                # slot has values outside of the ontology: sort its beliefs in python
+                slot_cands = sorted(self[slot].items(), key=lambda kv: kv[1], reverse=True)[:max_results]
+                slot_cands = [value for value, probability in slot_cands if probability >= threshold]
+                if slot_cands:
+                    candidates[slot] = slot_cands[0] if max_results == 1 else slot_cands
+            elif slot in best:
+                candidates[slot] = best[slot]
+        return candidates
+
+    def features(self) -> np.ndarray:
+        """ Returns the inform features of `RLPolicy.beliefstate_dict_to_vector`: per slot of the layout a
+            **NONE** flag (slot not mentioned) followed by the probabilities of its values (0 if not mentioned)
+        """
+        features = np.zeros(self.layout.feature_size)
+        features[self.layout.none_positions] = ~self.present
+        features[self.layout.value_positions] = np.maximum(self.probs[self.layout.mask], 0.0)
+        return features
+
+
+class VectorBeliefState(BeliefState):
+    """
+    Belief state which stores the inform beliefs of each turn in a dense array (see `InformBeliefs`) laid out
+    by the domain ontology. It is used like a `BeliefState`, `beliefstate['informs']` is a dictionary view on
+    the array.
+
+    Picking the most probable value per slot and the featurization of `RLPolicy` are computed on the whole
+    array instead of sorting the beliefs of every slot.
+    """
+
+    def __init__(self, domain: JSONLookupDomain):
+        self.layout = BeliefLayout.for_domain(domain)
+        BeliefState.__init__(self, domain)
+
+    def __setitem__(self, key, val):
+        if key == "informs" and not isinstance(val, InformBeliefs):
+            val = InformBeliefs(self.layout, val)
+        BeliefState.__setitem__(self, key, val)
+
+    def _init_beliefstate(self):
+        belief_state = BeliefState._init_beliefstate(self)
+        belief_state["informs"] = InformBeliefs(self.layout)
+        return belief_state
+
+    def start_new_turn(self):
+        BeliefState.start_new_turn(self)
+        # the array is copied as a whole instead of on first access
+        self._history[-1]["informs"] = peek(self._history[-2], "informs").copy()
+
+    def _most_probable_inf_beliefs(self, threshold: float, max_results: int, turn_idx: int):
+        informs = peek(self._history[turn_idx], "informs")
+        if isinstance(informs, InformBeliefs):
+            return informs.most_probable(threshold, max_results)
+        return BeliefState._most_probable_inf_beliefs(self, threshold, max_results, turn_idx)